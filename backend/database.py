@@ -0,0 +1,186 @@
+"""MongoDB access layer: one Motor client configured from the environment.
+
+Routes get their database handle by route class:
+
+* ``primary``: the default. Reads see writes made just before them.
+* ``listing``: read-heavy listings (debates, comments, photos,
+  participants) with ``MONGO_LISTING_READ_PREFERENCE``. Secondaries lag,
+  and a lagging listing can be cached until the next write to its
+  collection. The default therefore stays ``primary``.
+* ``votes``: vote writes with ``MONGO_VOTE_WRITE_CONCERN`` (default
+  ``majority``).
+
+Pool options are passed to the driver only when their variable is set,
+so options in ``MONGO_URL`` keep working. ``PoolMonitor`` counts
+connection pool events per server for the diagnostics endpoint.
+"""
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+from pymongo.write_concern import WriteConcern
+
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Env var -> (driver option, parser)
+_CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need their python packages
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_APP_NAME": ("appname", str),
+}
+
+
+def parse_write_concern(value: str, wtimeout_ms: Optional[int] = None) -> WriteConcern:
+    """"majority", a tag set name or a node count."""
+    return WriteConcern(w=int(value) if value.isdigit() else value, wtimeout=wtimeout_ms)
+
+
+def parse_read_preference(mode: str, max_staleness: int = -1):
+    if mode not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}, expected one of {', '.join(_READ_PREFERENCES)}")
+    if mode == "primary":
+        return Primary()
+    return _READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+@dataclass
+class DatabaseSettings:
+    url: str
+    name: str
+    client_options: Dict[str, object] = field(default_factory=dict)
+    listing_read_preference: object = field(default_factory=Primary)
+    vote_write_concern: WriteConcern = field(default_factory=lambda: WriteConcern(w="majority"))
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "DatabaseSettings":
+        options = {
+            option: parse(environ[name])
+            for name, (option, parse) in _CLIENT_OPTIONS.items() if environ.get(name)
+        }
+        wtimeout = environ.get("MONGO_VOTE_WTIMEOUT_MS")
+        return cls(
+            url=environ["MONGO_URL"],
+            name=environ["DB_NAME"],
+            client_options=options,
+            listing_read_preference=parse_read_preference(
+                environ.get("MONGO_LISTING_READ_PREFERENCE", "primary"),
+                int(environ.get("MONGO_LISTING_MAX_STALENESS_SECONDS", "-1")),
+            ),
+            vote_write_concern=parse_write_concern(
+                environ.get("MONGO_VOTE_WRITE_CONCERN", "majority"), int(wtimeout) if wtimeout else None
+            ),
+        )
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Per-server connection pool gauges and counters; events arrive on driver threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+            "open": 0, "checked_out": 0, "waiting": 0, "created": 0, "closed": 0,
+            "checkouts": 0, "checkout_failures": 0, "cleared": 0,
+        })
+
+    def _count(self, event, **deltas):
+        address = "%s:%s" % event.address
+        with self._lock:
+            server = self._servers[address]
+            for key, delta in deltas.items():
+                server[key] += delta
+
+    def pool_created(self, event):
+        self._count(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count(event, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count(event, created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count(event, closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._count(event, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._count(event, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._count(event, waiting=-1, checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._count(event, checked_out=-1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            servers = {address: dict(counts) for address, counts in self._servers.items()}
+        totals = defaultdict(int)
+        for counts in servers.values():
+            for key, value in counts.items():
+                totals[key] += value
+        return {"servers": servers, "totals": dict(totals)}
+
+
+class Database:
+    def __init__(
+        self,
+        settings: DatabaseSettings,
+        event_listeners: Iterable = (),
+        client_factory: Callable[..., AsyncIOMotorClient] = AsyncIOMotorClient,
+    ):
+        self.settings = settings
+        self.pool = PoolMonitor()
+        self.client = client_factory(
+            settings.url, event_listeners=[*event_listeners, self.pool], **settings.client_options
+        )
+        self.primary = self.client[settings.name]
+        self.listing = self.client.get_database(settings.name, read_preference=settings.listing_read_preference)
+        self.votes = self.client.get_database(settings.name, write_concern=settings.vote_write_concern)
+
+    def close(self):
+        self.client.close()
+
+    def stats(self) -> dict:
+        return {
+            "database": self.settings.name,
+            "client_options": self.settings.client_options,
+            "listing_read_preference": self.settings.listing_read_preference.document,
+            "vote_write_concern": self.settings.vote_write_concern.document,
+            "pool": self.pool.stats(),
+        }
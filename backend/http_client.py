@@ -0,0 +1,231 @@
+"""Shared outbound HTTP client.
+
+One pooled ``aiohttp.ClientSession`` per process (keep-alive, DNS cache),
+per-call timeouts, retries limited by a retry budget, and a per-host
+circuit breaker so a failing upstream is not hammered by every request.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from tracing import Tracer, outbound_span
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {502, 503, 504}
+# Retried by default; anything else (POST, PATCH) only when the caller passes ``retries``
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+@dataclass
+class HttpResult:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class RetryBudget:
+    """Every request earns ``ratio`` retry tokens; every retry spends one."""
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    failures: int = 0
+    opened_at: Optional[float] = None
+    half_open_in_flight: bool = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.half_open_in_flight:
+            # Let exactly one probe through
+            self.half_open_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.half_open_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The half-open probe ended without an answer either way (e.g. cancelled); allow another."""
+        self.half_open_in_flight = False
+
+
+class HttpClient:
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        dns_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+        timeout: float = 10.0,
+        retries: int = 2,
+        retry_budget: Optional[RetryBudget] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.tracer = tracer
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self._breakers[host]
+
+    async def request(self, method: str, url: str, **kwargs) -> HttpResult:
+        """Send a request and read the whole body.
+
+        Connection errors, timeouts and 502/503/504 are retried with jittered
+        backoff while the retry budget allows; other statuses are returned as is.
+        Non-idempotent methods are not retried unless ``retries`` is given, since
+        a timed out POST may still have been processed.
+        Under a traced request the call gets a client span and a traceparent header.
+        """
+        span = outbound_span(self.tracer, method, url)
+        if span is None:
+            return await self._request(method, url, **kwargs)
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "traceparent": span.traceparent()}
+        try:
+            result = await self._request(method, url, **kwargs)
+            span.attributes["http.status_code"] = result.status
+            if result.status >= 500:
+                span.error = f"HTTP {result.status}"
+            return result
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.tracer.end_span(span)
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> HttpResult:
+        if self._session is None:
+            raise RuntimeError("HttpClient.start() has not been called")
+        breaker = self.breaker(url)
+        if retries is None:
+            retries = self.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        if timeout:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+            try:
+                async with self._session.request(method, url, **kwargs) as response:
+                    result = HttpResult(response.status, dict(response.headers), await response.read())
+                if result.status not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return result
+                breaker.record_failure()
+                error: Optional[Exception] = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                breaker.record_failure()
+                result, error = None, e
+            except Exception:
+                # Payload errors, bad URLs and the like: count them, but do not retry
+                breaker.record_failure()
+                raise
+            finally:
+                # Cancellation skips every record_*; never leave the half-open probe taken
+                breaker.release_probe()
+
+            if attempt >= retries or not self.retry_budget.withdraw():
+                if error:
+                    raise error
+                return result
+            attempt += 1
+            await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    def stats(self) -> dict:
+        return {
+            "retry_tokens": round(self.retry_budget.tokens, 2),
+            "breakers": {
+                host: {"state": breaker.state, "failures": breaker.failures}
+                for host, breaker in self._breakers.items()
+            },
+        }
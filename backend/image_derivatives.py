@@ -0,0 +1,148 @@
+"""Resized WebP/JPEG renditions and a tiny placeholder for uploaded photos.
+
+Decoding and resizing run in a ProcessPoolExecutor so neither the event loop
+nor the GIL is held while images are processed. Its processes come from a
+forkserver (spawn where there is none): by the time the pool starts, Motor
+and aiohttp threads are running, and a plain fork could copy one of their
+locks in its held state into the child. ``python image_derivatives.py``
+backfills renditions for photos that were uploaded before this existed.
+"""
+import asyncio
+import base64
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps
+
+from storage_backends import storage_from_env
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+PLACEHOLDER_WIDTH = 16
+QUALITY = 80
+
+
+def generate_derivatives(source_path: str, output_dir: str, stem: str) -> Dict:
+    """Write every rendition of ``source_path`` into ``output_dir`` (runs in a worker process)."""
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    renditions = []
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    # Never upscale; the smallest rendition is produced even for tiny originals
+    widths = [w for w in RENDITION_WIDTHS if w < image.width] or [image.width]
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for extension, (pil_format, content_type) in RENDITION_FORMATS.items():
+            filename = f"{stem}_{width}.{extension}"
+            resized.save(output / filename, pil_format, quality=QUALITY, optimize=True)
+            renditions.append({
+                "width": width,
+                "height": height,
+                "content_type": content_type,
+                "filename": filename,
+            })
+
+    placeholder = image.resize(
+        (PLACEHOLDER_WIDTH, max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))),
+        Image.BILINEAR,
+    )
+    buffer = io.BytesIO()
+    placeholder.save(buffer, "JPEG", quality=40)
+    return {
+        "renditions": renditions,
+        "placeholder": "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def remove_derivatives(output_dir: Path, renditions: List[Dict]):
+    for rendition in renditions:
+        try:
+            os.remove(output_dir / rendition["filename"])
+        except FileNotFoundError:
+            pass
+
+
+class DerivativeGenerator:
+    def __init__(self, output_dir: Path, max_workers: Optional[int] = None):
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context(method)
+        )
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def generate(self, source_path: Path, stem: str) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, generate_derivatives, str(source_path), str(self.output_dir), stem
+        )
+
+    async def generate_for_photo(self, db, storage, photo: Dict) -> bool:
+        """Generate renditions for a photo document, store them and record them on it."""
+        try:
+            async with storage.local_copy(f"photos/{photo['filename']}") as source:
+                result = await self.generate(source, Path(photo["filename"]).stem)
+            for rendition in result["renditions"]:
+                await storage.store_file(
+                    f"renditions/{rendition['filename']}",
+                    self.output_dir / rendition["filename"],
+                    rendition["content_type"],
+                )
+        except Exception as e:
+            logger.error(f"Rendition generation failed for photo {photo['id']}: {str(e)}")
+            return False
+        await db.photos.update_one({"id": photo["id"]}, {"$set": result})
+        return True
+
+
+async def _backfill():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    root = Path(__file__).parent
+    load_dotenv(root / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    storage = storage_from_env(root / "uploads")
+    generator = DerivativeGenerator(root / "uploads" / "renditions")
+    generator.start()
+    results = []
+    try:
+        missing = {"$or": [{"renditions": {"$exists": False}}, {"renditions": []}]}
+        batch = []
+        # Keep every pool process busy instead of converting one photo at a time
+        async for photo in db.photos.find(missing, {"_id": 0}):
+            batch.append(generator.generate_for_photo(db, storage, photo))
+            if len(batch) >= (os.cpu_count() or 1):
+                results += await asyncio.gather(*batch)
+                batch = []
+        results += await asyncio.gather(*batch)
+    finally:
+        generator.close()
+        client.close()
+    failed = results.count(False)
+    print(f"Renditions generated for {len(results) - failed} photos, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(_backfill()))
@@ -0,0 +1,273 @@
+"""MongoDB index declarations and the unindexed-query report for server.py.
+
+A unique index that cannot be built (duplicates, conflicting options) stops
+startup: the routes rely on it instead of checking first. Duplicates from
+before such an index existed (votes, users by email, push subscriptions by
+endpoint) are removed before it is built.
+
+Run ``python indexes.py`` from the backend directory to build the indexes and
+print the report without starting the API.
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Collection -> indexes. Names are fixed so the bootstrap stays idempotent.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "debates": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="status_created_at_id",
+        ),
+        # Lifecycle scheduler: upcoming debates by start, active ones by end
+        IndexModel([("status", ASCENDING), ("start_time", ASCENDING)], name="status_start_time"),
+        IndexModel([("status", ASCENDING), ("end_time", ASCENDING)], name="status_end_time"),
+    ],
+    "votes": [
+        IndexModel(
+            [("debate_id", ASCENDING), ("voter_name", ASCENDING)],
+            name="debate_voter_unique",
+            unique=True,
+        ),
+    ],
+    "comments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("debate_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="debate_created_at_id",
+        ),
+    ],
+    "sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # Mongo drops the session as soon as expires_at is in the past
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "push_subscriptions": [
+        IndexModel([("endpoint", ASCENDING)], name="endpoint_unique", unique=True),
+    ],
+    "participants": [
+        # Enforces one join per name; the join itself relies on it instead of a read
+        IndexModel(
+            [("debate_id", ASCENDING), ("participant_name", ASCENDING)],
+            name="debate_participant_unique",
+            unique=True,
+        ),
+        IndexModel(
+            [("debate_id", ASCENDING), ("joined_at", DESCENDING), ("id", DESCENDING)],
+            name="debate_joined_at_id",
+        ),
+    ],
+    "photos": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("uploaded_at", DESCENDING), ("id", DESCENDING)], name="uploaded_at_id"),
+        IndexModel([("content_hash", ASCENDING)], name="content_hash"),
+    ],
+    "photo_blobs": [
+        IndexModel([("content_hash", ASCENDING)], name="content_hash_unique", unique=True),
+    ],
+}
+
+class IndexBuildError(Exception):
+    """A unique index could not be built."""
+
+
+async def _duplicate_groups(collection, fields: List[str], sort: Dict[str, int]):
+    """Yield (key, ids) for every value of ``fields`` held by more than one document, ids in ``sort`` order."""
+    pipeline = [
+        {"$sort": {**sort, "_id": 1}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in fields},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        yield group["_id"], group["ids"]
+
+
+async def dedupe_votes(db) -> int:
+    """Keep each voter's earliest vote per debate so the unique index can build, then recount those debates."""
+    removed = 0
+    debate_ids = set()
+    async for key, ids in _duplicate_groups(db.votes, ["debate_id", "voter_name"], {"created_at": 1}):
+        result = await db.votes.delete_many({"_id": {"$in": ids[1:]}})
+        removed += result.deleted_count
+        debate_ids.add(key["debate_id"])
+    for debate_id in debate_ids:
+        counts = {
+            counter: await db.votes.count_documents({"debate_id": debate_id, "vote_type": vote_type})
+            for counter, vote_type in (("votes_for", "for"), ("votes_against", "against"))
+        }
+        await db.debates.update_one({"id": debate_id}, {"$set": counts})
+    if removed:
+        logger.warning(f"Removed {removed} duplicate votes and recounted {len(debate_ids)} debates")
+    return removed
+
+
+async def dedupe_users(db) -> int:
+    """Keep the earliest user per email and move the sessions of the others onto it."""
+    removed = 0
+    async for _, ids in _duplicate_groups(db.users, ["email"], {"created_at": 1}):
+        users = {user["_id"]: user["id"] async for user in db.users.find({"_id": {"$in": ids}}, {"id": 1})}
+        kept = users[ids[0]]
+        await db.sessions.update_many(
+            {"user_id": {"$in": [users[_id] for _id in ids[1:]]}}, {"$set": {"user_id": kept}}
+        )
+        result = await db.users.delete_many({"_id": {"$in": ids[1:]}})
+        removed += result.deleted_count
+    if removed:
+        logger.warning(f"Removed {removed} duplicate users")
+    return removed
+
+
+async def dedupe_push_subscriptions(db) -> int:
+    """Keep the newest subscription per endpoint; older ones carry keys the browser has replaced."""
+    removed = 0
+    async for _, ids in _duplicate_groups(db.push_subscriptions, ["endpoint"], {"created_at": -1}):
+        result = await db.push_subscriptions.delete_many({"_id": {"$in": ids[1:]}})
+        removed += result.deleted_count
+    if removed:
+        logger.warning(f"Removed {removed} duplicate push subscriptions")
+    return removed
+
+
+# Index name -> cleanup that has to run before that index is first built
+PRE_BUILD: Dict[Tuple[str, str], Callable[[Any], Awaitable[Any]]] = {
+    ("votes", "debate_voter_unique"): dedupe_votes,
+    ("users", "email_unique"): dedupe_users,
+    ("push_subscriptions", "endpoint_unique"): dedupe_push_subscriptions,
+}
+
+# Every filter/sort shape server.py sends to Mongo. Values are placeholders,
+# only the shape matters to the query planner.
+QUERY_SHAPES: List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("debates", {"id": ""}, None),
+    ("debates", {}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("debates", {"status": ""}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("debates", {"status": "upcoming", "start_time": {"$lte": 0}}, None),
+    ("debates", {"status": "active", "end_time": {"$lte": 0}}, None),
+    # Lifecycle reload and transition CAS
+    ("debates", {"$or": [
+        {"status": "upcoming", "start_time": {"$lte": 0}},
+        {"status": "active", "end_time": {"$lte": 0}},
+    ]}, None),
+    ("debates", {"id": "", "status": "", "start_time": {"$lte": 0}}, None),
+    ("votes", {"debate_id": "", "voter_name": ""}, None),
+    ("comments", {"debate_id": ""}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("sessions", {"session_token": ""}, None),
+    ("sessions", {"user_id": ""}, None),
+    ("users", {"id": ""}, None),
+    ("users", {"email": ""}, None),
+    ("participants", {"debate_id": ""}, [("joined_at", DESCENDING), ("id", DESCENDING)]),
+    ("participants", {"debate_id": ""}, None),
+    ("push_subscriptions", {"endpoint": ""}, None),
+    ("photos", {}, [("uploaded_at", DESCENDING), ("id", DESCENDING)]),
+    ("photos", {"id": ""}, None),
+    ("photos", {"content_hash": ""}, None),
+    # Renditions already made for the same bytes
+    ("photos", {"content_hash": "", "filename": "", "renditions.0": {"$exists": True}}, None),
+    ("photo_blobs", {"content_hash": ""}, None),
+    ("photo_blobs", {"content_hash": "", "deleting": {"$exists": False}}, None),
+    ("photo_blobs", {"content_hash": "", "filename": "", "deleting": {"$exists": False}}, None),
+    ("cache_versions", {"_id": {"$in": []}}, None),
+    # Vote buffer recount of a replayed batch
+    ("votes", {"flush_batch": "", "debate_id": ""}, None),
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every declared index; raises IndexBuildError if a unique one fails.
+
+    Failures of plain indexes are only logged: queries still work, just slower.
+    """
+    created = {}
+    failed_unique = []
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        created[collection] = []
+        for model in models:
+            name = model.document["name"]
+            if name not in existing and (collection, name) in PRE_BUILD:
+                await PRE_BUILD[collection, name](db)
+            try:
+                created[collection] += await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                logger.error(f"Creating index {collection}.{name} failed: {str(e)}")
+                if model.document.get("unique"):
+                    failed_unique.append(f"{collection}.{name}")
+    if failed_unique:
+        raise IndexBuildError(f"Unique indexes could not be built: {', '.join(failed_unique)}")
+    return created
+
+
+def plan_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def explain_query(db, collection: str, filter: Dict[str, Any], sort=None) -> Dict[str, Any]:
+    """Explain one query shape and say whether the winning plan scans the collection."""
+    find = {"find": collection, "filter": filter, "limit": 1}
+    if sort:
+        find["sort"] = dict(sort)
+    explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+    stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    return {
+        "collection": collection,
+        "filter": sorted(filter.keys()),
+        "sort": [key for key, _ in sort] if sort else [],
+        "stages": stages,
+        "indexed": "COLLSCAN" not in stages,
+    }
+
+
+async def unindexed_query_report(db) -> List[Dict[str, Any]]:
+    """Explain every shape in QUERY_SHAPES."""
+    return [await explain_query(db, collection, filter, sort) for collection, filter, sort in QUERY_SHAPES]
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        await ensure_indexes(db)
+        report = await unindexed_query_report(db)
+    finally:
+        client.close()
+
+    missing = [entry for entry in report if not entry["indexed"]]
+    for entry in report:
+        flag = "OK  " if entry["indexed"] else "SCAN"
+        print(f"{flag} {entry['collection']:<20} filter={entry['filter']} sort={entry['sort']} {entry['stages']}")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,377 @@
+"""Cross-worker cache invalidation from MongoDB change streams.
+
+Every worker keeps in-process caches (listing responses, sessions, the
+search index), so a write handled by one uvicorn worker must reach the
+others. The hub opens a single database-level change stream filtered to the
+watched collections and hands each change to the handlers registered for
+its collection. Updates arrive without a post-image. Only updates touching
+one of a collection's ``lookup_fields`` (say a debate's title, not its vote
+counters) are followed by a read of the document, before handlers see them.
+The resume token is kept after every event. When the stream
+breaks (stepdown, network), it reopens where it left off. If the oplog has
+moved past the token, every handler gets a collection-wide ``ANY`` event
+instead of a silent gap. The stream is open before ``start`` returns, so
+caches that load afterwards cannot miss a write.
+
+Change streams need a replica set. On a standalone server the hub falls
+back to polling a ``cache_versions`` collection. ``WriteVersionBumper``
+watches this worker's own write commands and bumps the version of every
+collection they touch, at most once per poll interval per collection.
+Updates that only touch fields other workers learn about some other way
+(vote counters) are left out. Every worker polls the versions and sends
+``ANY`` to the handlers of any collection whose version moved. Versions the
+worker bumped itself are skipped, since it already applied its own writes
+locally.
+
+To try it against a local single-node replica set::
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017 &
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL='mongodb://localhost:27017/?replicaSet=rs0' DB_NAME=debate python invalidation.py
+
+then write to the watched collections from another shell and watch the events print.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("debates", "votes", "comments", "participants", "photos", "sessions")
+VERSIONS_COLLECTION = "cache_versions"
+# Anything in the collection may have changed (polling, or change history lost)
+ANY = "any"
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+# "$changeStream is only supported on replica sets", and the pre-3.6 unknown stage error
+_UNSUPPORTED_CODES = {40573, 40324}
+# ChangeStreamHistoryLost, ChangeStreamFatalError: the resume token is no good any more
+_HISTORY_LOST_CODES = {286, 280}
+
+
+@dataclass
+class Change:
+    collection: str
+    operation: str
+    document_key: Optional[Dict] = None
+    # Post-image for inserts, replaces and updates that touched a lookup field
+    document: Optional[Dict] = field(default=None, repr=False)
+    # Top-level fields set or removed by an update
+    updated_fields: Optional[FrozenSet[str]] = None
+    # updateDescription.updatedFields: the new values, e.g. a counter after its $inc
+    updates: Optional[Dict] = field(default=None, repr=False)
+
+
+Handler = Callable[[Change], None]
+
+
+class InvalidationHub:
+    def __init__(
+        self,
+        db,
+        collections: Iterable[str] = WATCHED_COLLECTIONS,
+        mode: str = "auto",
+        poll_interval: float = 2.0,
+        retry_delay: float = 1.0,
+        lookup_fields: Optional[Dict[str, Iterable[str]]] = None,
+    ):
+        self.db = db
+        self.collections = tuple(collections)
+        # collection -> fields whose update makes the hub read the new document
+        self.lookup_fields = {name: frozenset(fields) for name, fields in (lookup_fields or {}).items()}
+        self.requested_mode = mode
+        self.mode: Optional[str] = None
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.resume_token = None
+        self._handlers: Dict[str, List[Handler]] = {name: [] for name in self.collections}
+        self._stream = None
+        self._task: Optional[asyncio.Task] = None
+        self._versions: Dict[str, int] = {}
+        # collection -> versions this worker's own bumps produced and its poll has not passed yet
+        self._own_versions: Dict[str, Set[int]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dirty: set = set()
+        self._bump_task: Optional[asyncio.Task] = None
+        self._next_bump = 0.0
+        self.events = 0
+        self.reconnects = 0
+        self.resets = 0
+        self.lookups = 0
+
+    def subscribe(self, collections: Iterable[str], handler: Handler):
+        for name in collections:
+            self._handlers[name].append(handler)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.mode = "polling" if self.requested_mode == "polling" else "change_stream"
+        if self.mode == "change_stream":
+            try:
+                await self._open()
+            except OperationFailure as e:
+                if self.requested_mode == "change_stream" or e.code not in _UNSUPPORTED_CODES:
+                    raise
+                logger.warning(f"Change streams unavailable ({e.code}), polling {VERSIONS_COLLECTION} instead")
+                self.mode = "polling"
+        if self.mode == "polling":
+            await self._poll(initial=True)
+            self._task = asyncio.create_task(self._run_polling())
+        else:
+            self._task = asyncio.create_task(self._run_stream())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._bump_task:
+            self._bump_task.cancel()
+            self._bump_task = None
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            await self._write_versions(dirty)
+        await self._close_stream()
+
+    # Change stream mode
+    async def _open(self):
+        pipeline = [{"$match": {"$or": [
+            {"ns.coll": {"$in": list(self.collections)}},
+            {"operationType": {"$in": ["dropDatabase", "invalidate"]}},
+        ]}}]
+        self._stream = self.db.watch(pipeline, resume_after=self.resume_token)
+        # try_next opens the cursor now, so start() returns with the stream in place
+        change = await self._stream.try_next()
+        self.resume_token = self._stream.resume_token
+        if change is not None:
+            await self._dispatch_change(change)
+
+    async def _close_stream(self):
+        if self._stream is not None:
+            stream, self._stream = self._stream, None
+            try:
+                await stream.close()
+            except PyMongoError:
+                pass
+
+    async def _run_stream(self):
+        while True:
+            try:
+                if self._stream is None:
+                    await self._open()
+                while True:
+                    change = await self._stream.next()
+                    self.resume_token = self._stream.resume_token
+                    await self._dispatch_change(change)
+                    if change["operationType"] == "invalidate":
+                        # The stream is closed for good after this event; start a fresh one
+                        self.resume_token = None
+                        await self._close_stream()
+                        break
+            except asyncio.CancelledError:
+                raise
+            except StopAsyncIteration:
+                await self._close_stream()
+            except OperationFailure as e:
+                await self._close_stream()
+                if e.code in _HISTORY_LOST_CODES:
+                    logger.error(f"Change stream history lost, invalidating every cache: {str(e)}")
+                    self.resume_token = None
+                    self._reset_all()
+                else:
+                    logger.error(f"Change stream failed, resuming: {str(e)}")
+                    self.reconnects += 1
+                    await asyncio.sleep(self.retry_delay)
+            except PyMongoError as e:
+                await self._close_stream()
+                logger.error(f"Change stream failed, resuming: {str(e)}")
+                self.reconnects += 1
+                await asyncio.sleep(self.retry_delay)
+
+    async def _dispatch_change(self, change: Dict):
+        operation = change["operationType"]
+        collection = change.get("ns", {}).get("coll")
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            # The collection went away under the caches; treat it like lost history
+            if collection in self._handlers:
+                self._publish(Change(collection, ANY))
+            else:
+                self._reset_all()
+            return
+        document_key = change.get("documentKey")
+        document = change.get("fullDocument")
+        updated_fields = updates = None
+        if operation == "update":
+            description = change.get("updateDescription", {})
+            updates = description.get("updatedFields", {})
+            updated_fields = frozenset(
+                name.split(".", 1)[0]
+                for name in [*description.get("updatedFields", {}), *description.get("removedFields", [])]
+            )
+            if updated_fields & self.lookup_fields.get(collection, frozenset()):
+                # Read it here rather than with updateLookup, which would also read after every vote count $inc
+                self.lookups += 1
+                document = await self.db[collection].find_one(document_key)
+        self._publish(Change(collection, operation, document_key, document, updated_fields, updates))
+
+    # Polling mode
+    async def _run_polling(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except PyMongoError as e:
+                logger.error(f"Cache version poll failed: {str(e)}")
+
+    async def _poll(self, initial: bool = False):
+        async for entry in self.db[VERSIONS_COLLECTION].find({"_id": {"$in": list(self.collections)}}):
+            name, version = entry["_id"], entry.get("version", 0)
+            known = self._versions.get(name, 0)
+            own = self._own_versions.get(name, set())
+            if not initial and version != known:
+                # Only bumps from other workers mean writes this worker has not seen
+                if version < known or any(v not in own for v in range(known + 1, version + 1)):
+                    self._publish(Change(name, ANY))
+            self._versions[name] = version
+            self._own_versions[name] = {v for v in own if v > version}
+
+    def mark_written(self, collection: str):
+        """A write from this worker touched ``collection``; safe to call from driver threads."""
+        if self.mode != "polling" or collection not in self._handlers or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._schedule_bump, collection)
+
+    def _schedule_bump(self, collection: str):
+        self._dirty.add(collection)
+        if self._bump_task is None:
+            self._bump_task = self._loop.create_task(self._bump())
+
+    async def _bump(self):
+        # The first write goes out on the next loop tick; later ones wait out the poll interval,
+        # which is as often as other workers look anyway
+        try:
+            await asyncio.sleep(max(0.0, self._next_bump - time.monotonic()))
+            self._next_bump = time.monotonic() + self.poll_interval
+            dirty, self._dirty = self._dirty, set()
+            await self._write_versions(dirty)
+        finally:
+            self._bump_task = None
+        if self._dirty:
+            self._bump_task = self._loop.create_task(self._bump())
+
+    async def _write_versions(self, collections: Iterable[str]):
+        for collection in collections:
+            try:
+                entry = await self.db[VERSIONS_COLLECTION].find_one_and_update(
+                    {"_id": collection}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+                )
+                self._own_versions.setdefault(collection, set()).add(entry["version"])
+            except PyMongoError as e:
+                logger.error(f"Bumping cache version of {collection} failed: {str(e)}")
+
+    # Delivery
+    def _publish(self, change: Change):
+        self.events += 1
+        for handler in self._handlers.get(change.collection, ()):
+            try:
+                handler(change)
+            except Exception as e:
+                logger.error(f"Invalidation handler failed for {change.collection}: {str(e)}")
+
+    def _reset_all(self):
+        self.resets += 1
+        for name in self.collections:
+            self._publish(Change(name, ANY))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "collections": list(self.collections),
+            "events": self.events,
+            "reconnects": self.reconnects,
+            "resets": self.resets,
+            "lookups": self.lookups,
+            "resumable": self.resume_token is not None,
+        }
+
+
+class WriteVersionBumper(monitoring.CommandListener):
+    """Feeds this worker's successful write commands to ``InvalidationHub.mark_written``.
+
+    Writes to ``ignore`` collections are skipped: use it for collections whose
+    writes are always followed by one to another collection with the same handlers.
+    Updates to a collection in ``ignore_fields`` that only touch the listed
+    top-level fields are skipped too.
+    """
+
+    def __init__(self, ignore: Iterable[str] = (), ignore_fields: Optional[Dict[str, Iterable[str]]] = None):
+        self.hub: Optional[InvalidationHub] = None
+        self.ignore = frozenset(ignore)
+        self.ignore_fields = {name: frozenset(fields) for name, fields in (ignore_fields or {}).items()}
+        self._writes: Dict[tuple, str] = {}
+
+    def started(self, event):
+        if self.hub is not None and event.command_name in WRITE_COMMANDS:
+            target = event.command.get(event.command_name)
+            if isinstance(target, str) and target not in self.ignore and not self._ignored_update(target, event):
+                self._writes[(event.connection_id, event.request_id)] = target
+
+    def _ignored_update(self, target: str, event) -> bool:
+        fields = self.ignore_fields.get(target)
+        if not fields:
+            return False
+        if event.command_name == "update":
+            documents = [statement.get("u") for statement in event.command.get("updates", [])]
+        elif event.command_name == "findAndModify" and not event.command.get("remove"):
+            documents = [event.command.get("update")]
+        else:
+            return False
+        return bool(documents) and all(_updated_fields(document) <= fields for document in documents)
+
+    def succeeded(self, event):
+        collection = self._writes.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            self.hub.mark_written(collection)
+
+    def failed(self, event):
+        self._writes.pop((event.connection_id, event.request_id), None)
+
+
+def _updated_fields(update) -> FrozenSet[str]:
+    """Top-level fields an update document changes; pipelines and replacements count as every field."""
+    if not isinstance(update, dict) or not update or not all(key.startswith("$") for key in update):
+        return frozenset({"*"})
+    return frozenset(name.split(".", 1)[0] for operation in update.values() for name in operation)
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    hub = InvalidationHub(client[os.environ["DB_NAME"]], mode=os.environ.get("INVALIDATION_MODE", "auto"))
+    hub.subscribe(hub.collections, lambda change: print(change, flush=True))
+    await hub.start()
+    print(f"Listening in {hub.mode} mode, Ctrl-C to stop", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await hub.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,185 @@
+"""Moves debates through upcoming -> active -> completed at start_time/end_time.
+
+Pending transitions are kept in a heap ordered by due time. The heap is
+rebuilt from Mongo every ``refresh_interval``, and the window loaded covers
+two intervals so nothing slips between rebuilds. Local creates and edits
+are pushed in immediately with ``schedule``. Each debate has a current
+generation, and only its heap entry with that generation fires. An edit or
+a reload therefore replaces older entries instead of adding a second one.
+Every worker runs a scheduler; each transition is a compare-and-set on the
+current status, so exactly one worker wins it. Only the winner gets the
+callback. Other workers learn about the status change the way they learn
+about any other write, through the InvalidationHub.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+UPCOMING = "upcoming"
+ACTIVE = "active"
+COMPLETED = "completed"
+
+# (debate, old_status, new_status) -> None, called by the worker that made the transition
+TransitionCallback = Callable[[dict, str, str], Awaitable[None]]
+# (due, debate_id, from_status, generation)
+Entry = Tuple[datetime, str, str, int]
+
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC, the form Mongo hands back."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class LifecycleScheduler:
+    def __init__(self, db, on_transition: TransitionCallback, refresh_interval: float = 60.0):
+        self.db = db
+        self.on_transition = on_transition
+        self.refresh_interval = refresh_interval
+        self._heap: List[Entry] = []
+        # debate id -> generation of its live heap entry; any other entry for it is stale
+        self._generations: Dict[str, int] = {}
+        self._next_generation = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.transitions = 0
+        self.lost = 0
+
+    async def start(self):
+        await self.reload()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, debate: dict):
+        """Queue the next transition of a debate that was just created or edited here, replacing any queued one."""
+        entry = self._next_entry(debate)
+        if entry:
+            heapq.heappush(self._heap, entry)
+            self._wakeup.set()
+
+    def _next_entry(self, debate: dict) -> Optional[Entry]:
+        """Entry for the debate's next transition; makes every older entry for it stale."""
+        if debate["status"] == UPCOMING:
+            due, from_status = debate["start_time"], UPCOMING
+        elif debate["status"] == ACTIVE:
+            due, from_status = debate["end_time"], ACTIVE
+        else:
+            self._generations.pop(debate["id"], None)
+            return None
+        generation = next(self._next_generation)
+        self._generations[debate["id"]] = generation
+        return _utc(due), debate["id"], from_status, generation
+
+    def _is_live(self, entry: Entry) -> bool:
+        return self._generations.get(entry[1]) == entry[3]
+
+    async def reload(self):
+        """Rebuild the heap with every transition due before the next reload has a chance to run."""
+        horizon = datetime.utcnow() + timedelta(seconds=2 * self.refresh_interval)
+        projection = {"_id": 0, "id": 1, "status": 1, "start_time": 1, "end_time": 1}
+        loaded = [
+            debate async for debate in self.db.debates.find(
+                {"$or": [
+                    {"status": UPCOMING, "start_time": {"$lte": horizon}},
+                    {"status": ACTIVE, "end_time": {"$lte": horizon}},
+                ]},
+                projection,
+            )
+        ]
+        loaded_ids = {debate["id"] for debate in loaded}
+        # Keep live entries of debates outside the window (scheduled here, due later)
+        heap = [entry for entry in self._heap if entry[1] not in loaded_ids and self._is_live(entry)]
+        self._generations = {entry[1]: entry[3] for entry in heap}
+        heap += [self._next_entry(debate) for debate in loaded]
+        heapq.heapify(heap)
+        self._heap = heap
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reload = loop.time() + self.refresh_interval
+        while True:
+            try:
+                if loop.time() >= next_reload:
+                    await self.reload()
+                    next_reload = loop.time() + self.refresh_interval
+                await self._fire_due()
+                timeout = next_reload - loop.time()
+                if self._heap:
+                    due_in = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                    timeout = min(timeout, due_in)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Debate lifecycle scheduler error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _fire_due(self):
+        while self._heap and self._heap[0][0] <= datetime.utcnow():
+            entry = heapq.heappop(self._heap)
+            if not self._is_live(entry):
+                continue
+            del self._generations[entry[1]]
+            await self._transition(entry[1], entry[2])
+
+    async def _transition(self, debate_id: str, from_status: str):
+        now = datetime.utcnow()
+        # The filter re-checks the stored times, so a debate rescheduled since it was queued is left alone
+        if from_status == UPCOMING:
+            conditions = [
+                (COMPLETED, {"end_time": {"$lte": now}}),
+                (ACTIVE, {"start_time": {"$lte": now}, "end_time": {"$gt": now}}),
+            ]
+        else:
+            conditions = [(COMPLETED, {"end_time": {"$lte": now}})]
+        for to_status, times in conditions:
+            debate = await self.db.debates.find_one_and_update(
+                {"id": debate_id, "status": from_status, **times},
+                {"$set": {"status": to_status}},
+                projection={"_id": 0},
+            )
+            if debate:
+                debate["status"] = to_status
+                self.transitions += 1
+                self.schedule(debate)
+                await self._notify(debate, from_status, to_status)
+                return
+
+        # Another worker got here first, or the debate was edited or deleted elsewhere.
+        # That worker reports the change; just queue whatever comes next, unless an edit here already did.
+        self.lost += 1
+        debate = await self.db.debates.find_one({"id": debate_id}, {"_id": 0})
+        if debate and debate_id not in self._generations:
+            self.schedule(debate)
+
+    async def _notify(self, debate: dict, from_status: str, to_status: str):
+        try:
+            await self.on_transition(debate, from_status, to_status)
+        except Exception as e:
+            logger.error(f"Lifecycle callback failed for debate {debate['id']}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._generations),
+            "next_due": self._heap[0][0].isoformat() if self._heap else None,
+            "transitions": self.transitions,
+            "lost": self.lost,
+        }
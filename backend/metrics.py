@@ -0,0 +1,257 @@
+"""Prometheus text-format metrics: HTTP middleware, Mongo command listener, gauges.
+
+Kept dependency-free and cheap enough to leave on: a request costs two
+``perf_counter`` calls, one dict lookup for the route template and a
+bucket bisect. Route labels are path templates (``/api/debates/{debate_id}``),
+never raw paths, so label cardinality stays bounded.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        # Mongo events arrive on driver threads
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are read at scrape time, e.g. queue depth or a cache hit ratio."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], collect: Callable[[], Iterable]):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.collect():
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets=HTTP_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Labels, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            snapshot = [(labels, list(counts), total[0]) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self.http_duration = self.add(Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template",
+            ("method", "route"), HTTP_BUCKETS,
+        ))
+        self.http_requests = self.add(Counter(
+            "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"),
+        ))
+        self.http_in_flight = self.add(Gauge("http_requests_in_flight", "HTTP requests being served"))
+        self.mongo_duration = self.add(Histogram(
+            "mongodb_command_duration_seconds", "MongoDB command latency as seen by the driver",
+            ("collection", "command"), MONGO_BUCKETS,
+        ))
+        self.mongo_failures = self.add(Counter(
+            "mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"),
+        ))
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, collect: Callable[[], Iterable], labels: Sequence[str] = ()):
+        """Register a scrape-time gauge; ``collect`` yields (label values tuple, value)."""
+        return self.add(CallbackGauge(name, documentation, labels, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the mongodb_command_* metrics."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        # (connection, request id) -> collection, filled in started()
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection", "")
+        else:
+            target = command.get(event.command_name)
+            collection = target if isinstance(target, str) else ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.registry.mongo_duration.observe((collection, event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.registry.mongo_duration.observe((collection, event.command_name), event.duration_micros / 1e6)
+        self.registry.mongo_failures.inc((collection, event.command_name))
+
+
+# Scope of the HTTP request being served; Motor copies the context onto its
+# driver threads, so command listeners can see which route issued a command
+current_scope: ContextVar[Optional[Scope]] = ContextVar("current_scope", default=None)
+_routes: Dict[Callable, str] = {}
+
+
+def route_template(scope: Optional[Scope]) -> str:
+    """Declared path of the route that matched ``scope``, or "unmatched"."""
+    endpoint = scope.get("endpoint") if scope else None
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in _routes:
+        # Routing fills scope["endpoint"]; map it back to the declared path once
+        _routes.update(
+            (getattr(route, "endpoint", None), route.path)
+            for route in scope["app"].routes if hasattr(route, "path")
+        )
+    return _routes.setdefault(endpoint, "unmatched")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware task overhead) timing every HTTP request."""
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry = self.registry
+        current_scope.set(scope)
+        registry.http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.http_in_flight.dec()
+            labels = (scope["method"], route_template(scope))
+            registry.http_duration.observe(labels, elapsed)
+            registry.http_requests.inc(labels + (str(status),))
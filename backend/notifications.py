@@ -0,0 +1,220 @@
+"""Push bildirimi dağıtımı (notification fan-out).
+
+Request handlers only enqueue; a pool of workers streams ``push_subscriptions``
+in batches and hands each subscription to a pluggable ``PushSender``. Bursts of
+events sharing a coalesce key (e.g. votes on one debate) are merged into a
+single notification per window.
+"""
+import abc
+import asyncio
+import contextvars
+import logging
+from typing import Callable, Dict, Optional
+
+from tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+
+class PushSender(abc.ABC):
+    """Delivers one payload to one subscription. Returns False if the subscription is gone."""
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def send(self, subscription: dict, payload: dict) -> bool:
+        ...
+
+
+class LoggingPushSender(PushSender):
+    """Default sender: no push service configured, just log the delivery."""
+
+    async def send(self, subscription: dict, payload: dict) -> bool:
+        logger.info(f"Push notification sent: {payload['title']} - {payload['body']}")
+        return True
+
+
+class HttpPushSender(PushSender):
+    """POSTs {subscription, payload} to a push gateway (or a local stub server in tests).
+
+    502/503/504 and connection errors are retried: a rare duplicate notification
+    after a timed out POST beats a lost one.
+    """
+
+    def __init__(self, http_client, gateway_url: str, timeout: float = 10.0, retries: int = 2):
+        self.http_client = http_client
+        self.gateway_url = gateway_url
+        self.timeout = timeout
+        self.retries = retries
+
+    async def send(self, subscription: dict, payload: dict) -> bool:
+        body = {
+            "subscription": {"endpoint": subscription["endpoint"], "keys": subscription.get("keys", {})},
+            "payload": payload,
+        }
+        result = await self.http_client.request(
+            "POST", self.gateway_url, json=body, timeout=self.timeout, retries=self.retries
+        )
+        if result.status in (404, 410):
+            return False
+        if result.status >= 400:
+            raise RuntimeError(f"Push gateway returned {result.status}")
+        return True
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        db,
+        sender: PushSender,
+        workers: int = 2,
+        concurrency: int = 32,
+        batch_size: int = 200,
+        coalesce_window: float = 5.0,
+        queue_size: int = 1000,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.db = db
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window
+        self.tracer = tracer or Tracer()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # coalesce key -> {"payload", "count", "summary", "timer"}
+        self._windows: Dict[str, dict] = {}
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self):
+        await self.sender.start()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Close open coalescing windows and give queued notifications a chance to go out."""
+        for key in list(self._windows):
+            self._close_window(key)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} queued notifications on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.sender.close()
+
+    def enqueue(
+        self,
+        payload: dict,
+        coalesce_key: Optional[str] = None,
+        summary: Optional[Callable[[int], str]] = None,
+    ) -> bool:
+        """Queue a notification without waiting for delivery.
+
+        Events with the same coalesce_key inside one window become a single
+        notification; ``summary(count)`` supplies its body when count > 1.
+        """
+        if coalesce_key is None:
+            return self._put(payload)
+
+        window = self._windows.get(coalesce_key)
+        if window:
+            window["payload"] = payload
+            window["count"] += 1
+            self.coalesced += 1
+            return True
+
+        loop = asyncio.get_running_loop()
+        self._windows[coalesce_key] = {
+            "payload": payload,
+            "count": 1,
+            "summary": summary,
+            "timer": loop.call_later(self.coalesce_window, self._close_window, coalesce_key),
+        }
+        return True
+
+    def _close_window(self, key: str):
+        window = self._windows.pop(key, None)
+        if not window:
+            return
+        window["timer"].cancel()
+        payload = window["payload"]
+        if window["count"] > 1 and window["summary"]:
+            payload = {**payload, "body": window["summary"](window["count"])}
+        self._put(payload)
+
+    def _put(self, payload: dict) -> bool:
+        try:
+            # Fan-out later runs in this context, so the queuing request's trace covers the deliveries
+            self._queue.put_nowait((payload, contextvars.copy_context()))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Notification queue full, dropping: {payload['title']}")
+            return False
+
+    async def _worker(self):
+        while True:
+            payload, context = await self._queue.get()
+            try:
+                await asyncio.create_task(self._fan_out(payload), context=context)
+            except Exception as e:
+                logger.error(f"Push notification error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _fan_out(self, payload: dict):
+        with self.tracer.span("notification fan-out", title=payload["title"]):
+            await self._fan_out_batches(payload)
+
+    async def _fan_out_batches(self, payload: dict):
+        cursor = self.db.push_subscriptions.find({}, {"_id": 0, "endpoint": 1, "keys": 1}).batch_size(self.batch_size)
+        batch = []
+        async for subscription in cursor:
+            batch.append(subscription)
+            if len(batch) >= self.batch_size:
+                await self._send_batch(batch, payload)
+                batch = []
+        if batch:
+            await self._send_batch(batch, payload)
+
+    async def _send_batch(self, batch, payload: dict):
+        results = await asyncio.gather(*(self._deliver(subscription, payload) for subscription in batch))
+        gone = [subscription["endpoint"] for subscription, alive in zip(batch, results) if alive is False]
+        if gone:
+            await self.db.push_subscriptions.delete_many({"endpoint": {"$in": gone}})
+
+    async def _deliver(self, subscription: dict, payload: dict) -> Optional[bool]:
+        async with self._semaphore:
+            try:
+                alive = await self.sender.send(subscription, payload)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Push delivery failed for {subscription['endpoint']}: {str(e)}")
+                return None
+        if alive:
+            self.sent += 1
+        return alive
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "open_windows": len(self._windows),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,63 @@
+"""Move participants embedded in debate documents into the participants collection.
+
+Debates used to carry a ``participants`` array that grew with every join
+and was shipped with every listing. Each name becomes a participants
+document and the debate keeps only ``participant_count``. The migration is
+idempotent (the unique index drops names already moved), so it runs on
+every startup and via ``python participants.py``.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate_embedded_participants(db) -> dict:
+    stats = {"debates": 0, "participants": 0}
+    async for debate in db.debates.find({"participants": {"$exists": True}}, {"_id": 0, "id": 1, "participants": 1}):
+        names = list(dict.fromkeys(debate.get("participants") or []))
+        if names:
+            joined_at = datetime.utcnow()
+            docs = [
+                {"id": str(uuid.uuid4()), "debate_id": debate["id"], "participant_name": name, "joined_at": joined_at}
+                for name in names
+            ]
+            try:
+                result = await db.participants.insert_many(docs, ordered=False)
+                stats["participants"] += len(result.inserted_ids)
+            except BulkWriteError as e:
+                # Names moved by an earlier or concurrent run
+                stats["participants"] += e.details.get("nInserted", 0)
+        count = await db.participants.count_documents({"debate_id": debate["id"]})
+        await db.debates.update_one(
+            {"id": debate["id"]},
+            {"$set": {"participant_count": count}, "$unset": {"participants": ""}}
+        )
+        stats["debates"] += 1
+    if stats["debates"]:
+        logger.info(f"Moved {stats['participants']} participants out of {stats['debates']} debates")
+    return stats
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    root = Path(__file__).parent
+    load_dotenv(root / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    try:
+        stats = await migrate_embedded_participants(client[os.environ["DB_NAME"]])
+    finally:
+        client.close()
+    print(stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,135 @@
+"""Conditional and ranged responses for immutable files under UPLOAD_DIR.
+
+Uploaded files and renditions never change once written (their names are
+UUIDs or content hashes), so they get strong ETags, one-year ``immutable``
+caching, ``If-None-Match`` -> 304 and single-range ``Range`` support.
+Full bodies go through FileResponse, which uses the ASGI ``pathsend``
+extension (sendfile) when the server offers it.
+"""
+import hashlib
+import mimetypes
+import os
+import stat
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 256 * 1024
+
+
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    # mtime/size are part of the cache key so a replaced file is re-hashed
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets.
+
+    Returns None when the header should be ignored (malformed or multi-range,
+    answered with the full body) and raises 416 when it cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            # Suffix range: the last N bytes
+            first = max(0, size - int(end))
+            last = size - 1
+    except ValueError:
+        return None
+    if first > last and start and end:
+        return None
+    if first >= size or size == 0:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return first, min(last, size - 1)
+
+
+class FileRangeResponse(Response):
+    """206 response for one byte range of a file; zero-copy when the server supports it."""
+
+    def __init__(self, path: Path, first: int, last: int, size: int, headers: dict, media_type: str):
+        super().__init__(status_code=206, headers=headers, media_type=media_type)
+        self.path = path
+        self.first = first
+        self.count = last - first + 1
+        self.headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        self.headers["Content-Length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": fd, "offset": self.first, "count": self.count})
+                return
+            offset, remaining = self.first, self.count
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+async def serve_immutable_file(request: Request, path: Path, content_hash: Optional[str] = None) -> Response:
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    if content_hash is None:
+        content_hash = await anyio.to_thread.run_sync(
+            _file_digest, str(path), stat_result.st_mtime_ns, stat_result.st_size
+        )
+    etag = f'"{content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(range_header, stat_result.st_size)
+        if byte_range:
+            first, last = byte_range
+            return FileRangeResponse(path, first, last, stat_result.st_size, headers, media_type)
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
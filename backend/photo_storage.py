@@ -0,0 +1,407 @@
+"""Content-addressed photo storage.
+
+Multipart upload bodies are parsed as they arrive from the socket. The file
+part goes straight to a temp file while its SHA-256 is computed, capped at
+the size limit, and is then stored as ``<sha256><ext>``: identical bytes
+share one blob. ``photo_blobs``
+keeps a reference count per blob so the file is only unlinked when the last
+photo using it is deleted. While the last release deletes the file, the blob
+document stays behind as a ``deleting`` tombstone. Uploads of the same bytes
+wait for it to go instead of referencing a file that is about to vanish.
+
+``python photo_storage.py`` migrates an existing UPLOAD_DIR to this layout,
+merging duplicate files and rebuilding the reference counts.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from image_derivatives import remove_derivatives
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart import MultipartParser
+    from multipart.multipart import parse_options_header
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+TOMBSTONE_POLL_SECONDS = 0.05
+# Form fields next to the file (title, description, ...) share this budget
+MAX_FIELD_BYTES = 64 * 1024
+# Header lines of one part, and parts per body; the parser buffers neither limit on its own
+MAX_PART_HEADER_BYTES = 8 * 1024
+MAX_PARTS = 32
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the configured size limit while streaming."""
+
+
+class MalformedUpload(Exception):
+    """The request body is not a usable multipart/form-data upload."""
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    size: int
+    sha256: str
+    filename: str = ""
+    content_type: str = ""
+
+
+def _write_chunk(fd: int, chunk: bytes):
+    view = memoryview(chunk)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _remove(path: Path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _hash_file(path: Path) -> StoredUpload:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return StoredUpload(path=path, size=size, sha256=digest.hexdigest())
+
+
+def blob_filename(sha256: str, extension: str) -> str:
+    return f"{sha256}{extension.lower()}"
+
+
+class _TempWriter:
+    """Temp file in ``directory`` that hashes what is written and refuses to grow past ``max_bytes``."""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        self.path = Path(temp_path)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self.digest.update(chunk)
+        await asyncio.to_thread(_write_chunk, self.fd, chunk)
+
+    async def finish(self) -> StoredUpload:
+        await asyncio.to_thread(os.fsync, self.fd)
+        os.close(self.fd)
+        return StoredUpload(path=self.path, size=self.size, sha256=self.digest.hexdigest())
+
+    def abort(self):
+        os.close(self.fd)
+        _remove(self.path)
+
+
+async def receive_multipart(
+    content_type: str,
+    stream: AsyncIterator[bytes],
+    directory: Path,
+    max_bytes: int,
+    file_field: str = "file",
+):
+    """Parse a multipart/form-data body as it streams in; returns (fields, StoredUpload or None).
+
+    The ``file_field`` part is written to a temp file in ``directory`` without
+    blocking the event loop and fsynced, and never touches memory or disk as a
+    whole body first. Going over ``max_bytes`` or the field budget raises
+    UploadTooLarge; oversized part headers, too many parts or a body cut off
+    before its closing boundary raise MalformedUpload. On any failure the temp
+    file is removed.
+    """
+    mimetype, options = parse_options_header(content_type)
+    if mimetype != b"multipart/form-data" or b"boundary" not in options:
+        raise MalformedUpload("Expected multipart/form-data with a boundary")
+
+    fields: Dict[str, str] = {}
+    field_bytes = 0
+    writer: Optional[_TempWriter] = None
+    upload: Optional[StoredUpload] = None
+    # Parser callbacks are synchronous; file data is queued and written between chunks
+    part = {"headers": {}, "header": b"", "value": b"", "header_bytes": 0, "name": None, "data": [], "file": False}
+    file_data = []
+    parts = 0
+    complete = False
+
+    def on_part_begin():
+        nonlocal parts
+        parts += 1
+        if parts > MAX_PARTS:
+            raise MalformedUpload(f"More than {MAX_PARTS} multipart parts")
+        part.update(headers={}, header_bytes=0, name=None, data=[], file=False)
+
+    def count_header_bytes(count: int):
+        part["header_bytes"] += count
+        if part["header_bytes"] > MAX_PART_HEADER_BYTES:
+            raise MalformedUpload(f"Multipart part headers exceed {MAX_PART_HEADER_BYTES} bytes")
+
+    def on_header_field(data, start, end):
+        count_header_bytes(end - start)
+        part["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        count_header_bytes(end - start)
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header"].lower()] = part["value"]
+        part.update(header=b"", value=b"")
+
+    def on_headers_finished():
+        nonlocal writer, upload
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if b"name" not in disposition:
+            raise MalformedUpload("Multipart part without a name")
+        part["name"] = disposition[b"name"].decode("utf-8", "replace")
+        if part["name"] == file_field and b"filename" in disposition:
+            if writer is not None or upload is not None:
+                raise MalformedUpload(f"More than one {file_field!r} part")
+            part["file"] = True
+            writer = _TempWriter(directory, max_bytes)
+            upload = StoredUpload(
+                path=writer.path, size=0, sha256="",
+                filename=disposition[b"filename"].decode("utf-8", "replace"),
+                content_type=part["headers"].get(b"content-type", b"").decode("latin-1"),
+            )
+
+    def on_part_data(data, start, end):
+        nonlocal field_bytes
+        if part["file"]:
+            file_data.append(data[start:end])
+            return
+        field_bytes += end - start
+        if field_bytes > MAX_FIELD_BYTES:
+            raise UploadTooLarge(f"Form fields exceed {MAX_FIELD_BYTES} bytes")
+        part["data"].append(data[start:end])
+
+    def on_part_end():
+        if not part["file"] and part["name"] is not None:
+            fields[part["name"]] = b"".join(part["data"]).decode("utf-8", "replace")
+
+    def on_end():
+        nonlocal complete
+        complete = True
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_end": on_end,
+    })
+    try:
+        async for chunk in stream:
+            try:
+                parser.write(chunk)
+            except (UploadTooLarge, MalformedUpload):
+                raise
+            except Exception as e:
+                raise MalformedUpload(str(e)) from e
+            for data in file_data:
+                await writer.write(data)
+            file_data.clear()
+        parser.finalize()
+        if not complete:
+            raise MalformedUpload("Multipart body ended before its closing boundary")
+        if writer is not None:
+            stored = await writer.finish()
+            writer = None
+            upload.size, upload.sha256 = stored.size, stored.sha256
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    return fields, upload
+
+
+@dataclass
+class StoredBlob:
+    filename: str
+    location: str
+    size: int
+    sha256: str
+
+
+class PhotoBlobStore:
+    def __init__(self, db, storage, temp_dir: Path, tombstone_timeout: float = 60.0):
+        self.db = db
+        self.storage = storage
+        self.temp_dir = temp_dir
+        # A tombstone older than this belongs to a release that died half way
+        self.tombstone_timeout = tombstone_timeout
+
+    async def store_upload(self, temp: StoredUpload, extension: str) -> StoredBlob:
+        """Move a received upload under its content hash and take a reference on the blob."""
+        blob = None
+        try:
+            # Reference first, so a concurrent release of the same blob keeps the file
+            blob = await self.acquire(temp.sha256, blob_filename(temp.sha256, extension), temp.size)
+            key = f"photos/{blob['filename']}"
+            if await self.storage.exists(key):
+                await asyncio.to_thread(_remove, temp.path)
+            else:
+                await self.storage.store_file(key, temp.path, temp.content_type)
+        except BaseException:
+            await asyncio.to_thread(_remove, temp.path)
+            if blob is not None:
+                await self.release({"content_hash": temp.sha256, "filename": blob["filename"]})
+            raise
+        return StoredBlob(blob["filename"], self.storage.location(key), temp.size, temp.sha256)
+
+    async def acquire(self, sha256: str, filename: str, size: int) -> dict:
+        """Reference the blob for ``sha256``; the first upload of those bytes fixes its filename.
+
+        Waits while a release is deleting the blob's file, then starts a fresh blob.
+        """
+        deadline = time.monotonic() + self.tombstone_timeout
+        while True:
+            try:
+                return await self.db.photo_blobs.find_one_and_update(
+                    {"content_hash": sha256, "deleting": {"$exists": False}},
+                    {
+                        "$inc": {"refcount": 1},
+                        "$setOnInsert": {"filename": filename, "size": size, "created_at": datetime.utcnow()},
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # The upsert collided with a tombstone (content_hash is unique)
+                pass
+            if time.monotonic() >= deadline:
+                stale = datetime.utcnow() - timedelta(seconds=self.tombstone_timeout)
+                await self.db.photo_blobs.delete_one({"content_hash": sha256, "deleting": {"$lte": stale}})
+                deadline = time.monotonic() + self.tombstone_timeout
+            await asyncio.sleep(TOMBSTONE_POLL_SECONDS)
+
+    async def release(self, photo: dict) -> bool:
+        """Drop one reference to the photo's blob; True if the stored object itself was removed.
+
+        The last reference also takes the photo's renditions with it.
+        """
+        content_hash = photo.get("content_hash")
+        blob = None
+        if content_hash:
+            blob = await self.db.photo_blobs.find_one_and_update(
+                {"content_hash": content_hash, "filename": photo["filename"], "deleting": {"$exists": False}},
+                {"$inc": {"refcount": -1}},
+                return_document=ReturnDocument.AFTER,
+            )
+        if blob is not None:
+            if blob["refcount"] > 0:
+                return False
+            tombstone = await self.db.photo_blobs.update_one(
+                {"_id": blob["_id"], "refcount": {"$lte": 0}, "deleting": {"$exists": False}},
+                {"$set": {"deleting": datetime.utcnow()}},
+            )
+            if tombstone.modified_count == 0:
+                # Re-referenced by an upload in the meantime
+                return False
+        # Unreferenced blob, or a file stored before content addressing
+        await self.storage.delete(f"photos/{photo['filename']}")
+        for rendition in photo.get("renditions", []):
+            await self.storage.delete(f"renditions/{rendition['filename']}")
+        if blob is not None:
+            await self.db.photo_blobs.delete_one({"_id": blob["_id"]})
+        return True
+
+
+async def migrate_upload_dir(db, directory: Path, rendition_dir: Optional[Path] = None) -> dict:
+    """Rename every photo file to its content hash, merge duplicates and rebuild refcounts.
+
+    Works on the local UPLOAD_DIR; run it before switching PHOTO_STORAGE to s3.
+    """
+    stats = {"photos": 0, "renamed": 0, "deduplicated": 0, "missing": 0}
+    # content hash -> blob filename, so copies with different extensions still merge
+    canonical = {}
+    async for photo in db.photos.find({}, {"_id": 0}):
+        stats["photos"] += 1
+        path = Path(photo["file_path"])
+        if not await asyncio.to_thread(path.exists):
+            stats["missing"] += 1
+            logger.warning(f"Photo {photo['id']} points at missing file {path}")
+            continue
+        hashed = await asyncio.to_thread(_hash_file, path)
+        filename = canonical.setdefault(hashed.sha256, blob_filename(hashed.sha256, path.suffix))
+        target = directory / filename
+        if path != target:
+            if await asyncio.to_thread(target.exists):
+                await asyncio.to_thread(_remove, path)
+                stats["deduplicated"] += 1
+            else:
+                await asyncio.to_thread(os.replace, path, target)
+                stats["renamed"] += 1
+
+        update = {"filename": filename, "file_path": str(target), "content_hash": hashed.sha256, "size": hashed.size}
+        if photo.get("filename") != filename:
+            # Renditions are named after the blob; regenerate them with image_derivatives.py
+            if rendition_dir and photo.get("renditions"):
+                remove_derivatives(rendition_dir, photo["renditions"])
+            update.update({"renditions": [], "placeholder": None})
+        await db.photos.update_one({"id": photo["id"]}, {"$set": update})
+
+    await db.photo_blobs.delete_many({})
+    pipeline = [{"$group": {
+        "_id": "$content_hash",
+        "filename": {"$first": "$filename"},
+        "size": {"$first": "$size"},
+        "refcount": {"$sum": 1},
+    }}]
+    blobs = [
+        {"content_hash": group["_id"], "filename": group["filename"], "size": group["size"],
+         "refcount": group["refcount"], "created_at": datetime.utcnow()}
+        async for group in db.photos.aggregate(pipeline)
+        if group["_id"]
+    ]
+    if blobs:
+        await db.photo_blobs.insert_many(blobs)
+    stats["blobs"] = len(blobs)
+    return stats
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    root = Path(__file__).parent
+    load_dotenv(root / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    try:
+        stats = await migrate_upload_dir(
+            client[os.environ["DB_NAME"]], root / "uploads" / "photos", root / "uploads" / "renditions"
+        )
+    finally:
+        client.close()
+    print(stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,201 @@
+"""Opt-in cProfile runs of single API requests, for diagnosing a slow route in production.
+
+An admin sends ``X-Profile: 1`` (or ``?profile=1``) with a normal request, or
+``sample_every`` profiles one in N API requests automatically. The pstats
+dump is kept on disk for download (snakeviz, flameprof and ``python -m
+pstats`` all read it). The response carries ``X-Profile-Id``. cProfile
+hooks the whole thread, so while the profiled request awaits, other requests
+on the same event loop show up in its profile too. Only one request is
+profiled at a time per worker, and the dump is written on the default
+executor so a large profile does not stall the event loop. When nothing
+asks for a profile, the middleware costs a counter increment and a header
+scan.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+SUMMARY_LINES = 40
+
+
+class ProfileStore:
+    """The last ``keep`` profiles: metadata in memory, pstats dumps in ``directory``."""
+
+    def __init__(self, directory: Path, keep: int = 50):
+        self.directory = Path(directory)
+        self.keep = keep
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def path(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.prof"
+
+    async def save(self, profile_id: str, profiler: cProfile.Profile, meta: Dict):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._dump, profile_id, profiler)
+        self._profiles[profile_id] = meta
+        evicted = []
+        while len(self._profiles) > self.keep:
+            old_id, _ = self._profiles.popitem(last=False)
+            evicted.append(old_id)
+        if evicted:
+            await loop.run_in_executor(None, self._unlink, evicted)
+
+    def _dump(self, profile_id: str, profiler: cProfile.Profile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(self.path(profile_id)))
+
+    def _unlink(self, profile_ids: List[str]):
+        for profile_id in profile_ids:
+            self.path(profile_id).unlink(missing_ok=True)
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        """Newest first."""
+        return list(reversed(self._profiles.values()))
+
+    def summary(self, profile_id: str, sort: str = "cumulative", lines: int = SUMMARY_LINES) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(str(self.path(profile_id)), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(lines)
+        return out.getvalue()
+
+
+class _Session:
+    def __init__(
+        self,
+        store: ProfileStore,
+        scope: Scope,
+        trigger: str,
+        release: Callable[[], None],
+        spawn: Callable[[Awaitable[None]], None],
+    ):
+        self.id = uuid.uuid4().hex
+        self.store = store
+        self.scope = scope
+        self.trigger = trigger
+        self.release = release
+        self.spawn = spawn
+        self.status: Optional[int] = None
+        self.profiler = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.done = False
+
+    def finish(self, truncated: bool = False):
+        """Stop recording and save in the background; the next profile can start once the dump is written."""
+        if self.done:
+            return
+        self.done = True
+        self.profiler.disable()
+        self.spawn(self._save({
+            "id": self.id,
+            "at": datetime.utcnow().isoformat(),
+            "method": self.scope["method"],
+            "path": self.scope["path"],
+            "route": route_template(self.scope),
+            "status": self.status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "trigger": self.trigger,
+            "truncated": truncated,
+        }))
+
+    async def _save(self, meta: Dict):
+        try:
+            await self.store.save(self.id, self.profiler, meta)
+        except Exception as e:
+            logger.error(f"Saving profile {self.id} failed: {str(e)}")
+        finally:
+            self.release()
+
+
+class ProfilerMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: ProfileStore,
+        authorize: Callable[[Optional[str]], bool],
+        enabled: bool = True,
+        sample_every: int = 0,
+        max_seconds: float = 30.0,
+        prefix: str = "/api/",
+    ):
+        self.app = app
+        self.store = store
+        # Authorization header value -> may this caller ask for a profile
+        self.authorize = authorize
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.max_seconds = max_seconds
+        self.prefix = prefix
+        self._seen = 0
+        self._busy = threading.Lock()
+        self._saves = set()
+
+    def _trigger(self, scope: Scope) -> Optional[str]:
+        requested = False
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                requested = value not in (b"", b"0")
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+        if not requested and b"profile=" in scope.get("query_string", b""):
+            values = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [])
+            requested = any(value not in ("", "0") for value in values)
+        if requested and self.authorize(authorization):
+            return "request"
+        if self.sample_every:
+            self._seen += 1
+            if self._seen % self.sample_every == 0:
+                return "sample"
+        return None
+
+    def _spawn(self, save: Awaitable[None]):
+        task = asyncio.get_running_loop().create_task(save)
+        self._saves.add(task)
+        task.add_done_callback(self._saves.discard)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        session = _Session(self.store, scope, trigger, self._busy.release, self._spawn)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                message = {**message, "headers": [*message["headers"], (b"x-profile-id", session.id.encode())]}
+            await send(message)
+
+        # Streaming responses never end on their own; cut the profile off and keep what was recorded
+        timer = asyncio.get_running_loop().call_later(self.max_seconds, session.finish, True)
+        session.profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            timer.cancel()
+            session.finish()
+
@@ -0,0 +1,286 @@
+"""Server-Sent Events fan-out of per-debate deltas (tallies, participants, comments).
+
+Each connection gets a small bounded queue. Publishing never blocks: a
+subscriber whose queue is full has it replaced by a single ``resync`` event
+(the client should refetch), and one that keeps overflowing is disconnected.
+
+The broadcaster only reaches this worker's connections. Writes made on other
+workers arrive through the InvalidationHub (see ``relay_to_streams`` in
+server.py). Change streams carry the new counter values. Polling only says
+that a collection changed, so there a ``StreamRefresher`` reads what the
+subscribed debates need instead: their counters and status every interval,
+and their newest comments once another worker reported a comments write.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyConnections(Exception):
+    """The per-worker stream connection cap has been reached."""
+
+
+class Subscriber:
+    def __init__(self, debate_id: str, queue_size: int):
+        self.debate_id = debate_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflows = 0
+        self.closed = False
+
+
+class DebateBroadcaster:
+    def __init__(
+        self,
+        max_connections: int = 1000,
+        queue_size: int = 32,
+        heartbeat_interval: float = 15.0,
+        max_overflows: int = 3,
+    ):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.max_overflows = max_overflows
+        self._groups: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._connections = 0
+        self._event_ids: Dict[str, int] = defaultdict(int)
+        # Mongo _id <-> debate id of debates with subscribers; change stream updates only carry the _id
+        self._debate_ids: Dict[str, str] = {}
+        self._object_ids: Dict[str, str] = {}
+        self.published = 0
+        self.resyncs = 0
+        self.disconnected_slow = 0
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def subscribe(self, debate_id: str, object_id=None) -> Subscriber:
+        if self._connections >= self.max_connections:
+            raise TooManyConnections()
+        subscriber = Subscriber(debate_id, self.queue_size)
+        self._groups[debate_id].add(subscriber)
+        self._connections += 1
+        if object_id is not None:
+            self._debate_ids[str(object_id)] = debate_id
+            self._object_ids[debate_id] = str(object_id)
+        return subscriber
+
+    def debate_id_for(self, object_id) -> Optional[str]:
+        """Debate id behind a Mongo _id, if anyone here is subscribed to it."""
+        return self._debate_ids.get(str(object_id))
+
+    def unsubscribe(self, subscriber: Subscriber):
+        group = self._groups.get(subscriber.debate_id)
+        if group is None or subscriber not in group:
+            return
+        group.discard(subscriber)
+        if not group:
+            del self._groups[subscriber.debate_id]
+            object_id = self._object_ids.pop(subscriber.debate_id, None)
+            if object_id is not None:
+                self._debate_ids.pop(object_id, None)
+        self._connections -= 1
+
+    def publish(self, debate_id: str, event: str, data: dict):
+        group = self._groups.get(debate_id)
+        if not group:
+            return
+        self._event_ids[debate_id] += 1
+        message = format_event(event, data, self._event_ids[debate_id])
+        self.published += 1
+        for subscriber in list(group):
+            self._offer(subscriber, message)
+
+    def debate_ids(self) -> List[str]:
+        """Debates with at least one subscriber on this worker."""
+        return list(self._groups)
+
+    def resync(self, debate_id: str):
+        self.publish(debate_id, "resync", {"debate_id": debate_id})
+
+    def resync_all(self):
+        """Every subscriber should refetch (a change we only know the collection of)."""
+        for debate_id in list(self._groups):
+            self.resync(debate_id)
+
+    def close(self):
+        """Ask every open stream to finish (used on shutdown)."""
+        for group in list(self._groups.values()):
+            for subscriber in list(group):
+                self._close(subscriber)
+
+    def _offer(self, subscriber: Subscriber, message: bytes):
+        if subscriber.closed:
+            return
+        try:
+            subscriber.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        subscriber.overflows += 1
+        if subscriber.overflows > self.max_overflows:
+            self.disconnected_slow += 1
+            self._close(subscriber)
+            return
+        # Everything queued is stale anyway; tell the client to refetch instead
+        self.resyncs += 1
+        _drain(subscriber.queue)
+        subscriber.queue.put_nowait(format_event("resync", {"debate_id": subscriber.debate_id}))
+
+    def _close(self, subscriber: Subscriber):
+        subscriber.closed = True
+        _drain(subscriber.queue)
+        subscriber.queue.put_nowait(None)
+
+    async def stream(self, subscriber: Subscriber, initial: Optional[bytes] = None) -> AsyncIterator[bytes]:
+        """SSE body for one subscriber, with comment heartbeats while idle."""
+        try:
+            yield b"retry: 3000\n\n"
+            if initial:
+                yield initial
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self._connections,
+            "debates": len(self._groups),
+            "published": self.published,
+            "resyncs": self.resyncs,
+            "disconnected_slow": self.disconnected_slow,
+        }
+
+
+class StreamRefresher:
+    """Polling mode's stand-in for the change stream relay, one query per kind per interval.
+
+    Counters and status of the subscribed debates are read every ``interval``,
+    since vote writes do not bump cache versions, and a ``tally`` or ``status``
+    goes out only for debates whose values moved. Comments are read only after
+    ``mark("comments")``, going back ``lookback`` past the previous read so that
+    slow inserts are not missed; clients drop comments they already have. More
+    than ``comment_limit`` new comments turn into a ``resync`` of those debates.
+    """
+
+    def __init__(
+        self,
+        db,
+        broadcaster: DebateBroadcaster,
+        counters: tuple,
+        interval: float = 2.0,
+        lookback: float = 30.0,
+        comment_limit: int = 50,
+        merge: Optional[Callable[[dict], dict]] = None,
+    ):
+        self.db = db
+        self.broadcaster = broadcaster
+        self.counters = counters
+        self.interval = interval
+        self.lookback = timedelta(seconds=lookback)
+        self.comment_limit = comment_limit
+        # Adds this worker's buffered votes, so a refresh never shows less than the local tally did
+        self.merge = merge
+        self._sent: Dict[str, dict] = {}
+        self._comments_pending = False
+        self._comments_since = datetime.utcnow()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, collection: str):
+        """Another worker wrote to ``collection``."""
+        if collection == "comments":
+            self._comments_pending = True
+
+    async def start(self):
+        self._comments_since = datetime.utcnow()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except PyMongoError as e:
+                logger.error(f"Stream refresh failed: {str(e)}")
+
+    async def refresh(self):
+        debate_ids = self.broadcaster.debate_ids()
+        self._sent = {debate_id: sent for debate_id, sent in self._sent.items() if debate_id in debate_ids}
+        if not debate_ids:
+            self._comments_pending = False
+            return
+        await self._refresh_debates(debate_ids)
+        if self._comments_pending:
+            self._comments_pending = False
+            await self._refresh_comments(debate_ids)
+
+    async def _refresh_debates(self, debate_ids: List[str]):
+        projection = {"_id": 0, "id": 1, "status": 1, **{name: 1 for name in self.counters}}
+        async for debate in self.db.debates.find({"id": {"$in": debate_ids}}, projection):
+            if self.merge:
+                debate = self.merge(debate)
+            current = {name: debate.get(name, 0) for name in self.counters}
+            current["status"] = debate.get("status")
+            sent = self._sent.get(debate["id"], {})
+            counts = {name: current[name] for name in self.counters if sent.get(name) != current[name]}
+            if counts:
+                self.broadcaster.publish(debate["id"], "tally", counts)
+            if sent.get("status") != current["status"]:
+                self.broadcaster.publish(debate["id"], "status", {"status": current["status"]})
+            self._sent[debate["id"]] = current
+
+    async def _refresh_comments(self, debate_ids: List[str]):
+        started = datetime.utcnow()
+        cursor = self.db.comments.find(
+            {"debate_id": {"$in": debate_ids}, "created_at": {"$gte": self._comments_since - self.lookback}},
+            {"_id": 0}
+        ).sort("created_at", 1).limit(self.comment_limit + 1)
+        comments = await cursor.to_list(length=self.comment_limit + 1)
+        self._comments_since = started
+        if len(comments) > self.comment_limit:
+            for debate_id in {comment["debate_id"] for comment in comments}:
+                self.broadcaster.resync(debate_id)
+            return
+        for comment in comments:
+            self.broadcaster.publish(comment["debate_id"], "comment", comment)
+
+
+def format_event(event: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str, ensure_ascii=False)}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def _drain(queue: asyncio.Queue):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
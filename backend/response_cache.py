@@ -0,0 +1,109 @@
+"""Serialized listing responses cached per collection version.
+
+Every cached body belongs to a collection (``debates``, ``photos``) and the
+version that collection had when the query ran. Writers call ``invalidate``,
+which bumps the version, so a stale body can never be served again. Each
+entry keeps a strong ETag for ``If-None-Match`` -> 304 and, above a size
+threshold, a pre-gzipped copy of the body.
+"""
+import gzip
+import hashlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    gzip_body: Optional[bytes]
+    etag: str
+    headers: Dict[str, str]
+
+    def respond(self, request: Request) -> Response:
+        use_gzip = self.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", "")
+        # The gzipped representation is a different entity, so it gets its own tag
+        etag = self.etag[:-1] + '-gzip"' if use_gzip else self.etag
+        headers = {**self.headers, "ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if _etag_matches(request.headers.get("if-none-match"), (self.etag, self.etag[:-1] + '-gzip"')):
+            return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_body, headers=headers, media_type="application/json")
+        return Response(self.body, headers=headers, media_type="application/json")
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, compress_min_bytes: int = 1024):
+        self.max_entries = max_entries
+        self.compress_min_bytes = compress_min_bytes
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._entries: "OrderedDict[Tuple[str, int, str], CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def version(self, collection: str) -> int:
+        """Read this before querying and pass it to ``put``, so a write racing the query wins."""
+        return self._versions[collection]
+
+    def get(self, collection: str, key: str) -> Optional[CachedResponse]:
+        entry_key = (collection, self._versions[collection], key)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return entry
+
+    def put(self, collection: str, version: int, key: str, body: bytes, headers: Dict[str, str]) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            gzip_body=gzip.compress(body, compresslevel=6) if len(body) >= self.compress_min_bytes else None,
+            etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            headers=headers,
+        )
+        if version != self._versions[collection]:
+            # Invalidated while the query ran; answer with it but don't keep it
+            return entry
+        self._entries[(collection, version, key)] = entry
+        self._entries.move_to_end((collection, version, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, collection: str):
+        self._versions[collection] += 1
+        self.invalidations += 1
+        for entry_key in [k for k in self._entries if k[0] == collection]:
+            del self._entries[entry_key]
+
+    def clear(self):
+        for collection in list(self._versions):
+            self.invalidate(collection)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "versions": dict(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+
+def _etag_matches(header: Optional[str], etags: Tuple[str, ...]) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") in etags for tag in header.split(","))
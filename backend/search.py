@@ -0,0 +1,325 @@
+"""In-process full-text search over debates and comments.
+
+Text is folded the Turkish way before tokenizing: ``I`` lowers to ``ı`` and
+``İ`` to ``i``. Diacritics are then stripped (ı/i, ş/s, ğ/g, ç/c, ö/o, ü/u),
+so "İSTANBUL", "istanbul" and "Istanbul" all match, and so does a query
+typed on an ASCII keyboard. Ranking is BM25 over field-weighted term
+frequencies; every query term must match, and the last one also matches
+as a prefix. Local writes update the index incrementally. A periodic
+rebuild from Mongo picks up writes made by other workers.
+"""
+import asyncio
+import bisect
+import heapq
+import html
+import logging
+import math
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_TURKISH_UPPER = str.maketrans({"I": "ı", "İ": "i"})
+_ASCII_FOLD = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ç": "c", "ö": "o", "ü": "u", "â": "a", "î": "i", "û": "u"})
+# A plain lower() turns "İ" into "i" plus a combining dot
+_COMBINING_DOT = "\u0307"
+
+DEBATE_FIELDS = {"title": 3.0, "topic": 2.0, "description": 1.0}
+COMMENT_FIELDS = {"content": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 160
+
+DocKey = Tuple[str, str]  # ("debate" | "comment", id)
+
+
+def fold(text: str) -> str:
+    return text.translate(_TURKISH_UPPER).lower().replace(_COMBINING_DOT, "").translate(_ASCII_FOLD)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(fold(text))
+
+
+@dataclass
+class _Document:
+    kind: str
+    fields: Dict[str, str]
+    meta: Dict
+    length: float
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings: Dict[str, Dict[DocKey, float]] = defaultdict(dict)
+        self._docs: Dict[DocKey, _Document] = {}
+        self._terms: Dict[DocKey, Set[str]] = {}
+        self._comments_by_debate: Dict[str, Set[str]] = defaultdict(set)
+        self._total_length = 0.0
+        self._vocabulary: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    # Writes
+    def add_debate(self, debate: Dict):
+        meta = {
+            "id": debate["id"],
+            "title": debate.get("title"),
+            "status": debate.get("status"),
+            "created_at": debate.get("created_at"),
+        }
+        self._add(("debate", debate["id"]), DEBATE_FIELDS, debate, meta)
+
+    def add_comment(self, comment: Dict):
+        meta = {
+            "id": comment["id"],
+            "debate_id": comment["debate_id"],
+            "author_name": comment.get("author_name"),
+            "created_at": comment.get("created_at"),
+        }
+        self._add(("comment", comment["id"]), COMMENT_FIELDS, comment, meta)
+        self._comments_by_debate[comment["debate_id"]].add(comment["id"])
+
+    def remove_debate(self, debate_id: str):
+        """Drop the debate and every comment indexed under it."""
+        self._remove(("debate", debate_id))
+        for comment_id in self._comments_by_debate.pop(debate_id, ()):
+            self._remove(("comment", comment_id))
+
+    def _add(self, key: DocKey, weights: Dict[str, float], source: Dict, meta: Dict):
+        self._remove(key)
+        fields = {name: source.get(name) or "" for name in weights}
+        frequencies: Dict[str, float] = defaultdict(float)
+        length = 0.0
+        for name, weight in weights.items():
+            for term in tokenize(fields[name]):
+                frequencies[term] += weight
+                length += weight
+        for term, frequency in frequencies.items():
+            if term not in self._postings:
+                self._vocabulary = None
+            self._postings[term][key] = frequency
+        self._docs[key] = _Document(key[0], fields, meta, length)
+        self._terms[key] = set(frequencies)
+        self._total_length += length
+
+    def _remove(self, key: DocKey):
+        document = self._docs.pop(key, None)
+        if document is None:
+            return
+        self._total_length -= document.length
+        for term in self._terms.pop(key):
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary = None
+        if document.kind == "comment":
+            comments = self._comments_by_debate.get(document.meta["debate_id"])
+            if comments:
+                comments.discard(key[1])
+
+    # Reads
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        return self._vocabulary[start:end]
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0) -> Dict:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return {"total": 0, "results": []}
+        # Each query term is a group of index terms; the last one also matches as a prefix
+        groups = [[term] if term in self._postings else [] for term in terms[:-1]]
+        groups.append(self._expand_prefix(terms[-1]))
+
+        if not all(groups):
+            return {"total": 0, "results": []}
+
+        count = len(self._docs)
+        average_length = (self._total_length / count if count else 0.0) or 1.0
+        # Rarest group first, so later groups only score documents still in the running
+        groups.sort(key=lambda group: sum(len(self._postings[term]) for term in group))
+        scores: Optional[Dict[DocKey, float]] = None
+        for group in groups:
+            group_scores: Dict[DocKey, float] = {}
+            for term in group:
+                postings = self._postings[term]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if scores is None:
+                    candidates = postings.items()
+                else:
+                    candidates = ((key, postings[key]) for key in scores if key in postings)
+                for key, frequency in candidates:
+                    if kind and key[0] != kind:
+                        continue
+                    norm = 1 - BM25_B + BM25_B * self._docs[key].length / average_length
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                    if score > group_scores.get(key, 0.0):
+                        group_scores[key] = score
+            scores = group_scores if scores is None else {key: scores[key] + group_scores[key] for key in group_scores}
+            if not scores:
+                return {"total": 0, "results": []}
+
+        ranked = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        matchers = (set(terms[:-1]), terms[-1])
+        results = [self._result(key, score, matchers) for key, score in ranked[offset:]]
+        return {"total": len(scores), "results": results}
+
+    def _result(self, key: DocKey, score: float, matchers) -> Dict:
+        document = self._docs[key]
+        highlights = {}
+        for name, text in document.fields.items():
+            snippet = highlight(text, *matchers)
+            if snippet:
+                highlights[name] = snippet
+        return {"type": document.kind, "score": round(score, 4), **document.meta, "highlights": highlights}
+
+
+def highlight(text: str, terms: Set[str], prefix: str, width: int = SNIPPET_CHARS) -> Optional[str]:
+    """HTML-escaped snippet around the first match with every match wrapped in <mark>."""
+    matches = [
+        m for m in TOKEN_RE.finditer(text)
+        if fold(m.group()) in terms or fold(m.group()).startswith(prefix)
+    ]
+    if not matches:
+        return None
+    start = max(0, matches[0].start() - width // 4)
+    end = min(len(text), start + width)
+    parts = ["…" if start > 0 else ""]
+    cursor = start
+    for m in matches:
+        if m.start() < start or m.end() > end:
+            continue
+        parts.append(html.escape(text[cursor:m.start()]))
+        parts.append(f"<mark>{html.escape(m.group())}</mark>")
+        cursor = m.end()
+    parts.append(html.escape(text[cursor:end]))
+    parts.append("…" if end < len(text) else "")
+    return "".join(parts)
+
+
+class SearchService:
+    """Owns the live index: loads it from Mongo, applies local writes, rebuilds periodically."""
+
+    def __init__(self, db, rebuild_interval: float = 300.0):
+        self.db = db
+        self.rebuild_interval = rebuild_interval
+        self.index = SearchIndex()
+        # Writes seen while a rebuild is reading Mongo, replayed onto the new index
+        self._replay: Optional[List[Tuple[str, Dict]]] = None
+        self._task: Optional[asyncio.Task] = None
+        # Mongo _id -> debate id, since change stream deletes only carry the _id
+        self._object_ids: Dict[str, str] = {}
+        self.rebuilds = 0
+
+    async def start(self):
+        await self.rebuild()
+        if self.rebuild_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def rebuild(self):
+        self._replay = []
+        try:
+            index = SearchIndex()
+            projection = {"id": 1, "status": 1, "created_at": 1, **dict.fromkeys(DEBATE_FIELDS, 1)}
+            debate_ids = set()
+            async for debate in self.db.debates.find({}, projection):
+                index.add_debate(debate)
+                debate_ids.add(debate["id"])
+                self._object_ids[str(debate["_id"])] = debate["id"]
+                await _yield_every(len(index))
+            projection = {"_id": 0, "id": 1, "debate_id": 1, "author_name": 1, "created_at": 1, "content": 1}
+            async for comment in self.db.comments.find({}, projection):
+                # Comments outlive their debate in Mongo; keep them out of results
+                if comment["debate_id"] in debate_ids:
+                    index.add_comment(comment)
+                    await _yield_every(len(index))
+            for operation, document in self._replay:
+                _apply(index, operation, document)
+            self.index = index
+            self.rebuilds += 1
+        finally:
+            self._replay = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Search index rebuild failed: {str(e)}")
+
+    def _write(self, operation: str, document: Dict):
+        _apply(self.index, operation, document)
+        if self._replay is not None:
+            self._replay.append((operation, document))
+
+    def debate_saved(self, debate: Dict):
+        if "_id" in debate:
+            self._object_ids[str(debate["_id"])] = debate["id"]
+        self._write("add_debate", debate)
+
+    def debate_deleted(self, debate_id: str):
+        self._write("remove_debate", {"id": debate_id})
+
+    def debate_deleted_by_object_id(self, object_id) -> bool:
+        debate_id = self._object_ids.pop(str(object_id), None)
+        if debate_id is None:
+            return False
+        self.debate_deleted(debate_id)
+        return True
+
+    def comment_saved(self, comment: Dict):
+        self._write("add_comment", comment)
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0) -> Dict:
+        return self.index.search(query, kind, limit, offset)
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.index),
+            "terms": self.index.term_count,
+            "rebuilds": self.rebuilds,
+        }
+
+
+async def _yield_every(count: int, every: int = 500):
+    # Cursor batches are large; let requests run while a big batch is being indexed
+    if count % every == 0:
+        await asyncio.sleep(0)
+
+
+def _apply(index: SearchIndex, operation: str, document: Dict):
+    if operation == "remove_debate":
+        index.remove_debate(document["id"])
+    else:
+        getattr(index, operation)(document)
+
+
+def build_index(debates: Iterable[Dict], comments: Iterable[Dict]) -> SearchIndex:
+    index = SearchIndex()
+    for debate in debates:
+        index.add_debate(debate)
+    for comment in comments:
+        index.add_comment(comment)
+    return index
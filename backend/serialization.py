@@ -0,0 +1,63 @@
+"""Single-pass JSON encoding of Mongo documents for the list endpoints.
+
+Documents are fetched with a projection of exactly the model's fields (so
+``_id`` never leaves Mongo) and, because this app is the only writer, they
+already have the model's shape. ``ListSerializer`` therefore fills in
+plain defaults and hands them straight to orjson. A document missing a
+required field falls back to one Pydantic validation of the whole page,
+done in pydantic-core, instead of the old ``Model(**doc)`` plus
+``response_model`` double pass.
+"""
+from typing import Dict, List, Type
+
+import orjson
+from pydantic import BaseModel, TypeAdapter
+
+
+class _MissingField(Exception):
+    pass
+
+
+def _default(value):
+    # Types orjson does not know natively (e.g. ObjectId in legacy documents)
+    return str(value)
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=_default)
+
+
+class ListSerializer:
+    def __init__(self, model: Type[BaseModel], computed: tuple = ()):
+        """``computed`` names fields filled in per response and never stored."""
+        self.model = model
+        stored = [name for name in model.model_fields if name not in computed]
+        self.projection = {"_id": 0, **{name: 1 for name in stored}}
+        self._required = []
+        self._defaults = {}
+        for name, field in model.model_fields.items():
+            if field.is_required():
+                self._required.append(name)
+            elif field.default_factory is None:
+                self._defaults[name] = field.default
+            else:
+                # Generated ids/timestamps are never missing from stored documents
+                self._required.append(name)
+        self._adapter = TypeAdapter(List[model])
+
+    def _complete(self, doc: Dict) -> Dict:
+        for name in self._required:
+            if name not in doc:
+                raise _MissingField(name)
+        for name, default in self._defaults.items():
+            if name not in doc:
+                doc[name] = default.copy() if isinstance(default, (list, dict)) else default
+        return doc
+
+    def dumps(self, docs: List[Dict], trusted: bool = True) -> bytes:
+        if trusted:
+            try:
+                return dumps([self._complete(doc) for doc in docs])
+            except _MissingField:
+                pass
+        return self._adapter.dump_json(self._adapter.validate_python(docs))
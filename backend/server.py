@@ -1,21 +1,46 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile, Request, Response, Cookie
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, Cookie, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import re
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import jwt
 from passlib.context import CryptContext
-import shutil
 import asyncio
 import json
-import aiohttp
+import base64
+import tempfile
+from database import Database, DatabaseSettings, parse_write_concern
+from indexes import ensure_indexes, unindexed_query_report
+from vote_buffer import VoteBuffer
+from session_cache import SessionCache
+from response_cache import ResponseCache
+from serialization import ListSerializer
+from participants import migrate_embedded_participants
+from lifecycle import LifecycleScheduler, UPCOMING, ACTIVE, COMPLETED
+from search import DEBATE_FIELDS, SearchService
+from invalidation import InvalidationHub, WriteVersionBumper, Change, ANY
+from metrics import MetricsRegistry, MetricsMiddleware, MongoCommandMetrics
+from slow_queries import SlowQueryRecorder
+from profiling import ProfileStore, ProfilerMiddleware
+from tracing import Tracer, TracingMiddleware, MongoCommandTracer, FileSpanExporter, OtlpHttpSpanExporter
+from notifications import NotificationDispatcher, LoggingPushSender, HttpPushSender
+from http_client import HttpClient, RetryBudget
+from photo_storage import MAX_FIELD_BYTES, MalformedUpload, PhotoBlobStore, UploadTooLarge, blob_filename, receive_multipart
+from image_derivatives import DerivativeGenerator
+from storage_backends import LocalStorage, storage_from_env
+from realtime import DebateBroadcaster, StreamRefresher, TooManyConnections, format_event
+from photo_serving import serve_immutable_file
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -28,10 +53,57 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Prometheus metrics, scraped from /metrics
+metrics_registry = MetricsRegistry()
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Commands over SLOW_QUERY_MS are sampled with an explain plan for /api/admin/slow-queries
+slow_query_recorder = SlowQueryRecorder(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', '100')),
+    capacity=int(os.environ.get('SLOW_QUERY_BUFFER', '500')),
+    explain_interval=float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', '60')),
+    log_path=os.environ.get('SLOW_QUERY_LOG')
+)
+
+# Request profiles, see profiling.py; off unless PROFILING_ENABLED=true
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', '0'))
+profile_store = ProfileStore(
+    Path(os.environ.get('PROFILE_DIR', str(Path(tempfile.gettempdir()) / "debate-club-profiles"))),
+    keep=int(os.environ.get('PROFILE_KEEP', '50'))
+)
+
+# Tracing is off unless TRACE_EXPORTER is set: =file writes OTLP/JSON lines to TRACE_FILE
+# (default under the system temp dir), =otlp posts to OTEL_EXPORTER_OTLP_ENDPOINT
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', '').lower()
+tracer = Tracer(
+    enabled=TRACE_EXPORTER in ('file', 'otlp'),
+    sample_ratio=float(os.environ.get('TRACE_SAMPLE_RATIO', '1.0')),
+    service_name=os.environ.get('OTEL_SERVICE_NAME', 'debate-club-api')
+)
+
+# Cross-worker cache invalidation (INVALIDATION_MODE=auto|change_stream|polling|off); in polling
+# mode this worker's own writes bump the shared collection versions
+INVALIDATION_MODE = os.environ.get('INVALIDATION_MODE', 'auto').lower()
+# Vote writes bump nothing, neither the votes nor the counter $inc on their debate: flushing every
+# worker's listings per vote costs more than tallies that catch up on the next debate write. Open
+# streams do not wait for that, the StreamRefresher reads their counters every few seconds.
+write_version_bumper = WriteVersionBumper(
+    ignore=("votes",),
+    ignore_fields={"debates": ("votes_for", "votes_against", "applied_batches")}
+)
+invalidation_hub: Optional[InvalidationHub] = None
+
+# MongoDB, opened on startup from MONGO_* settings (see database.py). Every command
+# passes through the metrics, slow query, tracing and invalidation listeners.
+MONGO_LISTENERS = [
+    MongoCommandMetrics(metrics_registry), slow_query_recorder, MongoCommandTracer(tracer), write_version_bumper
+]
+# Swapped out by tooling that runs the app against a stand-in (see benchmarks/load_test.py)
+mongo_client_factory = AsyncIOMotorClient
+database: Optional[Database] = None
+# database.primary, for the many routes without a more specific handle
+db: Optional[AsyncIOMotorDatabase] = None
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -39,9 +111,87 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Outbound HTTP (auth upstream, push gateway), started on app startup
+EMERGENT_AUTH_URL = os.environ.get('EMERGENT_AUTH_URL', 'https://demobackend.emergentagent.com').rstrip('/')
+EMERGENT_AUTH_TIMEOUT = float(os.environ.get('EMERGENT_AUTH_TIMEOUT_SECONDS', '5'))
+http_client = HttpClient(
+    limit=int(os.environ.get('HTTP_POOL_SIZE', '100')),
+    limit_per_host=int(os.environ.get('HTTP_POOL_SIZE_PER_HOST', '20')),
+    timeout=float(os.environ.get('HTTP_TIMEOUT_SECONDS', '10')),
+    retries=int(os.environ.get('HTTP_RETRIES', '2')),
+    retry_budget=RetryBudget(ratio=float(os.environ.get('HTTP_RETRY_BUDGET_RATIO', '0.2'))),
+    failure_threshold=int(os.environ.get('HTTP_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.environ.get('HTTP_BREAKER_RESET_SECONDS', '30')),
+    tracer=tracer
+)
+
+# Resolved sessions, so authenticated requests skip the sessions/users lookups
+session_cache = SessionCache(
+    max_entries=int(os.environ.get('SESSION_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60'))
+)
+
+# Serialized /debates and /photos listings, invalidated by every write to those collections
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', '256')),
+    compress_min_bytes=int(os.environ.get('RESPONSE_CACHE_GZIP_MIN_BYTES', '1024'))
+)
+
+# Push notification fan-out, started on app startup
+notification_dispatcher: Optional[NotificationDispatcher] = None
+
+# Live debate deltas over Server-Sent Events
+debate_broadcaster = DebateBroadcaster(
+    max_connections=int(os.environ.get('STREAM_MAX_CONNECTIONS', '1000')),
+    queue_size=int(os.environ.get('STREAM_QUEUE_SIZE', '32')),
+    heartbeat_interval=float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '15'))
+)
+# Debate fields whose changes other workers relay as "tally" events
+STREAM_COUNTERS = ("votes_for", "votes_against", "participant_count")
+# Polling mode only (see relay_to_streams)
+stream_refresher: Optional[StreamRefresher] = None
+
+# Write-behind vote buffering (off by default: every vote is written synchronously)
+VOTE_WRITE_BEHIND = os.environ.get('VOTE_WRITE_BEHIND', 'false').lower() == 'true'
+vote_buffer: Optional[VoteBuffer] = None
+
+# Flips debate status at start_time/end_time; every worker runs one, a CAS picks the winner
+DEBATE_LIFECYCLE = os.environ.get('DEBATE_LIFECYCLE', 'true').lower() == 'true'
+lifecycle_scheduler: Optional[LifecycleScheduler] = None
+# ?status= also accepts these names
+STATUS_ALIASES = {"live": ACTIVE, "finished": COMPLETED}
+
+# In-process full-text index over debates and comments, loaded on startup
+search_service: Optional[SearchService] = None
+
+# Cursor pagination for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Documents are only written by this app; set to false to validate every listed document
+TRUST_STORED_DOCUMENTS = os.environ.get('TRUST_STORED_DOCUMENTS', 'true').lower() == 'true'
+
 # Upload directory
 UPLOAD_DIR = Path(ROOT_DIR) / "uploads" / "photos"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+RENDITION_DIR = Path(ROOT_DIR) / "uploads" / "renditions"
+RENDITION_DIR.mkdir(parents=True, exist_ok=True)
+# Local disk by default; PHOTO_STORAGE=s3 moves photo bytes to a bucket
+photo_storage = storage_from_env(Path(ROOT_DIR) / "uploads")
+PRESIGNED_URL_EXPIRES = int(os.environ.get('PRESIGNED_URL_EXPIRES_SECONDS', '900'))
+# Public URL prefix for uploaded files; defaults to the API's own file route
+PHOTO_BASE_URL = os.environ.get('PHOTO_BASE_URL', '/api/uploads').rstrip('/')
+UPLOAD_FOLDERS = {"photos": UPLOAD_DIR, "renditions": RENDITION_DIR}
+# Renditions are written here first, then handed to photo_storage
+derivative_generator = DerivativeGenerator(
+    RENDITION_DIR,
+    max_workers=int(os.environ['IMAGE_WORKERS']) if os.environ.get('IMAGE_WORKERS') else None
+)
+# Needs the database, so built on startup
+photo_store: Optional[PhotoBlobStore] = None
+# Keeps references to in-flight rendition jobs so they are not garbage collected
+derivative_tasks = set()
 
 # Pydantic Models
 class AdminLogin(BaseModel):
@@ -61,6 +211,12 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+def check_utc_offset(value: datetime) -> datetime:
+    """Naive UTC as stored; a time without an offset is refused rather than guessed at"""
+    if value.tzinfo is None:
+        raise ValueError("Saat dilimi belirtilmeli, ör. 2026-05-01T18:00:00+03:00")
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 class DebateCreate(BaseModel):
     title: str
     description: str
@@ -69,6 +225,8 @@ class DebateCreate(BaseModel):
     end_time: datetime
     status: str = "upcoming"
 
+    _check_times = field_validator("start_time", "end_time")(check_utc_offset)
+
 class Debate(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -80,7 +238,7 @@ class Debate(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     votes_for: int = 0
     votes_against: int = 0
-    participants: List[str] = []
+    participant_count: int = 0  # names live in the participants collection
     created_by: Optional[str] = None  # Admin who created it
 
 class VoteRequest(BaseModel):
@@ -104,6 +262,12 @@ class ParticipantJoin(BaseModel):
     debate_id: str
     participant_name: str
 
+class Participant(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    debate_id: str
+    participant_name: str
+    joined_at: datetime = Field(default_factory=datetime.utcnow)
+
 class PushSubscription(BaseModel):
     endpoint: str
     keys: Dict[str, str]
@@ -114,6 +278,12 @@ class NotificationPayload(BaseModel):
     icon: Optional[str] = "/icon-192x192.png"
     url: Optional[str] = "/"
 
+class PhotoRendition(BaseModel):
+    width: int
+    height: int
+    content_type: str
+    filename: str
+
 class Photo(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
@@ -123,12 +293,124 @@ class Photo(BaseModel):
     event_date: datetime
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     file_path: str
+    content_hash: Optional[str] = None  # SHA-256 of the stored file
+    size: Optional[int] = None
+    renditions: List[PhotoRendition] = []
+    placeholder: Optional[str] = None  # tiny inline JPEG shown while loading
+    # Computed for responses, never stored
+    url: Optional[str] = None
+    srcset: Dict[str, str] = {}  # content type -> "url 320w, url 640w, ..."
 
 class PhotoCreate(BaseModel):
     title: str
     description: str
     event_date: str
 
+SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+def check_sha256(value: str) -> str:
+    """Lowercase hex digest; it becomes part of a storage key, so nothing else gets through"""
+    value = value.lower()
+    if not SHA256_HEX.fullmatch(value):
+        raise ValueError("sha256 must be a 64 character hex digest")
+    return value
+
+class PhotoUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+
+    _check_sha256 = field_validator("sha256")(check_sha256)
+
+class PhotoUploadComplete(BaseModel):
+    sha256: str
+    filename: str
+    title: str = ""
+    description: str = ""
+    event_date: str = ""
+
+    _check_sha256 = field_validator("sha256")(check_sha256)
+
+# List endpoints encode projected documents directly instead of validating them twice
+debate_serializer = ListSerializer(Debate)
+comment_serializer = ListSerializer(Comment)
+participant_serializer = ListSerializer(Participant)
+photo_serializer = ListSerializer(Photo, computed=("url", "srcset"))
+
+# Pagination helpers
+def encode_cursor(sort_value: datetime, item_id: str) -> str:
+    raw = json.dumps([sort_value.isoformat(), item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, item_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), str(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci")
+
+async def fetch_page(collection, query: dict, sort_field: str, limit: int, cursor: Optional[str], projection: Optional[dict] = None):
+    """Keyset pagination on (sort_field, id) descending; returns the page and the next cursor (or None)"""
+    if cursor:
+        sort_value, item_id = decode_cursor(cursor)
+        query = {
+            **query,
+            "$or": [
+                {sort_field: {"$lt": sort_value}},
+                {sort_field: sort_value, "id": {"$lt": item_id}}
+            ]
+        }
+    # Fetch one extra document to know whether another page exists
+    docs = await collection.find(query, projection).sort([(sort_field, -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1][sort_field], docs[-1]["id"])
+    return docs, None
+
+async def cached_listing(request: Request, collection: str, serializer: ListSerializer, build):
+    """Serve a listing from response_cache; ``build`` returns (documents, next_cursor) on a miss"""
+    key = str(request.url.query)
+    cached = response_cache.get(collection, key)
+    if cached is None:
+        # Version is read before querying so a concurrent write discards this body
+        version = response_cache.version(collection)
+        docs, next_cursor = await build()
+        body = serializer.dumps(docs, trusted=TRUST_STORED_DOCUMENTS)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        cached = response_cache.put(collection, version, key, body, headers)
+    return cached.respond(request)
+
+# Photo helpers
+def with_photo_urls(photo: dict) -> dict:
+    """Add the original's URL and a srcset per rendition format to a photo document"""
+    photo["url"] = f"{PHOTO_BASE_URL}/photos/{photo['filename']}"
+    srcset = {}
+    for rendition in photo.get("renditions", []):
+        srcset.setdefault(rendition["content_type"], []).append(
+            f"{PHOTO_BASE_URL}/renditions/{rendition['filename']} {rendition['width']}w"
+        )
+    photo["srcset"] = {content_type: ", ".join(entries) for content_type, entries in srcset.items()}
+    return photo
+
+async def build_renditions(photo: dict):
+    # Renditions are named after the blob, so another photo of the same bytes may already have them
+    existing = await db.photos.find_one(
+        {"content_hash": photo["content_hash"], "filename": photo["filename"], "renditions.0": {"$exists": True}},
+        {"_id": 0, "renditions": 1, "placeholder": 1}
+    )
+    if existing:
+        await db.photos.update_one({"id": photo["id"]}, {"$set": existing})
+    elif not await derivative_generator.generate_for_photo(db, photo_storage, photo):
+        return
+    response_cache.invalidate("photos")
+
+def schedule_derivatives(photo: dict):
+    task = asyncio.create_task(build_renditions(photo))
+    derivative_tasks.add(task)
+    task.add_done_callback(derivative_tasks.discard)
+
 # Authentication functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -146,15 +428,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_admin_token(token: str) -> Optional[str]:
+    """Admin username from a JWT issued by /api/admin/login, or None"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Geçersiz kimlik doğrulama bilgileri")
-        return username
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.PyJWTError:
+        return None
+    return payload.get("sub")
+
+async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    username = decode_admin_token(credentials.credentials)
+    if username is None:
         raise HTTPException(status_code=401, detail="Geçersiz kimlik doğrulama bilgileri")
+    return username
+
+def is_admin_authorization(authorization: Optional[str]) -> bool:
+    """Profiler gate: a Bearer admin token in the raw Authorization header"""
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and decode_admin_token(token) is not None
 
 async def get_current_user(request: Request):
     """Get current user from session cookie or Authorization header"""
@@ -172,6 +463,10 @@ async def get_current_user(request: Request):
     if not session_token:
         raise HTTPException(status_code=401, detail="Kimlik doğrulama gerekli")
     
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
+    
     # Verify session token in database
     session = await db.sessions.find_one({"session_token": session_token})
     if not session or session["expires_at"] < datetime.utcnow():
@@ -182,40 +477,34 @@ async def get_current_user(request: Request):
     if not user:
         raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
     
-    return User(**user)
+    user = User(**user)
+    session_cache.put(session_token, user, session["expires_at"], session["user_id"], session["_id"])
+    return user
 
 async def get_session_data_from_emergent(session_id: str):
     """Get user data from Emergent Auth API"""
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    return None
-        except Exception as e:
-            logging.error(f"Error getting session data from Emergent: {str(e)}")
+    try:
+        response = await http_client.request(
+            "GET",
+            f"{EMERGENT_AUTH_URL}/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id},
+            timeout=EMERGENT_AUTH_TIMEOUT
+        )
+        if response.status == 200:
+            return response.json()
+        else:
             return None
+    except Exception as e:
+        logging.error(f"Error getting session data from Emergent: {str(e)}")
+        return None
 
 # Bildirim gönderme fonksiyonu
-async def send_push_notification(payload: NotificationPayload):
-    """Push bildirimi gönder (gerçek implementasyon için push servisi gerekir)"""
-    try:
-        # Push notification subscriptions'ları al
-        subscriptions = await db.push_subscriptions.find().to_list(1000)
-        
-        for subscription in subscriptions:
-            # Burada gerçek push notification servisi kullanılmalı
-            # Şimdilik sadece log'lıyoruz
-            logging.info(f"Push notification sent: {payload.title} - {payload.body}")
-        
-        return True
-    except Exception as e:
-        logging.error(f"Push notification error: {str(e)}")
+def send_push_notification(payload: NotificationPayload, coalesce_key: Optional[str] = None, summary=None):
+    """Push bildirimini kuyruğa ekle; gönderim arka plan işçilerinde yapılır"""
+    if notification_dispatcher is None:
+        logging.error(f"Notification dispatcher not running, dropping: {payload.title}")
         return False
+    return notification_dispatcher.enqueue(payload.dict(), coalesce_key=coalesce_key, summary=summary)
 
 # Routes
 @api_router.post("/admin/login", response_model=Token)
@@ -237,20 +526,26 @@ async def auth_callback(request: Request, response: Response, session_id: str):
         if not user_data:
             raise HTTPException(status_code=400, detail="Geçersiz oturum")
         
-        # Check if user exists, if not create new user
-        existing_user = await db.users.find_one({"email": user_data["email"]})
-        if not existing_user:
-            # Create new user
-            user = User(
-                email=user_data["email"],
-                name=user_data["name"],
-                picture=user_data.get("picture"),
-                session_token=user_data["session_token"]
+        # Create the user on first login; the unique email index makes this atomic
+        user = User(
+            email=user_data["email"],
+            name=user_data["name"],
+            picture=user_data.get("picture"),
+            session_token=user_data["session_token"]
+        )
+        new_user = {key: value for key, value in user.dict().items() if key != "email"}
+        try:
+            existing_user = await db.users.find_one_and_update(
+                {"email": user_data["email"]},
+                {"$setOnInsert": new_user},
+                projection={"_id": 0, "id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
             )
-            await db.users.insert_one(user.dict())
-            user_id = user.id
-        else:
-            user_id = existing_user["id"]
+        except DuplicateKeyError:
+            # A concurrent first login of the same user inserted it
+            existing_user = await db.users.find_one({"email": user_data["email"]}, {"_id": 0, "id": 1})
+        user_id = existing_user["id"]
         
         # Create/update session
         expires_at = datetime.utcnow() + timedelta(days=7)
@@ -263,6 +558,8 @@ async def auth_callback(request: Request, response: Response, session_id: str):
         
         # Remove existing sessions for this user
         await db.sessions.delete_many({"user_id": user_id})
+        session_cache.invalidate_user(user_id)
+        session_cache.invalidate(user_data["session_token"])
         await db.sessions.insert_one(session_record)
         
         # Set session cookie
@@ -297,6 +594,7 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.sessions.delete_many({"session_token": session_token})
+        session_cache.invalidate(session_token)
     
     response.delete_cookie("session_token", path="/")
     return {"message": "Çıkış yapıldı"}
@@ -306,9 +604,14 @@ async def logout(request: Request, response: Response):
 async def create_debate(debate: DebateCreate, current_admin: str = Depends(get_current_admin)):
     debate_obj = Debate(**debate.dict(), created_by=current_admin)
     await db.debates.insert_one(debate_obj.dict())
+    response_cache.invalidate("debates")
+    if lifecycle_scheduler:
+        lifecycle_scheduler.schedule(debate_obj.dict())
+    if search_service:
+        search_service.debate_saved(debate_obj.dict())
     
     # Yeni münazara bildirimi gönder
-    await send_push_notification(NotificationPayload(
+    send_push_notification(NotificationPayload(
         title="Yeni Münazara!",
         body=f"'{debate.title}' başlıklı yeni münazara eklendi",
         url="/"
@@ -317,17 +620,65 @@ async def create_debate(debate: DebateCreate, current_admin: str = Depends(get_c
     return debate_obj
 
 @api_router.get("/debates", response_model=List[Debate])
-async def get_debates():
-    debates = await db.debates.find().to_list(1000)
-    return [Debate(**debate) for debate in debates]
+async def get_debates(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None
+):
+    query = {}
+    if status:
+        status = STATUS_ALIASES.get(status, status)
+        if status not in (UPCOMING, ACTIVE, COMPLETED):
+            raise HTTPException(status_code=400, detail="Geçersiz münazara durumu")
+        query["status"] = status
+    
+    async def build():
+        debates, next_cursor = await fetch_page(
+            database.listing.debates, query, "created_at", limit, cursor, debate_serializer.projection
+        )
+        if vote_buffer:
+            debates = [vote_buffer.merge_pending(debate) for debate in debates]
+        return debates, next_cursor
+    return await cached_listing(request, "debates", debate_serializer, build)
 
 @api_router.get("/debates/{debate_id}", response_model=Debate)
 async def get_debate(debate_id: str):
-    debate = await db.debates.find_one({"id": debate_id})
+    debate = await db.debates.find_one({"id": debate_id}, debate_serializer.projection)
     if not debate:
         raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    if vote_buffer:
+        debate = vote_buffer.merge_pending(debate)
     return Debate(**debate)
 
+@api_router.get("/debates/{debate_id}/stream")
+async def stream_debate(debate_id: str):
+    """Server-Sent Events: tally, participant and comment deltas for one debate"""
+    debate = await db.debates.find_one(
+        {"id": debate_id},
+        {"_id": 1, "id": 1, "votes_for": 1, "votes_against": 1, "participant_count": 1}
+    )
+    if not debate:
+        raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    if vote_buffer:
+        debate = vote_buffer.merge_pending(debate)
+    try:
+        subscriber = debate_broadcaster.subscribe(debate_id, debate["_id"])
+    except TooManyConnections:
+        raise HTTPException(status_code=503, detail="Çok fazla canlı bağlantı, lütfen daha sonra tekrar deneyin")
+    
+    # First event is a snapshot so the client needs no separate fetch
+    snapshot = format_event("snapshot", {
+        "votes_for": debate.get("votes_for", 0),
+        "votes_against": debate.get("votes_against", 0),
+        "participant_count": debate.get("participant_count", 0)
+    })
+    return StreamingResponse(
+        debate_broadcaster.stream(subscriber, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.put("/debates/{debate_id}", response_model=Debate)
 async def update_debate(debate_id: str, debate_update: DebateCreate, current_admin: str = Depends(get_current_admin)):
     existing_debate = await db.debates.find_one({"id": debate_id})
@@ -336,8 +687,16 @@ async def update_debate(debate_id: str, debate_update: DebateCreate, current_adm
     
     update_data = debate_update.dict()
     await db.debates.update_one({"id": debate_id}, {"$set": update_data})
+    response_cache.invalidate("debates")
     
-    updated_debate = await db.debates.find_one({"id": debate_id})
+    updated_debate = await db.debates.find_one({"id": debate_id}, debate_serializer.projection)
+    if not updated_debate:
+        # Deleted between the update and the read
+        raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    if lifecycle_scheduler:
+        lifecycle_scheduler.schedule(updated_debate)
+    if search_service:
+        search_service.debate_saved(updated_debate)
     return Debate(**updated_debate)
 
 @api_router.delete("/debates/{debate_id}")
@@ -345,6 +704,10 @@ async def delete_debate(debate_id: str, current_admin: str = Depends(get_current
     result = await db.debates.delete_one({"id": debate_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    await db.participants.delete_many({"debate_id": debate_id})
+    response_cache.invalidate("debates")
+    if search_service:
+        search_service.debate_deleted(debate_id)
     return {"message": "Münazara başarıyla silindi"}
 
 # Push notification endpoints
@@ -352,20 +715,22 @@ async def delete_debate(debate_id: str, current_admin: str = Depends(get_current
 async def subscribe_to_notifications(subscription: PushSubscription):
     """Push notification aboneliği oluştur"""
     try:
-        # Mevcut aboneliği kontrol et
-        existing = await db.push_subscriptions.find_one({"endpoint": subscription.endpoint})
-        if existing:
-            return {"message": "Zaten abone olunmuş"}
-        
-        # Yeni abonelik oluştur
+        # Yeni abonelik oluştur; benzersiz endpoint indeksi eşzamanlı istekleri de ayıklar
         subscription_data = {
             "id": str(uuid.uuid4()),
-            "endpoint": subscription.endpoint,
             "keys": subscription.keys,
             "created_at": datetime.utcnow()
         }
-        
-        await db.push_subscriptions.insert_one(subscription_data)
+        try:
+            result = await db.push_subscriptions.update_one(
+                {"endpoint": subscription.endpoint},
+                {"$setOnInsert": subscription_data},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            result = None
+        if result is None or result.upserted_id is None:
+            return {"message": "Zaten abone olunmuş"}
         return {"message": "Bildirim aboneliği başarıyla oluşturuldu"}
         
     except Exception as e:
@@ -385,22 +750,57 @@ async def unsubscribe_from_notifications(endpoint: str):
 @api_router.post("/notifications/send")
 async def send_notification(payload: NotificationPayload, current_admin: str = Depends(get_current_admin)):
     """Manuel bildirim gönder (admin only)"""
-    success = await send_push_notification(payload)
+    success = send_push_notification(payload)
     if success:
         return {"message": "Bildirim gönderildi"}
     else:
         raise HTTPException(status_code=500, detail="Bildirim gönderilemedi")
 
-@api_router.post("/debates/vote")
-async def vote_on_debate(vote: VoteRequest):
-    debate = await db.debates.find_one({"id": vote.debate_id})
+async def record_vote_buffered(vote: VoteRequest, vote_record: dict):
+    """Write-behind vote path: only reads hit Mongo, the write is acknowledged from memory"""
+    debate = await db.debates.find_one(
+        {"id": vote.debate_id},
+        {"_id": 0, "id": 1, "title": 1, "votes_for": 1, "votes_against": 1}
+    )
     if not debate:
         raise HTTPException(status_code=404, detail="Münazara bulunamadı")
     
-    existing_vote = await db.votes.find_one({"debate_id": vote.debate_id, "voter_name": vote.voter_name})
-    if existing_vote:
+    # Buffer before Mongo: a vote flushed during the read below was already visible to this check
+    if vote_buffer.has_pending_vote(vote.debate_id, vote.voter_name):
+        raise HTTPException(status_code=400, detail="Bu münazarada zaten oy kullandınız")
+    existing_vote = await db.votes.find_one({"debate_id": vote.debate_id, "voter_name": vote.voter_name}, {"_id": 1})
+    if existing_vote or not vote_buffer.add(vote_record):
         raise HTTPException(status_code=400, detail="Bu münazarada zaten oy kullandınız")
     
+    return vote_buffer.merge_pending(debate)
+
+async def record_vote(vote: VoteRequest, vote_record: dict):
+    # The unique (debate_id, voter_name) index makes this the only duplicate check
+    try:
+        result = await database.votes.votes.update_one(
+            {"debate_id": vote.debate_id, "voter_name": vote.voter_name},
+            {"$setOnInsert": vote_record},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        result = None
+    if result is None or result.upserted_id is None:
+        raise HTTPException(status_code=400, detail="Bu münazarada zaten oy kullandınız")
+    
+    counter = "votes_for" if vote.vote_type == "for" else "votes_against"
+    debate = await database.votes.debates.find_one_and_update(
+        {"id": vote.debate_id},
+        {"$inc": {counter: 1}},
+        projection={"_id": 0, "title": 1, "votes_for": 1, "votes_against": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not debate:
+        await database.votes.votes.delete_one({"_id": result.upserted_id})
+        raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    return debate
+
+@api_router.post("/debates/vote")
+async def vote_on_debate(vote: VoteRequest):
     vote_record = {
         "id": str(uuid.uuid4()),
         "debate_id": vote.debate_id,
@@ -408,89 +808,260 @@ async def vote_on_debate(vote: VoteRequest):
         "voter_name": vote.voter_name,
         "created_at": datetime.utcnow()
     }
-    await db.votes.insert_one(vote_record)
-    
-    if vote.vote_type == "for":
-        await db.debates.update_one({"id": vote.debate_id}, {"$inc": {"votes_for": 1}})
+    if vote_buffer:
+        debate = await record_vote_buffered(vote, vote_record)
     else:
-        await db.debates.update_one({"id": vote.debate_id}, {"$inc": {"votes_against": 1}})
+        debate = await record_vote(vote, vote_record)
+    response_cache.invalidate("debates")
     
-    # Oy bildirimi gönder
+    # Oy bildirimi gönder (aynı münazaradaki oylar tek bildirimde birleştirilir)
     vote_text = "lehinde" if vote.vote_type == "for" else "aleyhinde"
-    await send_push_notification(NotificationPayload(
-        title="Yeni Oy!",
-        body=f"'{debate['title']}' münazarasında {vote_text} yeni oy",
-        url="/"
-    ))
+    send_push_notification(
+        NotificationPayload(
+            title="Yeni Oy!",
+            body=f"'{debate['title']}' münazarasında {vote_text} yeni oy",
+            url="/"
+        ),
+        coalesce_key=f"vote:{vote.debate_id}",
+        summary=lambda count: f"'{debate['title']}' münazarasında {count} yeni oy"
+    )
+    
+    tally = {"votes_for": debate.get("votes_for", 0), "votes_against": debate.get("votes_against", 0)}
+    publish_debate_event(vote.debate_id, "tally", tally)
     
-    return {"message": "Oy başarıyla kaydedildi"}
+    return {"message": "Oy başarıyla kaydedildi", **tally}
 
 @api_router.post("/debates/join")
 async def join_debate(participant: ParticipantJoin):
-    debate = await db.debates.find_one({"id": participant.debate_id})
-    if not debate:
+    if not await db.debates.find_one({"id": participant.debate_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="Münazara bulunamadı")
     
-    if participant.participant_name in debate.get("participants", []):
+    # The unique (debate_id, participant_name) index makes the join atomic
+    participant_obj = Participant(**participant.dict())
+    try:
+        await db.participants.insert_one(participant_obj.dict())
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Bu münazaraya zaten katıldınız")
     
-    await db.debates.update_one(
-        {"id": participant.debate_id}, 
-        {"$push": {"participants": participant.participant_name}}
+    debate = await db.debates.find_one_and_update(
+        {"id": participant.debate_id},
+        {"$inc": {"participant_count": 1}},
+        projection={"_id": 0, "participant_count": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if not debate:
+        # Debate deleted between the check and the insert
+        await db.participants.delete_one({"debate_id": participant.debate_id, "participant_name": participant.participant_name})
+        raise HTTPException(status_code=404, detail="Münazara bulunamadı")
+    response_cache.invalidate("debates")
+    publish_debate_event(participant.debate_id, "participant", {
+        "participant_name": participant.participant_name,
+        "participant_count": debate["participant_count"]
+    })
     
-    return {"message": "Münazaraya başarıyla katıldınız"}
+    return {"message": "Münazaraya başarıyla katıldınız", "participant_count": debate["participant_count"]}
+
+@api_router.get("/debates/{debate_id}/participants", response_model=List[Participant])
+async def get_participants(
+    debate_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    participants, next_cursor = await fetch_page(
+        database.listing.participants, {"debate_id": debate_id}, "joined_at", limit, cursor, participant_serializer.projection
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return Response(
+        participant_serializer.dumps(participants, trusted=TRUST_STORED_DOCUMENTS),
+        headers=headers,
+        media_type="application/json"
+    )
+
+# Search
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Münazara ve yorumlarda tam metin arama (Türkçe büyük/küçük harf duyarsız)"""
+    if type not in (None, "debate", "comment"):
+        raise HTTPException(status_code=400, detail="Geçersiz arama türü")
+    if search_service is None:
+        raise HTTPException(status_code=503, detail="Arama dizini hazır değil")
+    return {"query": q, **search_service.search(q, type, limit, offset)}
 
 # Comment Routes
 @api_router.post("/comments", response_model=Comment)
 async def create_comment(comment: CommentCreate):
     comment_obj = Comment(**comment.dict())
     await db.comments.insert_one(comment_obj.dict())
+    if search_service:
+        search_service.comment_saved(comment_obj.dict())
+    publish_debate_event(comment.debate_id, "comment", comment_obj.dict())
     return comment_obj
 
 @api_router.get("/comments/{debate_id}", response_model=List[Comment])
-async def get_comments(debate_id: str):
-    comments = await db.comments.find({"debate_id": debate_id}).sort("created_at", -1).to_list(1000)
-    return [Comment(**comment) for comment in comments]
+async def get_comments(
+    debate_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    comments, next_cursor = await fetch_page(
+        database.listing.comments, {"debate_id": debate_id}, "created_at", limit, cursor, comment_serializer.projection
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return Response(
+        comment_serializer.dumps(comments, trusted=TRUST_STORED_DOCUMENTS),
+        headers=headers,
+        media_type="application/json"
+    )
 
 # Photo Routes
 @api_router.post("/photos/upload")
 async def upload_photo(
-    file: UploadFile = File(...),
+    request: Request,
     title: str = "",
     description: str = "",
     event_date: str = "",
     current_admin: str = Depends(get_current_admin)
 ):
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    """Multipart upload of one image in the ``file`` part; title etc. as form fields or query parameters"""
+    # Parsed as it streams in: a File() parameter would spool the whole body before the size check
+    too_large = HTTPException(status_code=413, detail=f"File must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MAX_FIELD_BYTES:
+        raise too_large
     
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
+    # Save file under its content hash (streamed in chunks, written off the event loop)
+    try:
+        fields, upload = await receive_multipart(
+            request.headers.get("content-type", ""), request.stream(), UPLOAD_DIR, MAX_UPLOAD_BYTES
+        )
+    except UploadTooLarge:
+        raise too_large
+    except MalformedUpload as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {str(e)}")
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    if not upload.content_type.startswith('image/'):
+        await asyncio.to_thread(upload.path.unlink, missing_ok=True)
+        raise HTTPException(status_code=400, detail="File must be an image")
+    title = fields.get("title", title)
+    description = fields.get("description", description)
+    event_date = fields.get("event_date", event_date)
+    stored = await photo_store.store_upload(upload, Path(upload.filename).suffix)
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Create photo record; without it nothing would ever drop the blob reference
+    try:
+        photo_obj = Photo(
+            filename=stored.filename,
+            original_name=upload.filename,
+            title=title,
+            description=description,
+            event_date=datetime.fromisoformat(event_date) if event_date else datetime.utcnow(),
+            file_path=stored.location,
+            content_hash=stored.sha256,
+            size=stored.size
+        )
+        await db.photos.insert_one(photo_obj.dict(exclude={"url", "srcset"}))
+    except BaseException:
+        await photo_store.release({"content_hash": stored.sha256, "filename": stored.filename})
+        raise
+    response_cache.invalidate("photos")
+    # Thumbnails are produced in the process pool after the response is sent
+    schedule_derivatives(photo_obj.dict())
+    return {"message": "Photo uploaded successfully", "photo_id": photo_obj.id}
+
+@api_router.post("/photos/presign")
+async def presign_photo_upload(upload: PhotoUploadRequest, current_admin: str = Depends(get_current_admin)):
+    """Presigned PUT so the client uploads straight to storage (S3 only)"""
+    if not photo_storage.supports_presigned_urls:
+        raise HTTPException(status_code=400, detail="Direct uploads require PHOTO_STORAGE=s3")
+    if not upload.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    sha256 = upload.sha256
     
-    # Create photo record
-    photo_obj = Photo(
-        filename=unique_filename,
-        original_name=file.filename,
-        title=title,
-        description=description,
-        event_date=datetime.fromisoformat(event_date) if event_date else datetime.utcnow(),
-        file_path=str(file_path)
-    )
+    # Identical bytes are already stored: skip the upload, just complete it
+    blob = await db.photo_blobs.find_one({"content_hash": sha256}, {"_id": 0, "filename": 1})
+    filename = blob["filename"] if blob else blob_filename(sha256, Path(upload.filename).suffix)
+    if await photo_storage.exists(f"photos/{filename}"):
+        return {"upload_required": False}
     
-    await db.photos.insert_one(photo_obj.dict())
+    return {
+        "upload_required": True,
+        "expires_in": PRESIGNED_URL_EXPIRES,
+        **photo_storage.presigned_put(f"photos/{filename}", upload.content_type, sha256, PRESIGNED_URL_EXPIRES)
+    }
+
+@api_router.post("/photos/complete")
+async def complete_photo_upload(upload: PhotoUploadComplete, current_admin: str = Depends(get_current_admin)):
+    """Create the photo record for bytes uploaded through /photos/presign"""
+    if not photo_storage.supports_presigned_urls:
+        raise HTTPException(status_code=400, detail="Direct uploads require PHOTO_STORAGE=s3")
+    sha256 = upload.sha256
+    blob = await db.photo_blobs.find_one({"content_hash": sha256}, {"_id": 0, "filename": 1})
+    filename = blob["filename"] if blob else blob_filename(sha256, Path(upload.filename).suffix)
+    key = f"photos/{filename}"
+    size = await photo_storage.size(key)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Uploaded file not found in storage")
+    if size > MAX_UPLOAD_BYTES and not blob:
+        await photo_storage.delete(key)
+        raise HTTPException(status_code=413, detail=f"File must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    blob = await photo_store.acquire(sha256, filename, size)
+    try:
+        # A release of the same bytes may have deleted the file while acquire waited
+        if not await photo_storage.exists(key):
+            raise HTTPException(status_code=400, detail="Uploaded file not found in storage")
+        photo_obj = Photo(
+            filename=filename,
+            original_name=upload.filename,
+            title=upload.title,
+            description=upload.description,
+            event_date=datetime.fromisoformat(upload.event_date) if upload.event_date else datetime.utcnow(),
+            file_path=photo_storage.location(key),
+            content_hash=sha256,
+            size=size
+        )
+        await db.photos.insert_one(photo_obj.dict(exclude={"url", "srcset"}))
+    except BaseException:
+        await photo_store.release({"content_hash": sha256, "filename": blob["filename"]})
+        raise
+    response_cache.invalidate("photos")
+    schedule_derivatives(photo_obj.dict())
     return {"message": "Photo uploaded successfully", "photo_id": photo_obj.id}
 
 @api_router.get("/photos", response_model=List[Photo])
-async def get_photos():
-    photos = await db.photos.find().sort("uploaded_at", -1).to_list(1000)
-    return [Photo(**photo) for photo in photos]
+async def get_photos(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    async def build():
+        photos, next_cursor = await fetch_page(
+            database.listing.photos, {}, "uploaded_at", limit, cursor, photo_serializer.projection
+        )
+        return [with_photo_urls(photo) for photo in photos], next_cursor
+    return await cached_listing(request, "photos", photo_serializer, build)
+
+@api_router.api_route("/uploads/{folder}/{filename}", methods=["GET", "HEAD"])
+async def get_uploaded_file(folder: str, filename: str, request: Request):
+    """Serve an uploaded photo or rendition with ETag, Range and immutable caching"""
+    directory = UPLOAD_FOLDERS.get(folder)
+    # Names are generated server side; reject anything else, including temp files
+    if directory is None or Path(filename).name != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if not isinstance(photo_storage, LocalStorage):
+        # Bytes come straight from the bucket
+        return RedirectResponse(photo_storage.presigned_get(f"{folder}/{filename}", PRESIGNED_URL_EXPIRES))
+    # Content-addressed originals already carry their hash in the name
+    stem = Path(filename).stem
+    content_hash = stem if folder == "photos" and len(stem) == 64 else None
+    return await serve_immutable_file(request, directory / filename, content_hash)
 
 @api_router.delete("/photos/{photo_id}")
 async def delete_photo(photo_id: str, current_admin: str = Depends(get_current_admin)):
@@ -498,19 +1069,107 @@ async def delete_photo(photo_id: str, current_admin: str = Depends(get_current_a
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    # Delete file from filesystem
-    try:
-        os.remove(photo["file_path"])
-    except FileNotFoundError:
-        pass  # File already deleted or doesn't exist
-    
     # Delete from database
     result = await db.photos.delete_one({"id": photo_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Photo not found")
+    response_cache.invalidate("photos")
+    
+    # Delete file and renditions from storage once no other photo shares the same bytes
+    await photo_store.release(photo)
     
     return {"message": "Photo deleted successfully"}
 
+@api_router.get("/admin/indexes/report")
+async def get_index_report(current_admin: str = Depends(get_current_admin)):
+    """Explain every query shape and flag the ones still scanning a collection (admin only)"""
+    report = await unindexed_query_report(db)
+    return {
+        "unindexed": [entry for entry in report if not entry["indexed"]],
+        "queries": report
+    }
+
+@api_router.get("/admin/caches")
+async def get_cache_stats(current_admin: str = Depends(get_current_admin)):
+    """In-process cache counters for this worker (admin only)"""
+    return {
+        "sessions": session_cache.stats(),
+        "responses": response_cache.stats(),
+        "search": search_service.stats() if search_service else None,
+        "invalidation": invalidation_hub.stats() if invalidation_hub else None
+    }
+
+@api_router.get("/admin/streams")
+async def get_stream_stats(current_admin: str = Depends(get_current_admin)):
+    """Live debate stream counters for this worker (admin only)"""
+    return debate_broadcaster.stats()
+
+@api_router.get("/admin/lifecycle")
+async def get_lifecycle_stats(current_admin: str = Depends(get_current_admin)):
+    """Debate status scheduler state for this worker (admin only)"""
+    return lifecycle_scheduler.stats() if lifecycle_scheduler else {"enabled": False}
+
+@api_router.get("/admin/database")
+async def get_database_stats(current_admin: str = Depends(get_current_admin)):
+    """Mongo client settings and connection pool counters for this worker (admin only)"""
+    return database.stats()
+
+@api_router.get("/admin/tracing")
+async def get_tracing_stats(current_admin: str = Depends(get_current_admin)):
+    """Span export counters for this worker (admin only)"""
+    return tracer.stats()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    collection: Optional[str] = None,
+    route: Optional[str] = None,
+    current_admin: str = Depends(get_current_admin)
+):
+    """Slowest recent Mongo commands on this worker, newest first, with their explain plans (admin only)"""
+    return {
+        **slow_query_recorder.stats(),
+        "samples": slow_query_recorder.query(limit, collection, route)
+    }
+
+@api_router.delete("/admin/slow-queries")
+async def clear_slow_queries(current_admin: str = Depends(get_current_admin)):
+    """Empty the slow query buffer, e.g. after adding an index (admin only)"""
+    slow_query_recorder.clear()
+    return {"message": "Yavaş sorgu kaydı temizlendi"}
+
+@api_router.get("/admin/profiles")
+async def list_profiles(current_admin: str = Depends(get_current_admin)):
+    """Request profiles kept on this worker, newest first (admin only)"""
+    return {
+        "enabled": PROFILING_ENABLED,
+        "sample_every": PROFILE_SAMPLE_EVERY,
+        "profiles": profile_store.list()
+    }
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, current_admin: str = Depends(get_current_admin)):
+    """pstats dump of one profiled request (admin only)"""
+    if not profile_store.get(profile_id):
+        raise HTTPException(status_code=404, detail="Profil bulunamadı")
+    return FileResponse(
+        profile_store.path(profile_id),
+        media_type="application/octet-stream",
+        filename=f"{profile_id}.prof"
+    )
+
+@api_router.get("/admin/profiles/{profile_id}/summary")
+async def get_profile_summary(
+    profile_id: str,
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls)$"),
+    current_admin: str = Depends(get_current_admin)
+):
+    """Top functions of one profiled request as pstats text (admin only)"""
+    if not profile_store.get(profile_id):
+        raise HTTPException(status_code=404, detail="Profil bulunamadı")
+    summary = await asyncio.get_running_loop().run_in_executor(None, profile_store.summary, profile_id, sort)
+    return PlainTextResponse(summary)
+
 @api_router.get("/")
 async def root():
     return {"message": "Münazara Kulübü API'si"}
@@ -524,7 +1183,56 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "X-Profile-Id", "X-Trace-Id"],
 )
+# Admin-requested (X-Profile: 1 or ?profile=1) and 1-in-N sampled cProfile runs of /api requests
+app.add_middleware(
+    ProfilerMiddleware,
+    store=profile_store,
+    authorize=is_admin_authorization,
+    enabled=PROFILING_ENABLED,
+    sample_every=PROFILE_SAMPLE_EVERY,
+    max_seconds=float(os.environ.get('PROFILE_MAX_SECONDS', '30'))
+)
+# Added last so they are outermost and time CORS handling too
+app.add_middleware(MetricsMiddleware, registry=metrics_registry)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Scrape-time gauges over the in-process components
+metrics_registry.gauge(
+    "notification_queue_depth", "Push notifications waiting for a worker",
+    lambda: [((), notification_dispatcher.queue_depth if notification_dispatcher else None)]
+)
+metrics_registry.gauge(
+    "cache_hit_ratio", "Hit ratio of in-process caches since start",
+    lambda: [(("sessions",), session_cache.stats()["hit_ratio"]), (("responses",), response_cache.stats()["hit_ratio"])],
+    labels=("cache",)
+)
+metrics_registry.gauge(
+    "cache_entries", "Entries held by in-process caches",
+    lambda: [(("sessions",), session_cache.stats()["size"]), (("responses",), response_cache.stats()["size"])],
+    labels=("cache",)
+)
+metrics_registry.gauge(
+    "mongodb_pool_connections", "MongoDB pool connections checked out or waiting for one, per server",
+    lambda: [
+        ((address, state), counts[state])
+        for address, counts in (database.pool.stats()["servers"].items() if database else ())
+        for state in ("checked_out", "waiting")
+    ],
+    labels=("server", "state")
+)
+metrics_registry.gauge(
+    "debate_stream_connections", "Open Server-Sent Events connections",
+    lambda: [((), debate_broadcaster.connections)]
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus text exposition; set METRICS_TOKEN to require a bearer token"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Geçersiz kimlik doğrulama bilgileri")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -533,6 +1241,229 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def open_database():
+    """Runs first: every other startup hook needs the database"""
+    global database, db, photo_store
+    database = Database(DatabaseSettings.from_env(), MONGO_LISTENERS, mongo_client_factory)
+    db = database.primary
+    photo_store = PhotoBlobStore(db, photo_storage, UPLOAD_DIR)
+
+@app.on_event("startup")
+async def attach_slow_query_recorder():
+    slow_query_recorder.attach(db)
+
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes(db)
+    # Needs the participants unique index; a no-op once every debate is migrated
+    await migrate_embedded_participants(db)
+
+@app.on_event("startup")
+async def start_vote_buffer():
+    global vote_buffer
+    if not VOTE_WRITE_BEHIND:
+        return
+    journal = os.environ.get('VOTE_BUFFER_JOURNAL')
+    write_concern = os.environ.get('VOTE_FLUSH_WRITE_CONCERN')
+    vote_buffer = VoteBuffer(
+        database.votes,
+        flush_interval=int(os.environ.get('VOTE_FLUSH_INTERVAL_MS', '250')) / 1000,
+        max_pending=int(os.environ.get('VOTE_FLUSH_MAX_PENDING', '500')),
+        journal_path=Path(journal) if journal else None,
+        fsync=os.environ.get('VOTE_BUFFER_FSYNC', 'false').lower() == 'true',
+        write_concern=parse_write_concern(write_concern) if write_concern else None
+    )
+    await vote_buffer.start()
+
+def invalidate_listings(change: Change):
+    """Debates (and their vote tallies) or photos changed on some worker"""
+    response_cache.invalidate("photos" if change.collection == "photos" else "debates")
+
+def invalidate_sessions(change: Change):
+    if change.operation == ANY:
+        session_cache.clear()
+        return
+    token = (change.document or {}).get("session_token")
+    if token:
+        session_cache.invalidate(token)
+    if change.document_key:
+        # Deletes (logout, the expiry TTL index) carry only the _id
+        session_cache.invalidate_session_id(change.document_key["_id"])
+
+def update_search_index(change: Change):
+    # Collection-wide events are left to the periodic rebuild
+    if not search_service or change.operation == ANY:
+        return
+    if change.collection == "debates":
+        if change.operation == "delete":
+            search_service.debate_deleted_by_object_id(change.document_key["_id"])
+        elif change.document:
+            search_service.debate_saved(change.document)
+    elif change.operation == "insert" and change.document:
+        search_service.comment_saved(change.document)
+
+def streams_relayed() -> bool:
+    """With change streams every write reaches every worker's streams through relay_to_streams"""
+    return invalidation_hub is not None and invalidation_hub.mode == "change_stream"
+
+def publish_debate_event(debate_id: str, event: str, data: dict):
+    if not streams_relayed():
+        debate_broadcaster.publish(debate_id, event, data)
+
+def relay_to_streams(change: Change):
+    """Stream events for writes made on any worker (this one included)"""
+    if change.operation == ANY:
+        if stream_refresher:
+            # Polling: another worker wrote; the refresher reads what the open streams need
+            stream_refresher.mark(change.collection)
+        else:
+            # Lost change history: only the collection is known
+            debate_broadcaster.resync_all()
+    elif change.collection == "debates" and change.operation == "update":
+        debate_id = debate_broadcaster.debate_id_for(change.document_key["_id"])
+        updates = change.updates or {}
+        counts = {name: value for name, value in updates.items() if name in STREAM_COUNTERS}
+        if debate_id and counts:
+            debate_broadcaster.publish(debate_id, "tally", counts)
+        if debate_id and "status" in updates:
+            debate_broadcaster.publish(debate_id, "status", {"status": updates["status"]})
+    elif change.operation == "insert" and change.document:
+        document = {key: value for key, value in change.document.items() if key != "_id"}
+        if change.collection == "comments":
+            debate_broadcaster.publish(document["debate_id"], "comment", document)
+        elif change.collection == "participants":
+            debate_broadcaster.publish(document["debate_id"], "participant", {
+                "participant_name": document["participant_name"]
+            })
+
+@app.on_event("startup")
+async def start_invalidation_hub():
+    """Opened before the search index loads so no write falls between the two"""
+    global invalidation_hub
+    if INVALIDATION_MODE == 'off':
+        return
+    invalidation_hub = InvalidationHub(
+        db,
+        mode=INVALIDATION_MODE,
+        poll_interval=float(os.environ.get('INVALIDATION_POLL_SECONDS', '2')),
+        # Vote counter updates only need the listings dropped, not a re-read for the search index
+        lookup_fields={"debates": (*DEBATE_FIELDS, "status")}
+    )
+    invalidation_hub.subscribe(("debates", "votes", "photos"), invalidate_listings)
+    invalidation_hub.subscribe(("sessions",), invalidate_sessions)
+    invalidation_hub.subscribe(("debates", "comments"), update_search_index)
+    invalidation_hub.subscribe(("debates", "comments", "participants"), relay_to_streams)
+    write_version_bumper.hub = invalidation_hub
+    await invalidation_hub.start()
+    if invalidation_hub.mode == "polling":
+        await start_stream_refresher()
+
+async def start_stream_refresher():
+    global stream_refresher
+    stream_refresher = StreamRefresher(
+        db,
+        debate_broadcaster,
+        STREAM_COUNTERS,
+        interval=float(os.environ.get('STREAM_REFRESH_SECONDS', '2')),
+        merge=lambda debate: vote_buffer.merge_pending(debate) if vote_buffer else debate
+    )
+    await stream_refresher.start()
+
+async def on_debate_transition(debate: dict, old_status: str, new_status: str):
+    """Lifecycle callback on the worker whose compare-and-set won; the hub tells the other workers"""
+    response_cache.invalidate("debates")
+    if search_service:
+        search_service.debate_saved(debate)
+    publish_debate_event(debate["id"], "status", {"status": new_status})
+    if new_status == ACTIVE:
+        send_push_notification(NotificationPayload(
+            title="Münazara Başladı!",
+            body=f"'{debate['title']}' münazarası şimdi canlı",
+            url="/"
+        ))
+    elif new_status == COMPLETED:
+        send_push_notification(NotificationPayload(
+            title="Münazara Sona Erdi",
+            body=f"'{debate['title']}' münazarası tamamlandı, sonuçları görün",
+            url="/"
+        ))
+
+@app.on_event("startup")
+async def start_search_service():
+    global search_service
+    search_service = SearchService(db, rebuild_interval=float(os.environ.get('SEARCH_REBUILD_SECONDS', '300')))
+    await search_service.start()
+
+@app.on_event("startup")
+async def start_derivative_generator():
+    derivative_generator.start()
+
+@app.on_event("startup")
+async def start_http_client():
+    await http_client.start()
+
+@app.on_event("startup")
+async def start_tracer():
+    if not tracer.enabled:
+        return
+    if TRACE_EXPORTER == 'otlp':
+        exporter = OtlpHttpSpanExporter(
+            http_client, os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318')
+        )
+    else:
+        exporter = FileSpanExporter(os.environ.get('TRACE_FILE', str(Path(tempfile.gettempdir()) / "debate-club-traces.jsonl")))
+    await tracer.start(exporter)
+
+@app.on_event("startup")
+async def start_notification_dispatcher():
+    global notification_dispatcher
+    gateway_url = os.environ.get('PUSH_GATEWAY_URL')
+    notification_dispatcher = NotificationDispatcher(
+        db,
+        HttpPushSender(http_client, gateway_url, retries=int(os.environ.get('PUSH_RETRIES', '2')))
+        if gateway_url else LoggingPushSender(),
+        workers=int(os.environ.get('PUSH_WORKERS', '2')),
+        concurrency=int(os.environ.get('PUSH_CONCURRENCY', '32')),
+        batch_size=int(os.environ.get('PUSH_BATCH_SIZE', '200')),
+        coalesce_window=float(os.environ.get('PUSH_COALESCE_WINDOW_SECONDS', '5')),
+        queue_size=int(os.environ.get('PUSH_QUEUE_SIZE', '1000')),
+        tracer=tracer
+    )
+    await notification_dispatcher.start()
+
+@app.on_event("startup")
+async def start_lifecycle_scheduler():
+    # After the dispatcher: transitions overdue at boot fire immediately and notify
+    global lifecycle_scheduler
+    if not DEBATE_LIFECYCLE:
+        return
+    lifecycle_scheduler = LifecycleScheduler(
+        db,
+        on_debate_transition,
+        refresh_interval=float(os.environ.get('LIFECYCLE_REFRESH_SECONDS', '60'))
+    )
+    await lifecycle_scheduler.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    debate_broadcaster.close()
+    if lifecycle_scheduler:
+        await lifecycle_scheduler.stop()
+    if search_service:
+        await search_service.stop()
+    if stream_refresher:
+        await stream_refresher.stop()
+    if invalidation_hub:
+        await invalidation_hub.stop()
+    if vote_buffer:
+        await vote_buffer.stop()
+    if notification_dispatcher:
+        await notification_dispatcher.stop()
+    # After the dispatcher so delivery spans are flushed, before the collector client closes
+    await tracer.stop()
+    await http_client.close()
+    if derivative_tasks:
+        await asyncio.gather(*derivative_tasks, return_exceptions=True)
+    derivative_generator.close()
+    database.close()
\ No newline at end of file
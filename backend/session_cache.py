@@ -0,0 +1,88 @@
+"""Bounded LRU + TTL cache from session_token to the resolved user.
+
+Entries also remember the session document's ``_id``: change stream deletes
+(logout, the TTL index) carry only the ``_id``, and ``invalidate_session_id``
+drops just that entry.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+
+class SessionCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # token -> (user, session expires_at, monotonic deadline, user_id, session _id)
+        self._entries: "OrderedDict[str, Tuple[Any, datetime, float, str, Any]]" = OrderedDict()
+        # session _id -> token
+        self._tokens: Dict[Any, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, session_token: str):
+        """Return the cached user, or None on a miss or once the entry/session has expired."""
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at, deadline = entry[:3]
+        if time.monotonic() >= deadline or expires_at <= datetime.utcnow():
+            self._remove(session_token)
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user
+
+    def put(self, session_token: str, user, expires_at: datetime, user_id: str, session_id=None):
+        self._remove(session_token)
+        self._entries[session_token] = (user, expires_at, time.monotonic() + self.ttl_seconds, user_id, session_id)
+        if session_id is not None:
+            self._tokens[session_id] = session_token
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, session_token: str) -> bool:
+        entry = self._entries.pop(session_token, None)
+        if entry is None:
+            return False
+        if entry[4] is not None:
+            self._tokens.pop(entry[4], None)
+        return True
+
+    def invalidate(self, session_token: str):
+        if self._remove(session_token):
+            self.invalidations += 1
+
+    def invalidate_session_id(self, session_id):
+        token = self._tokens.get(session_id)
+        if token is not None:
+            self.invalidate(token)
+
+    def invalidate_user(self, user_id: str):
+        for token in [t for t, entry in self._entries.items() if entry[3] == user_id]:
+            self.invalidate(token)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tokens.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
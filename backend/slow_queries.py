@@ -0,0 +1,232 @@
+"""Slow MongoDB command recorder with automatic explain capture.
+
+Hooked into the driver as a CommandListener next to the metrics listener.
+Commands slower than the threshold are kept with their filter shape (every
+value replaced by "?"), the route that issued them and, when Mongo can
+explain the command, a summary of its ``executionStats`` plan. Samples go
+into a bounded ring buffer and, optionally, a JSONL file. Explaining re-runs
+the query, so each shape is explained at most once per ``explain_interval``.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from indexes import plan_stages
+from metrics import current_scope, route_template
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Envelope fields the driver adds to every command; explain takes them on the outer command only
+_ENVELOPE = {
+    "lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+    "readConcern", "writeConcern", "apiVersion", "apiStrict", "apiDeprecationErrors",
+}
+
+
+def query_shape(value: Any) -> Any:
+    """Keep field names and operators, replace every value with "?"."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and any(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def command_filter(name: str, command: Dict) -> Optional[Any]:
+    if name == "find":
+        return query_shape(command.get("filter", {}))
+    if name in ("count", "distinct", "findAndModify"):
+        return query_shape(command.get("query", {}))
+    if name in ("update", "delete"):
+        statements = command.get(name + "s") or [{}]
+        return query_shape(statements[0].get("q", {}))
+    if name == "aggregate":
+        return [
+            {stage: query_shape(body) if stage == "$match" else "?" for stage, body in step.items()}
+            for step in command.get("pipeline", [])
+        ]
+    return None
+
+
+def _plan_indexes(plan: Any) -> List[str]:
+    names = []
+    if isinstance(plan, dict):
+        if "indexName" in plan:
+            names.append(plan["indexName"])
+        for value in plan.values():
+            names.extend(_plan_indexes(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            names.extend(_plan_indexes(item))
+    return names
+
+
+def summarize_explain(explain: Dict) -> Dict:
+    if "queryPlanner" not in explain:
+        # Aggregations whose first stage was not pushed down nest the plan under $cursor
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                explain = stage["$cursor"]
+                break
+    winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+    stats = explain.get("executionStats", {})
+    stages = plan_stages(winning)
+    return {
+        "stages": stages,
+        "indexes": sorted(set(_plan_indexes(winning))),
+        "collscan": "COLLSCAN" in stages,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    def __init__(
+        self,
+        threshold_ms: float = 100.0,
+        capacity: int = 500,
+        explain_interval: float = 60.0,
+        log_path: Optional[str] = None,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_interval = explain_interval
+        self.log_path = log_path
+        self.samples: deque = deque(maxlen=capacity)
+        self.db = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # (connection, request id) -> (command, route, method), filled in started()
+        self._pending: Dict[Tuple, Tuple[Dict, str, Optional[str]]] = {}
+        self._explained: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.recorded = 0
+        self.explained = 0
+
+    def attach(self, db):
+        """Enable explain capture and the JSONL sink; call from the event loop at startup."""
+        self.db = db
+        self._loop = asyncio.get_running_loop()
+
+    # Driver callbacks, run on Motor's executor threads
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        scope = current_scope.get()
+        route = route_template(scope) if scope else None
+        self._pending[(event.connection_id, event.request_id)] = (
+            event.command, route, scope.get("method") if scope else None
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, failure=str(event.failure))
+
+    def _finish(self, event, failure: Optional[str] = None):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        command, route, method = pending
+        name = event.command_name
+        target = command.get("collection") if name == "getMore" else command.get(name)
+        sample = {
+            "at": datetime.utcnow().isoformat(),
+            "collection": target if isinstance(target, str) else None,
+            "command": name,
+            "duration_ms": round(duration_ms, 3),
+            "filter": command_filter(name, command),
+            "sort": list(command["sort"]) if isinstance(command.get("sort"), dict) else None,
+            "route": route,
+            "method": method,
+            "failure": failure,
+            "explain": None,
+        }
+        self.samples.append(sample)
+        self.recorded += 1
+        if self._loop is None:
+            return
+        explain = self._should_explain(sample) and failure is None
+        self._loop.call_soon_threadsafe(self._spawn, sample, command if explain else None)
+
+    def _should_explain(self, sample: Dict) -> bool:
+        if self.db is None or sample["command"] not in EXPLAINABLE:
+            return False
+        key = (sample["collection"], sample["command"], json.dumps(sample["filter"], sort_keys=True))
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(key, float("-inf")) < self.explain_interval:
+                return False
+            self._explained[key] = now
+        return True
+
+    # Event loop side
+    def _spawn(self, sample: Dict, command: Optional[Dict]):
+        task = self._loop.create_task(self._complete(sample, command))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _complete(self, sample: Dict, command: Optional[Dict]):
+        if command is not None:
+            try:
+                sample["explain"] = summarize_explain(await self._explain(sample["command"], command))
+                self.explained += 1
+            except Exception as e:
+                sample["explain"] = {"error": str(e)}
+        if self.log_path:
+            line = json.dumps(sample, default=str) + "\n"
+            try:
+                await self._loop.run_in_executor(None, self._append, line)
+            except OSError as e:
+                logger.error(f"Slow query log write failed: {str(e)}")
+
+    async def _explain(self, name: str, command: Dict) -> Dict:
+        inner = {key: value for key, value in command.items() if key not in _ENVELOPE}
+        if name in ("update", "delete"):
+            # explain takes a single statement
+            inner[name + "s"] = inner[name + "s"][:1]
+        return await self.db.command({"explain": inner, "verbosity": "executionStats"})
+
+    def _append(self, line: str):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    # Admin
+    def query(self, limit: int = 50, collection: Optional[str] = None, route: Optional[str] = None) -> List[Dict]:
+        """Newest samples first."""
+        matches = []
+        for sample in reversed(list(self.samples)):
+            if collection and sample["collection"] != collection:
+                continue
+            if route and sample["route"] != route:
+                continue
+            matches.append(sample)
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def clear(self):
+        self.samples.clear()
+        with self._lock:
+            self._explained.clear()
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "buffered": len(self.samples),
+            "capacity": self.samples.maxlen,
+            "recorded": self.recorded,
+            "explained": self.explained,
+            "log_path": self.log_path,
+        }
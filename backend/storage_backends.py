@@ -0,0 +1,217 @@
+"""Where photo bytes live: the local filesystem or an S3-compatible bucket.
+
+Keys look like ``photos/<sha256>.jpg`` or ``renditions/<sha256>_640.webp``.
+The S3 backend uploads large files in parts and can hand out presigned
+PUT/GET URLs so clients move bytes straight to/from the bucket. Point
+``S3_ENDPOINT_URL`` at MinIO or a moto server to run it locally.
+"""
+import abc
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+
+class StorageBackend(abc.ABC):
+    supports_presigned_urls = False
+
+    @abc.abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Size in bytes, or None if the key does not exist."""
+        ...
+
+    @abc.abstractmethod
+    async def store_file(self, key: str, path: Path, content_type: str):
+        """Move a local file to ``key``; the local file is gone afterwards."""
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def local_copy(self, key: str):
+        """Async context manager yielding a local path with the object's bytes."""
+        ...
+
+    @abc.abstractmethod
+    def location(self, key: str) -> str:
+        """What gets recorded as Photo.file_path."""
+        ...
+
+    # Only backends with supports_presigned_urls implement these
+    def presigned_put(self, key: str, content_type: str, sha256: str, expires: int) -> Dict:
+        raise NotImplementedError
+
+    def presigned_get(self, key: str, expires: int) -> str:
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+
+    def path(self, key: str) -> Path:
+        """Refuses keys that resolve outside the root ("..", absolute paths, symlinks)."""
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Storage key outside the storage root: {key!r}")
+        return path
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self.path(key).exists)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await asyncio.to_thread(os.stat, self.path(key))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def store_file(self, key: str, path: Path, content_type: str):
+        target = self.path(key)
+        if path != target:
+            await asyncio.to_thread(os.replace, path, target)
+
+    async def delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.remove, self.path(key))
+        except FileNotFoundError:
+            pass
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        yield self.path(key)
+
+    def location(self, key: str) -> str:
+        return str(self.path(key))
+
+
+class S3Storage(StorageBackend):
+    supports_presigned_urls = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(signature_version="s3v4", retries={"max_attempts": 3, "mode": "standard"}),
+        )
+        # upload_file switches to multipart above the threshold and sends parts in parallel
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    async def exists(self, key: str) -> bool:
+        return await self.size(key) is not None
+
+    async def store_file(self, key: str, path: Path, content_type: str):
+        await asyncio.to_thread(
+            self.client.upload_file,
+            str(path),
+            self.bucket,
+            self.object_key(key),
+            ExtraArgs={"ContentType": content_type, "CacheControl": "public, max-age=31536000, immutable"},
+            Config=self.transfer_config,
+        )
+        await asyncio.to_thread(os.remove, path)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.object_key(key))
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        directory = await asyncio.to_thread(tempfile.mkdtemp, prefix="photo-")
+        path = Path(directory) / Path(key).name
+        try:
+            await asyncio.to_thread(
+                self.client.download_file, self.bucket, self.object_key(key), str(path), Config=self.transfer_config
+            )
+            yield path
+        finally:
+            await asyncio.to_thread(shutil.rmtree, directory, True)
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.object_key(key)}"
+
+    def presigned_put(self, key: str, content_type: str, sha256: str, expires: int) -> Dict:
+        # The bucket rejects the PUT unless the body matches the declared SHA-256
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.object_key(key),
+                "ContentType": content_type,
+                "ChecksumSHA256": checksum,
+                "CacheControl": "public, max-age=31536000, immutable",
+            },
+            ExpiresIn=expires,
+        )
+        return {
+            "method": "PUT",
+            "url": url,
+            "headers": {
+                "Content-Type": content_type,
+                "x-amz-checksum-sha256": checksum,
+                "Cache-Control": "public, max-age=31536000, immutable",
+            },
+        }
+
+    def presigned_get(self, key: str, expires: int) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.object_key(key)}, ExpiresIn=expires
+        )
+
+
+def storage_from_env(upload_root: Path) -> StorageBackend:
+    """PHOTO_STORAGE=s3 selects the bucket backend; anything else keeps files under upload_root."""
+    if os.environ.get("PHOTO_STORAGE", "local").lower() != "s3":
+        return LocalStorage(upload_root)
+    mib = 1024 * 1024
+    return S3Storage(
+        bucket=os.environ["S3_BUCKET"],
+        prefix=os.environ.get("S3_PREFIX", ""),
+        endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+        region=os.environ.get("S3_REGION") or None,
+        multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "8")) * mib,
+        multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNK_MB", "8")) * mib,
+        max_concurrency=int(os.environ.get("S3_UPLOAD_CONCURRENCY", "4")),
+    )
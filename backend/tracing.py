@@ -0,0 +1,383 @@
+"""Request tracing: a span per request, child spans per Mongo command and outbound call.
+
+Dependency-free stand-in for the OpenTelemetry SDK. Incoming W3C
+``traceparent`` headers are honoured and outbound HTTP calls carry one.
+The current span lives in a context variable. Motor copies the context
+onto its driver threads, so the command listener finds its parent there.
+Finished spans are batched and exported as OTLP/JSON
+``ExportTraceServiceRequest`` documents. They go either to a JSONL file
+(one export per line, like the collector's file exporter) or to an OTLP/HTTP
+collector. Mongo and HTTP spans are only recorded under an existing span,
+so background loops do not start a trace per command. Nothing is recorded
+or exported until the server is given an exporter (``TRACE_EXPORTER``).
+
+``python tracing.py traces.jsonl`` prints where time goes per route.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# OTLP SpanKind values
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error", "sampled",
+    )
+
+    def __init__(self, trace_id: str, span_id: str, parent_id: Optional[str], name: str, kind: int, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Span]:
+    """Remote parent from a W3C traceparent header, or None if it is absent or malformed."""
+    match = _TRACEPARENT_RE.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return Span(trace_id, span_id, None, "", SERVER, bool(int(flags, 16) & 1))
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_ratio: float = 1.0,
+        service_name: str = "debate-club-api",
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self.enabled = enabled
+        self.sample_ratio = sample_ratio
+        self.service_name = service_name
+        self.flush_interval = flush_interval
+        self.exporter = None
+        # Appended from driver threads too; deque appends are atomic
+        self._finished: deque = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.export_failures = 0
+
+    async def start(self, exporter):
+        self.exporter = exporter
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self.exporter:
+            await self.exporter.close()
+
+    def start_span(
+        self, name: str, kind: int = INTERNAL, parent: Optional[Span] = None, root: bool = False
+    ) -> Optional[Span]:
+        """New span under ``parent`` (default: the current one). Without a parent, only if ``root``."""
+        if not self.enabled:
+            return None
+        parent = parent or current_span.get()
+        if parent is not None:
+            return Span(parent.trace_id, _random_id(8), parent.span_id, name, kind, parent.sampled)
+        if not root:
+            return None
+        return Span(_random_id(16), _random_id(8), None, name, kind, random.random() < self.sample_ratio)
+
+    def end_span(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        if span.sampled:
+            self._finished.append(span)
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+        span = self.start_span(name, kind)
+        if span is None:
+            yield None
+            return
+        span.attributes.update(attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._finished or self.exporter is None:
+            return
+        spans = []
+        while self._finished:
+            spans.append(self._finished.popleft())
+        try:
+            await self.exporter.export(encode_otlp(spans, self.service_name))
+            self.exported += len(spans)
+        except Exception as e:
+            self.export_failures += 1
+            logger.error(f"Exporting {len(spans)} spans failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_ratio": self.sample_ratio,
+            "queued": len(self._finished),
+            "exported": self.exported,
+            "export_failures": self.export_failures,
+        }
+
+
+def _random_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+def _attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def encode_otlp(spans: List[Span], service_name: str) -> Dict:
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        encoded.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": encoded}],
+    }]}
+
+
+class FileSpanExporter:
+    """One OTLP/JSON export per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def export(self, payload: Dict):
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        await asyncio.get_running_loop().run_in_executor(None, self._append, line)
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def close(self):
+        pass
+
+
+class OtlpHttpSpanExporter:
+    """POSTs to an OTLP/HTTP collector's /v1/traces with the shared HttpClient."""
+
+    def __init__(self, http_client, endpoint: str, timeout: float = 5.0):
+        self.http_client = http_client
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    async def export(self, payload: Dict):
+        # The flush task has no current span, so this call is not traced itself
+        result = await self.http_client.request("POST", self.url, json=payload, timeout=self.timeout)
+        if result.status >= 400:
+            raise RuntimeError(f"Collector returned {result.status}")
+
+    async def close(self):
+        pass
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening the server span for every HTTP request."""
+
+    def __init__(self, app: ASGIApp, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.tracer.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        span = self.tracer.start_span(scope["method"], SERVER, parse_traceparent(traceparent), root=True)
+        span.attributes.update({"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                message = {**message, "headers": [*message["headers"], (b"x-trace-id", span.trace_id.encode())]}
+            await send(message)
+
+        token = current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            route = route_template(scope)
+            span.name = f"{scope['method']} {route}"
+            span.attributes["http.route"] = route
+            if span.attributes.get("http.status_code", 500) >= 500 and not span.error:
+                span.error = f"HTTP {span.attributes.get('http.status_code', 500)}"
+            self.tracer.end_span(span)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Child span for every Mongo command issued under a traced request."""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans: Dict[tuple, Span] = {}
+
+    def started(self, event):
+        span = self.tracer.start_span(event.command_name, CLIENT)
+        if span is None:
+            return
+        command = event.command
+        target = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        span.attributes.update({
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+        })
+        if isinstance(target, str):
+            span.name = f"{event.command_name} {target}"
+            span.attributes["db.mongodb.collection"] = target
+        self._spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span:
+            self.tracer.end_span(span, span.start_ns + event.duration_micros * 1000)
+
+    def failed(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span:
+            span.error = str(event.failure)
+            self.tracer.end_span(span, span.start_ns + event.duration_micros * 1000)
+
+
+def outbound_span(tracer: Optional[Tracer], method: str, url: str) -> Optional[Span]:
+    """Client span for an outbound HTTP call; query strings stay out of the attributes."""
+    if tracer is None:
+        return None
+    span = tracer.start_span(f"HTTP {method}", CLIENT)
+    if span:
+        parts = urlsplit(url)
+        span.attributes.update({
+            "http.method": method,
+            "http.url": f"{parts.scheme}://{parts.netloc}{parts.path}",
+            "net.peer.name": parts.hostname or "",
+        })
+    return span
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(path: str):
+    """Per route: request latency and the share of it spent in each kind of child span."""
+    spans = {}
+    for line in open(path, encoding="utf-8"):
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope_spans in resource["scopeSpans"]:
+                for span in scope_spans["spans"]:
+                    spans[span["spanId"]] = span
+    children = defaultdict(list)
+    for span in spans.values():
+        if span.get("parentSpanId") in spans:
+            children[span["parentSpanId"]].append(span)
+
+    def duration_ms(span):
+        return (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+
+    def descendants(span):
+        for child in children[span["spanId"]]:
+            yield child
+            yield from descendants(child)
+
+    routes = defaultdict(lambda: {"durations": [], "children": defaultdict(float)})
+    for span in spans.values():
+        if span["kind"] != SERVER:
+            continue
+        route = routes[span["name"]]
+        route["durations"].append(duration_ms(span))
+        for child in descendants(span):
+            route["children"][child["name"]] += duration_ms(child)
+
+    for name, route in sorted(routes.items(), key=lambda item: -sum(item[1]["durations"])):
+        durations = route["durations"]
+        print(f"{name}: {len(durations)} requests, p50 {_percentile(durations, 0.5):.1f} ms, "
+              f"p95 {_percentile(durations, 0.95):.1f} ms")
+        for child, total in sorted(route["children"].items(), key=lambda item: -item[1])[:10]:
+            print(f"    {child:<40} {total / len(durations):8.2f} ms/request")
+
+
+if __name__ == "__main__":
+    report(sys.argv[1] if len(sys.argv) > 1 else "traces.jsonl")
@@ -0,0 +1,305 @@
+"""Write-behind buffer for debate votes.
+
+Votes are acknowledged as soon as they are in memory (and, optionally, in an
+append-only journal on disk). A background task periodically writes them to
+``votes`` with one ``insert_many`` and applies the counter increments to
+``debates`` with one coalesced ``bulk_write``, so a hot debate document sees
+one ``$inc`` per flush instead of one per voter.
+
+Every flush is a batch with its own id. The id is stored on the votes it
+inserts and pushed onto ``applied_batches`` of each debate it increments, and
+the ``$inc`` only matches debates that do not list it yet. Retried counter
+writes therefore never count twice. After a crash between the insert and the
+``$inc``, replayed votes hit duplicate keys. The buffer then recounts the
+batch that stored them and applies its counters if they are missing.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("votes_for", "votes_against")
+DUPLICATE_KEY = 11000
+# Batch ids remembered per debate; a batch is retried within seconds, never this many flushes later
+APPLIED_BATCHES_KEPT = 50
+
+
+def _counts() -> Dict[str, int]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+class VoteBuffer:
+    def __init__(
+        self,
+        db,
+        flush_interval: float = 0.25,
+        max_pending: int = 500,
+        journal_path: Optional[Path] = None,
+        fsync: bool = False,
+        write_concern: Optional[WriteConcern] = None,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.journal_path = journal_path
+        self.fsync = fsync
+        if write_concern is not None:
+            self.votes = db.votes.with_options(write_concern=write_concern)
+            self.debates = db.debates.with_options(write_concern=write_concern)
+        else:
+            self.votes = db.votes
+            self.debates = db.debates
+
+        self._pending: List[dict] = []
+        self._pending_keys: Set[Tuple[str, str]] = set()
+        # Votes taken by a running flush and not yet confirmed by insert_many
+        self._inflight: List[dict] = []
+        self._inflight_keys: Set[Tuple[str, str]] = set()
+        # Pending and in-flight votes per debate, for pending_delta
+        self._buffered: Dict[str, Dict[str, int]] = defaultdict(_counts)
+        # batch id -> debate id -> votes already inserted whose $inc has not reached the debate yet
+        self._unapplied: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # Same, for batches of an earlier run found through replayed votes; already visible in Mongo reads
+        self._recovered: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # Votes read back from the journal, until their first flush
+        self._replayed: Set[Tuple[str, str]] = set()
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._journal = None
+
+    async def start(self):
+        if self.journal_path:
+            replayed = self._read_journal()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+            accepted = sum(self.add(vote) for vote in replayed)
+            self._replayed = set(self._pending_keys)
+            if accepted:
+                logger.info(f"Replayed {accepted} buffered votes from {self.journal_path}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def add(self, vote_record: dict) -> bool:
+        """Buffer a vote; False if the same voter already has a pending vote on this debate."""
+        key = (vote_record["debate_id"], vote_record["voter_name"])
+        if key in self._pending_keys or key in self._inflight_keys:
+            return False
+        self._queue(vote_record)
+        if self._journal:
+            self._journal.write(json.dumps(vote_record, default=datetime.isoformat) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+        return True
+
+    def has_pending_vote(self, debate_id: str, voter_name: str) -> bool:
+        """Buffered or being flushed. A vote leaves the in-flight set only once ``votes`` has it,
+        so checking here before reading ``votes`` leaves no gap a vote can slip through."""
+        key = (debate_id, voter_name)
+        return key in self._pending_keys or key in self._inflight_keys
+
+    def _queue(self, vote: dict):
+        self._pending_keys.add((vote["debate_id"], vote["voter_name"]))
+        self._pending.append(vote)
+        self._buffered[vote["debate_id"]][_counter(vote)] += 1
+
+    def _unbuffer(self, vote: dict):
+        counts = self._buffered[vote["debate_id"]]
+        counts[_counter(vote)] -= 1
+        if not any(counts.values()):
+            del self._buffered[vote["debate_id"]]
+
+    def pending_delta(self, debate_id: str) -> Dict[str, int]:
+        delta = dict(self._buffered.get(debate_id) or _counts())
+        for debates in self._unapplied.values():
+            for counter, count in debates.get(debate_id, {}).items():
+                delta[counter] += count
+        return delta
+
+    def merge_pending(self, debate: dict) -> dict:
+        """Add buffered votes to the tallies of a debate document read from Mongo."""
+        if not self._buffered and not self._unapplied:
+            return debate
+        delta = self.pending_delta(debate["id"])
+        for counter in COUNTERS:
+            debate[counter] = debate.get(counter, 0) + delta[counter]
+        return debate
+
+    async def flush(self):
+        async with self._lock:
+            if self._journal and self._pending:
+                self._rotate_journal()
+            self._inflight, self._pending = self._pending, []
+            self._inflight_keys, self._pending_keys = self._pending_keys, set()
+            try:
+                inserted = await self._insert_votes(self._inflight, uuid.uuid4().hex) if self._inflight else True
+            finally:
+                self._inflight, self._inflight_keys = [], set()
+            applied = await self._apply_counters(self._unapplied) if self._unapplied else True
+            if self._recovered:
+                applied = await self._apply_counters(self._recovered) and applied
+            if self.journal_path and inserted and applied:
+                self._flushing_path.unlink(missing_ok=True)
+
+    async def _insert_votes(self, pending: List[dict], batch: str) -> bool:
+        """Insert a batch; False if some votes had to be requeued."""
+        for vote in pending:
+            vote["flush_batch"] = batch
+        failed = {}
+        try:
+            await self.votes.insert_many(pending, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: error["code"] for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logger.error(f"Vote flush failed, retrying next interval: {str(e)}")
+            failed = {index: None for index in range(len(pending))}
+
+        requeued = []
+        replayed_duplicates = []
+        for index, vote in enumerate(pending):
+            self._unbuffer(vote)
+            key = (vote["debate_id"], vote["voter_name"])
+            if index not in failed:
+                counts = self._unapplied.setdefault(batch, {}).setdefault(vote["debate_id"], _counts())
+                counts[_counter(vote)] += 1
+            elif failed[index] != DUPLICATE_KEY:
+                requeued.append(vote)
+                continue
+            elif key in self._replayed:
+                replayed_duplicates.append(vote)
+            # Other duplicates were already counted by whichever request stored them first
+            self._replayed.discard(key)
+        if replayed_duplicates and not await self._recover_batches(replayed_duplicates):
+            requeued.extend(replayed_duplicates)
+        for vote in requeued:
+            # Transient failure: keep the vote (insert_many set its _id, drop it)
+            vote.pop("_id", None)
+            vote.pop("flush_batch", None)
+            self._queue(vote)
+        return not requeued
+
+    async def _recover_batches(self, votes: List[dict]) -> bool:
+        """Replayed votes were inserted before a restart; make sure their batch's counters were applied.
+
+        Recounts each (batch, debate) from ``votes``; the batch filter in
+        ``_apply_counters`` turns it into a no-op if the $inc did land.
+        """
+        try:
+            stored = self.votes.find(
+                {"$or": [{"debate_id": v["debate_id"], "voter_name": v["voter_name"]} for v in votes],
+                 "flush_batch": {"$exists": True}},
+                {"_id": 0, "debate_id": 1, "flush_batch": 1},
+            )
+            targets = {(doc["flush_batch"], doc["debate_id"]) async for doc in stored}
+            for batch, debate_id in targets:
+                if debate_id in self._unapplied.get(batch, {}):
+                    continue
+                counts = _counts()
+                async for doc in self.votes.find({"flush_batch": batch, "debate_id": debate_id}, {"_id": 0, "vote_type": 1}):
+                    counts[_counter(doc)] += 1
+                self._recovered.setdefault(batch, {})[debate_id] = counts
+        except Exception as e:
+            logger.error(f"Recounting replayed votes failed, retrying next interval: {str(e)}")
+            for vote in votes:
+                self._replayed.add((vote["debate_id"], vote["voter_name"]))
+            return False
+        return True
+
+    async def _apply_counters(self, batches: Dict[str, Dict[str, Dict[str, int]]]) -> bool:
+        """Apply and forget every (batch, debate) delta in ``batches``; False if the write failed."""
+        deltas = [
+            (batch, debate_id, counts)
+            for batch, debates in list(batches.items())
+            for debate_id, counts in debates.items()
+        ]
+        requests = [
+            UpdateOne(
+                {"id": debate_id, "applied_batches": {"$ne": batch}},
+                {
+                    "$inc": {k: v for k, v in counts.items() if v},
+                    "$push": {"applied_batches": {"$each": [batch], "$slice": -APPLIED_BATCHES_KEPT}},
+                },
+            )
+            for batch, debate_id, counts in deltas
+            if any(counts.values())
+        ]
+        try:
+            if requests:
+                await self.debates.bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.error(f"Vote counter flush failed, retrying next interval: {str(e)}")
+            return False
+        for batch, debate_id, _ in deltas:
+            batches[batch].pop(debate_id, None)
+            if not batches[batch]:
+                del batches[batch]
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Vote buffer flush error: {str(e)}")
+
+    @property
+    def _flushing_path(self) -> Path:
+        return self.journal_path.with_name(self.journal_path.name + ".flushing")
+
+    def _rotate_journal(self):
+        # Append to any batch left from a failed flush so nothing is lost
+        self._journal.close()
+        with open(self._flushing_path, "a", encoding="utf-8") as target:
+            target.write(self.journal_path.read_text(encoding="utf-8"))
+            if self.fsync:
+                target.flush()
+                os.fsync(target.fileno())
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+
+    def _read_journal(self) -> List[dict]:
+        """Collect votes acknowledged before a restart; duplicates are dropped on flush."""
+        votes = []
+        for path in (self._flushing_path, self.journal_path):
+            if not path.exists():
+                continue
+            for line in path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    vote = json.loads(line)
+                    vote["created_at"] = datetime.fromisoformat(vote["created_at"])
+                    votes.append(vote)
+            path.unlink()
+        return votes
+
+
+def _counter(vote: dict) -> str:
+    return "votes_for" if vote["vote_type"] == "for" else "votes_against"
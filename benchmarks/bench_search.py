@@ -0,0 +1,126 @@
+"""Latency of the in-process search index on a seeded Turkish corpus.
+
+    python benchmarks/bench_search.py [--debates 5000] [--comments 50000] [--queries 2000]
+
+Reports index build time, per-query latency percentiles for a mix of
+single-term, multi-term, prefix and ASCII-typed queries, and the cost of
+an incremental write.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from search import build_index  # noqa: E402
+
+WORDS = (
+    "münazara eğitim öğretmen öğrenci yapay zekâ teknoloji çevre iklim ışık kirliliği şehir İstanbul "
+    "Ankara İzmir Diyarbakır ekonomi özgürlük sorumluluk toplum gençlik spor sağlık üniversite sınav "
+    "çalışma ödev kütüphane internet sosyal medya gizlilik güvenlik enerji güneş rüzgâr nükleer "
+    "ulaşım bisiklet trafik gürültü hayvan hakları doğa orman su kaynak tarım gıda kültür sanat müzik "
+    "tiyatro sinema kitap okuma yazma dil Türkçe İngilizce tarih bilim araştırma deney sonuç karar "
+    "oy lehinde aleyhinde tartışma fikir görüş katılımcı jüri hakem süre konuşma itiraz kanıt"
+).split()
+
+QUERIES = [
+    "eğitim", "EGITIM", "yapay zeka", "İSTANBUL", "istanbul trafik", "ışık", "ISIK", "sehir gurultu",
+    "öğretmen öğrenci", "ogretmen", "enerji güneş rüzgâr", "kütü", "diyarbak", "sosyal medya gizlilik",
+    "münazara", "oy lehinde", "bilim araştırma deney", "tarih", "çevre", "nükleer",
+]
+
+
+SYLLABLES = "ba be bı bi ça çe da de ğa ka ke la le ma me na ne ol öz pa ra re sa se şa şe ta te ya ye za zü".split()
+
+
+def vocabulary(rng: random.Random, size: int = 20000):
+    """The real words spread over the frequent end of a Zipf-distributed synthetic vocabulary."""
+    words = list(dict.fromkeys("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)))
+    for word in WORDS:
+        words.insert(rng.randrange(min(len(words), 2000)), word)
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1.0 / rank
+        cumulative.append(total)
+    return words, cumulative
+
+
+def sentence(rng: random.Random, vocab, words: int) -> str:
+    return " ".join(rng.choices(vocab[0], cum_weights=vocab[1], k=words)).capitalize()
+
+
+def make_corpus(debates: int, comments: int, seed: int = 7):
+    rng = random.Random(seed)
+    vocab = vocabulary(rng)
+    now = datetime.utcnow()
+    debate_docs = [
+        {
+            "id": str(uuid.uuid4()),
+            "title": sentence(rng, vocab, 5),
+            "topic": rng.choice(WORDS).capitalize(),
+            "description": sentence(rng, vocab, 40),
+            "status": "upcoming",
+            "created_at": now,
+        }
+        for _ in range(debates)
+    ]
+    comment_docs = [
+        {
+            "id": str(uuid.uuid4()),
+            "debate_id": rng.choice(debate_docs)["id"],
+            "content": sentence(rng, vocab, 20),
+            "author_name": "Katılımcı",
+            "created_at": now,
+        }
+        for _ in range(comments)
+    ]
+    return debate_docs, comment_docs
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debates", type=int, default=5000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    debates, comments = make_corpus(args.debates, args.comments)
+    start = time.perf_counter()
+    index = build_index(debates, comments)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(11)
+    latencies = []
+    for _ in range(args.queries):
+        query = rng.choice(QUERIES)
+        start = time.perf_counter()
+        index.search(query, limit=20)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    extra, _ = make_corpus(200, 0, seed=13)
+    start = time.perf_counter()
+    for debate in extra:
+        index.add_debate(debate)
+    write_ms = (time.perf_counter() - start) * 1000 / len(extra)
+
+    print(f"{args.debates} debates, {args.comments} comments, {index.term_count} terms")
+    print(f"  build:           {build_seconds:8.2f} s")
+    print(f"  query p50:       {percentile(latencies, 0.50):8.2f} ms")
+    print(f"  query p95:       {percentile(latencies, 0.95):8.2f} ms")
+    print(f"  query p99:       {percentile(latencies, 0.99):8.2f} ms")
+    print(f"  query mean:      {statistics.mean(latencies):8.2f} ms")
+    print(f"  add debate:      {write_ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""CPU cost of serializing a debate listing: old double Pydantic pass vs ListSerializer.
+
+    python benchmarks/bench_serialization.py [--count 1000] [--repeat 50]
+
+Only serialization is measured (no Mongo, no HTTP). The old path is what
+``get_debates`` did before: ``Debate(**doc)`` per document, then FastAPI's
+``response_model`` validation and ``JSONResponse`` rendering.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from bson import ObjectId  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from server import Debate, debate_serializer  # noqa: E402
+
+
+def make_documents(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "title": f"Münazara {i}",
+            "description": "Yapay zekâ eğitimde öğretmenlerin yerini almalı mı? " * 3,
+            "topic": "Teknoloji",
+            "start_time": now + timedelta(days=i),
+            "end_time": now + timedelta(days=i, hours=2),
+            "status": "upcoming",
+            "created_at": now - timedelta(minutes=i),
+            "votes_for": i * 3,
+            "votes_against": i * 2,
+            "participant_count": i % 8,
+            "created_by": "admin",
+        }
+        for i in range(count)
+    ]
+
+
+async def old_path(docs: List[dict], field) -> bytes:
+    models = [Debate(**doc) for doc in docs]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+def new_path(docs: List[dict]) -> bytes:
+    return debate_serializer.dumps(docs)
+
+
+def measure(fn, repeat: int) -> float:
+    """Best-of-``repeat`` CPU seconds for one call."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    docs = make_documents(args.count)
+    # The new path reads projected documents, so no _id
+    projected = [{k: v for k, v in doc.items() if k != "_id"} for doc in docs]
+    field = create_response_field(name="response", type_=List[Debate])
+    loop = asyncio.new_event_loop()
+
+    old_body = loop.run_until_complete(old_path(docs, field))
+    new_body = new_path(projected)
+    assert json.loads(old_body) == json.loads(new_body), "serializers disagree"
+
+    old = measure(lambda: loop.run_until_complete(old_path(docs, field)), args.repeat)
+    new = measure(lambda: new_path(projected), args.repeat)
+    validated = measure(lambda: debate_serializer.dumps(projected, trusted=False), args.repeat)
+    loop.close()
+
+    print(f"{args.count} debates, best of {args.repeat}")
+    print(f"  Debate(**doc) + response_model:  {old * 1000:8.2f} ms")
+    print(f"  ListSerializer (validated):      {validated * 1000:8.2f} ms  ({old / validated:5.1f}x)")
+    print(f"  ListSerializer (trusted):        {new * 1000:8.2f} ms  ({old / new:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
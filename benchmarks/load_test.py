@@ -0,0 +1,350 @@
+"""Concurrent mixed-workload load test for the API, with per-endpoint latency as JSON.
+
+In-process (no network, the app runs on this event loop via the ASGI transport)::
+
+    python benchmarks/load_test.py --mongo mongodb://localhost:27017 --duration 30
+    python benchmarks/load_test.py --mongo mock          # mongomock-motor stand-in, no mongod
+
+Against a running server (its own MONGO_URL applies)::
+
+    uvicorn server:app --port 8001 --workers 4           # from backend/
+    python benchmarks/load_test.py --url http://127.0.0.1:8001
+
+Workload mix (relative weights), concurrency and duration are configurable::
+
+    --mix list=50,get=15,vote=20,comment=10,search=3,upload=2 --concurrency 64
+
+``vote`` is a storm on a single hot debate. Every vote has a unique voter
+name, so each one is a real write. Results go to stdout or ``--output`` as
+JSON. ``--compare baseline.json`` prints the p95/RPS change per endpoint
+and exits non-zero when p95 regressed beyond ``--threshold``.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+DEFAULT_MIX = "list=50,get=15,vote=20,comment=10,search=3,upload=2"
+UPLOAD_TITLE = "Yük testi"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name: str, seconds: float, status: Optional[int]):
+        self.latencies[name].append(seconds * 1000)
+        if status is not None:
+            self.statuses[name][status] += 1
+        if status is None or status >= 400:
+            self.errors[name] += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        endpoints = {name: _stats(samples, self.errors[name], elapsed) for name, samples in self.latencies.items()}
+        for name, stats in endpoints.items():
+            stats["status_codes"] = {str(code): count for code, count in sorted(self.statuses[name].items())}
+        everything = list(itertools.chain.from_iterable(self.latencies.values()))
+        return {"endpoints": endpoints, "total": _stats(everything, sum(self.errors.values()), elapsed)}
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def _stats(samples: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50), 3),
+        "p95_ms": round(_percentile(ordered, 0.95), 3),
+        "p99_ms": round(_percentile(ordered, 0.99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def _jpeg(size: int = 256) -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGB", (size, size))
+    image.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(size) for x in range(size)])
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, admin_token: str, debate_ids: List[str]):
+        self.client = client
+        self.recorder = recorder
+        self.admin = {"Authorization": f"Bearer {admin_token}"}
+        self.debate_ids = debate_ids
+        self.hot_debate = debate_ids[0]
+        self.photo = _jpeg()
+        self._counter = itertools.count()
+
+    async def call(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            pass
+        self.recorder.record(name, time.perf_counter() - start, status)
+
+    async def list(self):
+        await self.call("GET /api/debates", "GET", "/api/debates", params={"limit": 50})
+
+    async def get(self):
+        await self.call("GET /api/debates/{id}", "GET", f"/api/debates/{random.choice(self.debate_ids)}")
+
+    async def vote(self):
+        await self.call("POST /api/debates/vote", "POST", "/api/debates/vote", json={
+            "debate_id": self.hot_debate,
+            "vote_type": random.choice(("for", "against")),
+            "voter_name": f"load-{uuid.uuid4().hex}",
+        })
+
+    async def comment(self):
+        await self.call("POST /api/comments", "POST", "/api/comments", json={
+            "debate_id": random.choice(self.debate_ids),
+            "author_name": "Yük Testi",
+            "content": f"Yük testi yorumu {next(self._counter)}: eğitimde yapay zekâ tartışması",
+        })
+
+    async def search(self):
+        query = random.choice(("eğitim", "ISIK", "yapay zek", "münazara", "şehir"))
+        await self.call("GET /api/search", "GET", "/api/search", params={"q": query})
+
+    async def upload(self):
+        # Unique bytes per upload so content-addressed dedup does not short-circuit the write
+        data = self.photo + uuid.uuid4().bytes
+        await self.call(
+            "POST /api/photos/upload", "POST", "/api/photos/upload",
+            files={"file": ("load.jpg", data, "image/jpeg")},
+            params={"title": UPLOAD_TITLE},
+            headers=self.admin,
+        )
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("list", "get", "vote", "comment", "search", "upload"):
+            raise SystemExit(f"Unknown workload {name!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def seed(client: httpx.AsyncClient, admin_token: str, count: int) -> List[str]:
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    now = datetime.now(timezone.utc)
+    ids = []
+    for i in range(count):
+        response = await client.post("/api/debates", headers=headers, json={
+            "title": f"Yük testi münazarası {i}",
+            "description": "Eğitimde yapay zekâ kullanımı öğretmenlerin yerini almalı mı? " * 4,
+            "topic": random.choice(("Eğitim", "Teknoloji", "Çevre", "Şehir")),
+            "start_time": (now + timedelta(days=1)).isoformat(),
+            "end_time": (now + timedelta(days=1, hours=2)).isoformat(),
+        })
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def remove_uploads(client: httpx.AsyncClient, admin_token: str):
+    """Delete the photos this run uploaded so their files do not pile up in storage."""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    cursor = None
+    doomed = []
+    while True:
+        params = {"limit": 500, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/photos", params=params)
+        doomed += [photo["id"] for photo in response.json() if photo["title"] == UPLOAD_TITLE]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    for photo_id in doomed:
+        await client.delete(f"/api/photos/{photo_id}", headers=headers)
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/api/admin/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def drive(workload: Workload, mix: Dict[str, float], concurrency: int, duration: float, requests: int) -> float:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+    remaining = itertools.count()
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            if requests and next(remaining) >= requests:
+                return
+            await getattr(workload, random.choices(names, weights)[0])()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def in_process_app(mongo: str):
+    """Import server.py with its Mongo client pointed at ``mongo`` (a URL, or "mock")."""
+    if mongo != "mock":
+        os.environ["MONGO_URL"] = mongo
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = os.environ.get("LOAD_TEST_DB_NAME", "load_test")
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    if mongo == "mock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--mongo mock needs mongomock-motor (pip install -r backend/requirements-dev.txt)")
+        # Pool and listener options mean nothing to the stand-in
+        server.mongo_client_factory = lambda url, **options: AsyncMongoMockClient()
+        # mongomock has no change streams
+        server.INVALIDATION_MODE = "polling"
+    return server
+
+
+async def run(args) -> Dict:
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    server = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        server = in_process_app(args.mongo)
+        if not args.keep_data and args.mongo != "mock":
+            # Before startup, so the app builds its indexes on the fresh database
+            seed_client = server.mongo_client_factory(os.environ["MONGO_URL"])
+            await seed_client.drop_database(os.environ["DB_NAME"])
+            seed_client.close()
+        await server.app.router.startup()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=server.app), base_url="http://load-test", timeout=args.timeout
+        )
+    try:
+        token = await login(client, args.admin_user, args.admin_password)
+        debate_ids = await seed(client, token, args.debates)
+        workload = Workload(client, recorder, token, debate_ids)
+        if args.warmup:
+            await drive(workload, mix, args.concurrency, args.warmup, 0)
+            recorder = workload.recorder = Recorder()
+        elapsed = await drive(workload, mix, args.concurrency, args.duration, args.requests)
+        if not args.keep_data:
+            if server is not None:
+                # Let rendition jobs finish before their photos disappear
+                await asyncio.gather(*server.derivative_tasks, return_exceptions=True)
+            await remove_uploads(client, token)
+    finally:
+        await client.aclose()
+        if server is not None:
+            await server.app.router.shutdown()
+    return {
+        "config": {
+            "target": args.url or f"asgi ({'mongomock' if args.mongo == 'mock' else args.mongo})",
+            "mix": mix,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "debates": args.debates,
+        },
+        "environment": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+        },
+        **recorder.summary(elapsed),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """Print per-endpoint changes; True if any p95 regressed by more than ``threshold``."""
+    regressed = False
+    print(f"{'endpoint':32} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'rps base':>10} {'rps now':>10}", file=sys.stderr)
+    for name, now in sorted(current["endpoints"].items()):
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        change = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        flag = " !" if change > threshold else ""
+        regressed = regressed or bool(flag)
+        print(
+            f"{name:32} {base['p95_ms']:10.2f} {now['p95_ms']:10.2f} {change:+8.1%} "
+            f"{base['rps']:10.1f} {now['rps']:10.1f}{flag}",
+            file=sys.stderr,
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server; default is in-process")
+    parser.add_argument("--mongo", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+                        help='In-process only: Mongo URL, or "mock" for mongomock-motor')
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of unrecorded load first")
+    parser.add_argument("--debates", type=int, default=50, help="Debates to seed")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--admin-user", default="debateclub2025")
+    parser.add_argument("--admin-password", default="onlinedebate")
+    parser.add_argument("--keep-data", action="store_true", help="Do not drop the in-process database first")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed p95 regression (fraction)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(baseline, report, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,10 @@ function App() {
   const [photos, setPhotos] = useState([]);
   const [selectedDebate, setSelectedDebate] = useState(null);
   const [comments, setComments] = useState([]);
+  // Sonraki sayfaların imleçleri (X-Next-Cursor); null ise liste bitti
+  const [debatesCursor, setDebatesCursor] = useState(null);
+  const [photosCursor, setPhotosCursor] = useState(null);
+  const [commentsCursor, setCommentsCursor] = useState(null);
   const [activeTab, setActiveTab] = useState('debates');
   const [isOnline, setIsOnline] = useState(navigator.onLine);
   const [notificationsEnabled, setNotificationsEnabled] = useState(false);
@@ -89,6 +93,40 @@ function App() {
     checkUserAuth();
   }, [token]);
 
+  // Açık münazaranın canlı akışı: oy, katılımcı, yorum ve durum değişiklikleri (SSE)
+  useEffect(() => {
+    if (!selectedDebate) return undefined;
+    const debateId = selectedDebate.id;
+    const source = new EventSource(`${API}/debates/${debateId}/stream`);
+    const updateDebate = (fields) => {
+      setDebates((prev) => prev.map((d) => (d.id === debateId ? { ...d, ...fields } : d)));
+    };
+    const parse = (handler) => (event) => handler(JSON.parse(event.data));
+
+    source.addEventListener('snapshot', parse(updateDebate));
+    source.addEventListener('tally', parse(updateDebate));
+    source.addEventListener('status', parse(updateDebate));
+    source.addEventListener('participant', parse(({ participant_count }) => {
+      if (participant_count !== undefined) updateDebate({ participant_count });
+    }));
+    source.addEventListener('comment', parse((comment) => {
+      setComments((prev) => (
+        prev.some((c) => c.id === comment.id) ? prev : [comment, ...prev]
+      ));
+    }));
+    // Sunucu kuyruğu taştı ya da kaçan olayların ayrıntısı yok: yeniden yükle
+    source.addEventListener('resync', async () => {
+      refreshComments(debateId);
+      try {
+        const response = await axios.get(`${API}/debates/${debateId}`);
+        updateDebate(response.data);
+      } catch (error) {
+        console.error('Münazara yenilenirken hata:', error);
+      }
+    });
+    return () => source.close();
+  }, [selectedDebate?.id]);
+
   // Push bildirimleri için service worker'ı kaydet
   useEffect(() => {
     if ('serviceWorker' in navigator && 'PushManager' in window) {
@@ -223,16 +261,22 @@ function App() {
     return outputArray;
   };
 
-  const fetchDebates = async () => {
+  // Sayfalı listeler: imleç verilirse sonraki sayfa mevcut listeye eklenir
+  const fetchDebates = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/debates`);
-      setDebates(response.data);
-      // Çevrimdışı kullanım için önbelleğe al
-      localStorage.setItem('debates', JSON.stringify(response.data));
+      const response = await axios.get(`${API}/debates`, { params: cursor ? { cursor } : {} });
+      const page = response.data;
+      setDebatesCursor(response.headers['x-next-cursor'] || null);
+      setDebates((prev) => {
+        const next = cursor ? [...prev, ...page] : page;
+        // Çevrimdışı kullanım için önbelleğe al
+        localStorage.setItem('debates', JSON.stringify(next));
+        return next;
+      });
     } catch (error) {
       console.error('Münazaralar yüklenirken hata:', error);
       // Çevrimdışıysa yerel depolamadan yükle
-      if (!isOnline) {
+      if (!isOnline && !cursor) {
         const cachedDebates = localStorage.getItem('debates');
         if (cachedDebates) {
           setDebates(JSON.parse(cachedDebates));
@@ -241,16 +285,21 @@ function App() {
     }
   };
 
-  const fetchPhotos = async () => {
+  const fetchPhotos = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/photos`);
-      setPhotos(response.data);
-      // Çevrimdışı kullanım için fotoğrafları önbelleğe al
-      localStorage.setItem('photos', JSON.stringify(response.data));
+      const response = await axios.get(`${API}/photos`, { params: cursor ? { cursor } : {} });
+      const page = response.data;
+      setPhotosCursor(response.headers['x-next-cursor'] || null);
+      setPhotos((prev) => {
+        const next = cursor ? [...prev, ...page] : page;
+        // Çevrimdışı kullanım için fotoğrafları önbelleğe al
+        localStorage.setItem('photos', JSON.stringify(next));
+        return next;
+      });
     } catch (error) {
       console.error('Fotoğraflar yüklenirken hata:', error);
       // Çevrimdışıysa yerel depolamadan yükle
-      if (!isOnline) {
+      if (!isOnline && !cursor) {
         const cachedPhotos = localStorage.getItem('photos');
         if (cachedPhotos) {
           setPhotos(JSON.parse(cachedPhotos));
@@ -259,15 +308,29 @@ function App() {
     }
   };
 
-  const fetchComments = async (debateId) => {
+  const fetchComments = async (debateId, cursor = null) => {
     try {
-      const response = await axios.get(`${API}/comments/${debateId}`);
-      setComments(response.data);
+      const response = await axios.get(`${API}/comments/${debateId}`, { params: cursor ? { cursor } : {} });
+      setCommentsCursor(response.headers['x-next-cursor'] || null);
+      setComments((prev) => (cursor ? [...prev, ...response.data] : response.data));
     } catch (error) {
       console.error('Yorumlar yüklenirken hata:', error);
     }
   };
 
+  // İlk sayfayı yeniden çekip yenilerini başa ekler; yüklenmiş sayfalar ve sayfa imleci korunur
+  const refreshComments = async (debateId) => {
+    try {
+      const response = await axios.get(`${API}/comments/${debateId}`);
+      setComments((prev) => {
+        const known = new Set(prev.map((c) => c.id));
+        return [...response.data.filter((c) => !known.has(c.id)), ...prev];
+      });
+    } catch (error) {
+      console.error('Yorumlar yenilenirken hata:', error);
+    }
+  };
+
   const handleLogin = async (e) => {
     e.preventDefault();
     try {
@@ -297,7 +360,12 @@ function App() {
       return;
     }
     try {
-      await axios.post(`${API}/debates`, debateForm);
+      // datetime-local değerleri saat dilimsizdir; sunucu UTC bekler
+      await axios.post(`${API}/debates`, {
+        ...debateForm,
+        start_time: new Date(debateForm.start_time).toISOString(),
+        end_time: new Date(debateForm.end_time).toISOString()
+      });
       setDebateForm({
         title: '',
         description: '',
@@ -338,13 +406,17 @@ function App() {
       return;
     }
     try {
-      await axios.post(`${API}/debates/vote`, {
+      const response = await axios.post(`${API}/debates/vote`, {
         debate_id: debateId,
         vote_type: voteType,
         voter_name: voteForm.voter_name
       });
+      const { votes_for, votes_against } = response.data;
       setVoteForm({ voter_name: '' });
-      fetchDebates();
+      // Yanıttaki güncel oy sayılarını kullan, tüm listeyi yeniden yükleme
+      setDebates((prev) => prev.map((d) => (
+        d.id === debateId ? { ...d, votes_for, votes_against } : d
+      )));
       alert('Oyunuz başarıyla kaydedildi!');
     } catch (error) {
       alert(error.response?.data?.detail || 'Oy verirken hata');
@@ -361,12 +433,15 @@ function App() {
       return;
     }
     try {
-      await axios.post(`${API}/debates/join`, {
+      const response = await axios.post(`${API}/debates/join`, {
         debate_id: debateId,
         participant_name: joinForm.participant_name
       });
+      const { participant_count } = response.data;
       setJoinForm({ participant_name: '' });
-      fetchDebates();
+      setDebates((prev) => prev.map((d) => (
+        d.id === debateId ? { ...d, participant_count } : d
+      )));
       alert('Münazaraya başarıyla katıldınız!');
     } catch (error) {
       alert(error.response?.data?.detail || 'Münazaraya katılırken hata');
@@ -451,7 +526,9 @@ function App() {
   };
 
   const formatDate = (dateString) => {
-    return new Date(dateString).toLocaleString('tr-TR');
+    // Sunucu saatleri saat dilimi eki olmadan UTC gönderir
+    const utc = /T[^Z+-]*$/.test(dateString) ? `${dateString}Z` : dateString;
+    return new Date(utc).toLocaleString('tr-TR');
   };
 
   const getStatusColor = (status) => {
@@ -655,7 +732,7 @@ function App() {
                       <div className="flex items-center space-x-2">
                         <div className="flex items-center space-x-1 text-sm text-gray-500">
                           <Users className="h-4 w-4" />
-                          <span>{debate.participants?.length || 0}</span>
+                          <span>{debate.participant_count || 0}</span>
                         </div>
                         {/* Admin silme butonu */}
                         {isAdmin && (
@@ -746,7 +823,7 @@ function App() {
                     </div>
 
                     {/* Yorumlar */}
-                    <Dialog>
+                    <Dialog onOpenChange={(open) => { if (!open) setSelectedDebate(null); }}>
                       <DialogTrigger asChild>
                         <Button 
                           size="sm" 
@@ -794,6 +871,16 @@ function App() {
                                 <p className="text-gray-700">{comment.content}</p>
                               </div>
                             ))}
+                            {commentsCursor && (
+                              <Button
+                                size="sm"
+                                variant="outline"
+                                onClick={() => fetchComments(debate.id, commentsCursor)}
+                                className="w-full border-red-300 text-red-700 hover:bg-red-50"
+                              >
+                                Daha fazla yorum yükle
+                              </Button>
+                            )}
                           </div>
                         </div>
                       </DialogContent>
@@ -802,6 +889,17 @@ function App() {
                 </Card>
               ))}
             </div>
+            {debatesCursor && (
+              <div className="flex justify-center">
+                <Button
+                  variant="outline"
+                  onClick={() => fetchDebates(debatesCursor)}
+                  className="border-red-300 text-red-700 hover:bg-red-50"
+                >
+                  Daha fazla yükle
+                </Button>
+              </div>
+            )}
           </TabsContent>
 
           {/* Program Sekmesi */}
@@ -886,6 +984,17 @@ function App() {
                     </Card>
                   ))}
                 </div>
+                {photosCursor && (
+                  <div className="flex justify-center mt-6">
+                    <Button
+                      variant="outline"
+                      onClick={() => fetchPhotos(photosCursor)}
+                      className="border-red-300 text-red-700 hover:bg-red-50"
+                    >
+                      Daha fazla yükle
+                    </Button>
+                  </div>
+                )}
               </CardContent>
             </Card>
           </TabsContent>
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def mongo():
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo["test_database"]
+
+
+@pytest.fixture
+def server(mongo, monkeypatch):
+    """server.py wired to an in-memory Mongo; change streams are not available there, so poll."""
+    import server
+
+    monkeypatch.setattr(server, "mongo_client_factory", lambda url, **options: mongo)
+    monkeypatch.setattr(server, "INVALIDATION_MODE", "polling")
+    server.response_cache.clear()
+    server.session_cache.clear()
+    return server
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def admin_headers(server):
+    return {"Authorization": "Bearer " + server.create_access_token({"sub": "admin"})}
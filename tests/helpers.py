@@ -0,0 +1,27 @@
+"""Shared by the test modules; conftest.py puts backend/ on sys.path first."""
+import asyncio
+from datetime import datetime, timedelta
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_debate(debate_id="d1", **fields):
+    now = datetime.utcnow()
+    debate = {
+        "id": debate_id,
+        "title": f"Münazara {debate_id}",
+        "description": "açıklama",
+        "topic": "konu",
+        "start_time": now + timedelta(hours=1),
+        "end_time": now + timedelta(hours=2),
+        "status": "upcoming",
+        "created_at": now,
+        "created_by": "admin",
+        "votes_for": 0,
+        "votes_against": 0,
+        "participant_count": 0,
+    }
+    debate.update(fields)
+    return debate
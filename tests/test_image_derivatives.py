@@ -0,0 +1,45 @@
+import pytest
+from PIL import Image
+
+from image_derivatives import DerivativeGenerator
+from storage_backends import LocalStorage
+from tests.helpers import run
+
+
+@pytest.fixture
+def generator(tmp_path):
+    generator = DerivativeGenerator(tmp_path / "work", max_workers=1)
+    generator.start()
+    yield generator
+    generator.close()
+
+
+def test_renditions_are_generated_stored_and_recorded(generator, db, tmp_path):
+    storage = LocalStorage(tmp_path / "store")
+    for directory in ("photos", "renditions"):
+        (tmp_path / "store" / directory).mkdir(parents=True)
+    Image.new("RGB", (800, 600), (200, 30, 30)).save(tmp_path / "store" / "photos" / "abc.png")
+    photo = {"id": "p1", "filename": "abc.png"}
+    run(db.photos.insert_one(dict(photo)))
+
+    assert run(generator.generate_for_photo(db, storage, photo)) is True
+
+    stored = run(db.photos.find_one({"id": "p1"}))
+    assert sorted((r["width"], r["filename"]) for r in stored["renditions"]) == [
+        (320, "abc_320.jpg"), (320, "abc_320.webp"), (640, "abc_640.jpg"), (640, "abc_640.webp"),
+    ]
+    assert all(r["height"] == r["width"] * 3 // 4 for r in stored["renditions"])
+    assert stored["placeholder"].startswith("data:image/jpeg;base64,")
+    for rendition in stored["renditions"]:
+        with Image.open(tmp_path / "store" / "renditions" / rendition["filename"]) as image:
+            assert image.size == (rendition["width"], rendition["height"])
+
+
+def test_unreadable_source_is_reported_not_recorded(generator, db, tmp_path):
+    storage = LocalStorage(tmp_path / "store")
+    (tmp_path / "store" / "photos").mkdir(parents=True)
+    (tmp_path / "store" / "photos" / "bad.png").write_bytes(b"not an image")
+    run(db.photos.insert_one({"id": "p1", "filename": "bad.png"}))
+
+    assert run(generator.generate_for_photo(db, storage, {"id": "p1", "filename": "bad.png"})) is False
+    assert "renditions" not in run(db.photos.find_one({"id": "p1"}))
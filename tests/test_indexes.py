@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from indexes import ensure_indexes
+from tests.helpers import run
+
+NOW = datetime(2026, 1, 1)
+
+
+def test_duplicate_users_are_merged_before_the_email_index(db):
+    async def scenario():
+        await db.users.insert_many([
+            {"id": "u1", "email": "a@x.com", "name": "A", "created_at": NOW},
+            {"id": "u2", "email": "a@x.com", "name": "A", "created_at": NOW + timedelta(days=1)},
+            {"id": "u3", "email": "b@x.com", "name": "B", "created_at": NOW},
+        ])
+        await db.sessions.insert_one({"session_token": "t", "user_id": "u2", "expires_at": datetime.utcnow() + timedelta(days=7)})
+        await ensure_indexes(db)
+        users = sorted([user["id"] async for user in db.users.find()])
+        return users, await db.sessions.find_one({"session_token": "t"})
+
+    users, session = run(scenario())
+
+    assert users == ["u1", "u3"]
+    assert session["user_id"] == "u1"
+
+
+def test_duplicate_push_subscriptions_keep_the_newest(db):
+    async def scenario():
+        await db.push_subscriptions.insert_many([
+            {"id": "old", "endpoint": "https://push/1", "keys": {"auth": "1"}, "created_at": NOW},
+            {"id": "new", "endpoint": "https://push/1", "keys": {"auth": "2"}, "created_at": NOW + timedelta(days=1)},
+        ])
+        await ensure_indexes(db)
+        return [sub["id"] async for sub in db.push_subscriptions.find()]
+
+    assert run(scenario()) == ["new"]
+
+
+def test_repeated_subscribe_is_not_an_error(client, db):
+    body = {"endpoint": "https://push/1", "keys": {"p256dh": "k", "auth": "a"}}
+
+    first = client.post("/api/notifications/subscribe", json=body)
+    second = client.post("/api/notifications/subscribe", json=body)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["message"] == "Zaten abone olunmuş"
+    assert run(db.push_subscriptions.count_documents({})) == 1
+
+
+def test_login_reuses_the_user_with_that_email(client, server, db, monkeypatch):
+    tokens = iter(["t1", "t2"])
+
+    async def session_data(session_id):
+        return {"email": "a@x.com", "name": "A", "session_token": next(tokens)}
+
+    monkeypatch.setattr(server, "get_session_data_from_emergent", session_data)
+
+    assert client.post("/api/auth/callback", params={"session_id": "s"}).status_code == 200
+    assert client.post("/api/auth/callback", params={"session_id": "s"}).status_code == 200
+
+    users = run(db.users.find({}, {"_id": 0}).to_list(None))
+    assert len(users) == 1 and users[0]["email"] == "a@x.com"
+    session = run(db.sessions.find_one({}))
+    assert (session["session_token"], session["user_id"]) == ("t2", users[0]["id"])
@@ -0,0 +1,185 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from invalidation import ANY, VERSIONS_COLLECTION, InvalidationHub, WriteVersionBumper
+from tests.helpers import run
+
+
+def recording_hub(db, **options):
+    hub = InvalidationHub(db, collections=("debates", "comments"), **options)
+    changes = []
+    hub.subscribe(hub.collections, changes.append)
+    return hub, changes
+
+
+def test_polling_publishes_other_workers_bumps_only(db):
+    async def scenario():
+        writer, writer_changes = recording_hub(db, mode="polling")
+        reader, reader_changes = recording_hub(db, mode="polling")
+        await writer._poll(initial=True)
+        await reader._poll(initial=True)
+
+        await writer._write_versions({"debates"})
+        await writer._poll()
+        await reader._poll()
+        assert writer_changes == []
+        assert [(c.collection, c.operation) for c in reader_changes] == [("debates", ANY)]
+
+        # A version moved by both workers between two polls has the other one's write in it for each
+        await writer._write_versions({"comments"})
+        await reader._write_versions({"comments"})
+        await writer._poll()
+        await reader._poll()
+        assert [(c.collection, c.operation) for c in writer_changes] == [("comments", ANY)]
+        assert [(c.collection, c.operation) for c in reader_changes[1:]] == [("comments", ANY)]
+
+    run(scenario())
+
+
+def test_polling_coalesces_bursts_of_writes(db):
+    async def scenario():
+        hub, _ = recording_hub(db, mode="polling", poll_interval=0.2)
+        await hub.start()
+        for _ in range(50):
+            hub.mark_written("debates")
+        await asyncio.sleep(0.05)
+        first = await db[VERSIONS_COLLECTION].find_one({"_id": "debates"})
+        for _ in range(50):
+            hub.mark_written("debates")
+        await asyncio.sleep(0.05)
+        waiting = await db[VERSIONS_COLLECTION].find_one({"_id": "debates"})
+        await asyncio.sleep(0.25)
+        second = await db[VERSIONS_COLLECTION].find_one({"_id": "debates"})
+        await hub.stop()
+        return first["version"], waiting["version"], second["version"]
+
+    assert run(scenario()) == (1, 1, 2)
+
+
+class FakeStream:
+    """A change stream playing back a script of change documents and errors, then idling."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.resume_token = None
+        self.closed = False
+
+    async def try_next(self):
+        return None
+
+    async def next(self):
+        if not self.script:
+            await asyncio.Event().wait()
+        item = self.script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        self.resume_token = item["_id"]
+        return item
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    def __init__(self, reads):
+        self.reads = reads
+
+    async def find_one(self, key):
+        self.reads.append(key)
+        return {**key, "title": "Yeni başlık"}
+
+
+class FakeDatabase:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.resumed_after = []
+        self.reads = []
+
+    def watch(self, pipeline, resume_after=None):
+        self.resumed_after.append(resume_after)
+        return self.streams.pop(0)
+
+    def __getitem__(self, name):
+        return FakeCollection(self.reads)
+
+
+def debate_update(token, **updated_fields):
+    return {
+        "_id": token,
+        "operationType": "update",
+        "ns": {"db": "test", "coll": "debates"},
+        "documentKey": {"_id": "oid1"},
+        "updateDescription": {"updatedFields": updated_fields, "removedFields": []},
+    }
+
+
+async def play(hub, until):
+    await hub.start()
+    for _ in range(100):
+        if until():
+            break
+        await asyncio.sleep(0.01)
+    await hub.stop()
+
+
+def test_change_stream_resumes_after_the_last_token():
+    db = FakeDatabase(
+        FakeStream([debate_update("t1", votes_for=3), AutoReconnect("stepdown")]),
+        FakeStream([debate_update("t2", title="Yeni başlık")]),
+    )
+    hub, changes = recording_hub(db, mode="change_stream", retry_delay=0, lookup_fields={"debates": ("title",)})
+    run(play(hub, lambda: len(changes) == 2))
+
+    assert db.resumed_after == [None, "t1"]
+    assert hub.reconnects == 1 and hub.resume_token == "t2"
+    counters, title = changes
+    # Counter updates carry their values; only the lookup field is worth a read
+    assert counters.updates == {"votes_for": 3} and counters.document is None
+    assert title.document["title"] == "Yeni başlık"
+    assert db.reads == [{"_id": "oid1"}] and hub.lookups == 1
+
+
+def test_lost_change_history_invalidates_every_collection():
+    db = FakeDatabase(
+        FakeStream([debate_update("t1", votes_for=1), OperationFailure("history lost", code=286)]),
+        FakeStream([]),
+    )
+    hub, changes = recording_hub(db, mode="change_stream", retry_delay=0)
+    run(play(hub, lambda: len(db.resumed_after) == 2))
+
+    assert [(c.collection, c.operation) for c in changes[1:]] == [("debates", ANY), ("comments", ANY)]
+    assert hub.resets == 1 and hub.reconnects == 0
+    # The token is past the oplog, so the fresh stream starts from now
+    assert db.resumed_after == [None, None]
+
+
+class RecordingHub:
+    def __init__(self):
+        self.written = []
+
+    def mark_written(self, collection):
+        self.written.append(collection)
+
+
+def write(bumper, request_id, command_name, command):
+    started = SimpleNamespace(command_name=command_name, command=command, connection_id=("h", 1), request_id=request_id)
+    bumper.started(started)
+    bumper.succeeded(SimpleNamespace(connection_id=("h", 1), request_id=request_id))
+
+
+def test_bumper_leaves_out_counter_only_updates():
+    bumper = WriteVersionBumper(ignore=("votes",), ignore_fields={"debates": ("votes_for", "votes_against")})
+    bumper.hub = RecordingHub()
+
+    write(bumper, 1, "insert", {"insert": "votes", "documents": [{}]})
+    write(bumper, 2, "update", {"update": "debates", "updates": [{"q": {}, "u": {"$inc": {"votes_for": 1}}}]})
+    write(bumper, 3, "findAndModify", {"findAndModify": "debates", "update": {"$inc": {"votes_against": 2}}})
+    assert bumper.hub.written == []
+
+    write(bumper, 4, "update", {"update": "debates", "updates": [{"q": {}, "u": {"$set": {"status": "live"}}}]})
+    write(bumper, 5, "update", {"update": "debates", "updates": [{"q": {}, "u": {"title": "replaced"}}]})
+    write(bumper, 6, "findAndModify", {"findAndModify": "debates", "remove": True})
+    write(bumper, 7, "delete", {"delete": "debates", "deletes": [{"q": {}, "limit": 1}]})
+    assert bumper.hub.written == ["debates"] * 4
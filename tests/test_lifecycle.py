@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from lifecycle import ACTIVE, COMPLETED, UPCOMING, LifecycleScheduler
+from tests.helpers import make_debate, run
+
+
+@pytest.fixture
+def transitions():
+    return []
+
+
+@pytest.fixture
+def scheduler(db, transitions):
+    async def on_transition(debate, old_status, new_status):
+        transitions.append((debate["id"], old_status, new_status))
+    return LifecycleScheduler(db, on_transition)
+
+
+def started(debate_id="d1", **fields):
+    now = datetime.utcnow()
+    return make_debate(debate_id, start_time=now - timedelta(seconds=1), end_time=now + timedelta(hours=1), **fields)
+
+
+def test_due_debate_starts_once(scheduler, db, transitions):
+    async def scenario():
+        await db.debates.insert_one(started())
+        await scheduler.reload()
+        # An edit on this worker queues the debate again
+        scheduler.schedule(await db.debates.find_one({"id": "d1"}, {"_id": 0}))
+        await scheduler._fire_due()
+        return await db.debates.find_one({"id": "d1"})
+
+    debate = run(scenario())
+
+    assert debate["status"] == ACTIVE
+    assert transitions == [("d1", UPCOMING, ACTIVE)]
+    assert scheduler.stats()["transitions"] == 1
+    # The next transition, to completed, is queued
+    assert scheduler.stats()["scheduled"] == 1
+
+
+def test_losing_worker_does_not_notify(db, transitions):
+    async def on_transition(debate, old_status, new_status):
+        transitions.append(new_status)
+
+    winner, loser = LifecycleScheduler(db, on_transition), LifecycleScheduler(db, on_transition)
+
+    async def scenario():
+        await db.debates.insert_one(started())
+        await winner.reload()
+        await loser.reload()
+        await winner._fire_due()
+        await loser._fire_due()
+
+    run(scenario())
+
+    assert transitions == [ACTIVE]
+    assert (winner.transitions, winner.lost) == (1, 0)
+    assert (loser.transitions, loser.lost) == (0, 1)
+    assert loser.stats()["scheduled"] == 1
+
+
+def test_overdue_debate_goes_straight_to_completed(scheduler, db, transitions):
+    now = datetime.utcnow()
+
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1", start_time=now - timedelta(hours=2), end_time=now - timedelta(hours=1)))
+        await scheduler.reload()
+        await scheduler._fire_due()
+
+    run(scenario())
+
+    assert transitions == [("d1", UPCOMING, COMPLETED)]
+    assert scheduler.stats()["scheduled"] == 0
+
+
+def test_rescheduled_debate_is_left_alone(scheduler, db, transitions):
+    async def scenario():
+        await db.debates.insert_one(started())
+        await scheduler.reload()
+        # Moved to tomorrow by an edit on another worker after this one loaded it
+        later = datetime.utcnow() + timedelta(days=1)
+        await db.debates.update_one({"id": "d1"}, {"$set": {"start_time": later, "end_time": later + timedelta(hours=1)}})
+        await scheduler._fire_due()
+        return await db.debates.find_one({"id": "d1"})
+
+    assert run(scenario())["status"] == UPCOMING
+    assert transitions == []
+
+
+def test_reload_keeps_one_entry_per_debate(scheduler, db):
+    async def scenario():
+        await db.debates.insert_one(started())
+        await scheduler.reload()
+        scheduler.schedule(await db.debates.find_one({"id": "d1"}, {"_id": 0}))
+        await scheduler.reload()
+        # Edited far into the future here: outside the reload window but still queued
+        later = datetime.utcnow() + timedelta(days=1)
+        scheduler.schedule(make_debate("d2", start_time=later, end_time=later + timedelta(hours=1)))
+        await scheduler.reload()
+
+    run(scenario())
+
+    assert scheduler.stats()["scheduled"] == 2
+    live = [entry for entry in scheduler._heap if scheduler._is_live(entry)]
+    assert sorted(entry[1] for entry in live) == ["d1", "d2"]
+
+
+def test_update_of_debate_deleted_meanwhile_is_404(client, db, admin_headers, monkeypatch):
+    collection = type(db.debates)
+    update_one = collection.update_one
+
+    async def update_then_delete(self, *args, **kwargs):
+        result = await update_one(self, *args, **kwargs)
+        # A delete from another request lands before the route reads the debate back
+        await self.delete_one({"id": "d1"})
+        return result
+
+    run(db.debates.insert_one(make_debate("d1")))
+    monkeypatch.setattr(collection, "update_one", update_then_delete)
+    now = datetime.now(timezone.utc)
+    body = {"title": "t", "description": "d", "topic": "k",
+            "start_time": (now + timedelta(hours=1)).isoformat(), "end_time": (now + timedelta(hours=2)).isoformat()}
+
+    response = client.put("/api/debates/d1", headers=admin_headers, json=body)
+
+    assert response.status_code == 404
+
+
+def test_debate_times_are_stored_in_utc(client, admin_headers):
+    # What the admin form sends for 18:00 in a datetime-local input in Istanbul (UTC+3)
+    istanbul = timezone(timedelta(hours=3))
+    local_input = datetime(2026, 5, 1, 18, 0)
+    body = {"title": "t", "description": "d", "topic": "k",
+            "start_time": local_input.replace(tzinfo=istanbul).astimezone(timezone.utc).isoformat(),
+            "end_time": (local_input + timedelta(hours=2)).replace(tzinfo=istanbul).isoformat()}
+
+    response = client.post("/api/debates", headers=admin_headers, json=body)
+
+    assert response.status_code == 200
+    debate = client.get(f"/api/debates/{response.json()['id']}").json()
+    assert debate["start_time"] == "2026-05-01T15:00:00"
+    assert debate["end_time"] == "2026-05-01T17:00:00"
+
+
+def test_debate_times_without_an_offset_are_rejected(client, admin_headers):
+    body = {"title": "t", "description": "d", "topic": "k",
+            "start_time": "2026-05-01T18:00", "end_time": "2026-05-01T20:00"}
+
+    response = client.post("/api/debates", headers=admin_headers, json=body)
+
+    assert response.status_code == 422
@@ -0,0 +1,128 @@
+import hashlib
+
+import pytest
+
+from photo_storage import (
+    MAX_FIELD_BYTES, MAX_PART_HEADER_BYTES, MAX_PARTS, MalformedUpload, UploadTooLarge, receive_multipart,
+)
+from tests.helpers import run
+
+BOUNDARY = "----formboundaryXyZ"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+IMAGE = bytes(range(256)) * 40
+
+
+def part(name, value, filename=None, content_type=None, extra_headers=b""):
+    disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+    headers = f"Content-Disposition: {disposition}\r\n".encode()
+    if content_type:
+        headers += f"Content-Type: {content_type}\r\n".encode()
+    return f"--{BOUNDARY}\r\n".encode() + headers + extra_headers + b"\r\n" + value + b"\r\n"
+
+
+def body(*parts, close=True):
+    return b"".join(parts) + (f"--{BOUNDARY}--\r\n".encode() if close else b"")
+
+
+async def chunks(data, size, fail_after=None):
+    for offset in range(0, len(data), size):
+        if fail_after is not None and offset >= fail_after:
+            raise ConnectionResetError("client went away")
+        yield data[offset:offset + size]
+
+
+def receive(data, tmp_path, size=7, max_bytes=1 << 20, fail_after=None):
+    return run(receive_multipart(CONTENT_TYPE, chunks(data, size, fail_after), tmp_path, max_bytes))
+
+
+def leftovers(tmp_path):
+    return list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 1 << 20])
+def test_fields_and_file_survive_any_chunking(tmp_path, size):
+    # Small chunks split the boundary and the headers at every possible offset
+    data = body(
+        part("title", "Münazara finali".encode()),
+        part("file", IMAGE, filename="foto.PNG", content_type="image/png"),
+        part("description", b""),
+    )
+
+    fields, upload = receive(data, tmp_path, size)
+
+    assert fields == {"title": "Münazara finali", "description": ""}
+    assert (upload.filename, upload.content_type) == ("foto.PNG", "image/png")
+    assert (upload.size, upload.sha256) == (len(IMAGE), hashlib.sha256(IMAGE).hexdigest())
+    assert upload.path.read_bytes() == IMAGE
+    assert leftovers(tmp_path) == [upload.path]
+
+
+def test_body_without_a_file(tmp_path):
+    fields, upload = receive(body(part("title", b"t")), tmp_path)
+
+    assert fields == {"title": "t"} and upload is None
+
+
+def test_file_over_the_limit_aborts_and_cleans_up(tmp_path):
+    data = body(part("file", IMAGE, filename="a.png"))
+
+    with pytest.raises(UploadTooLarge):
+        receive(data, tmp_path, size=512, max_bytes=len(IMAGE) - 1)
+
+    assert leftovers(tmp_path) == []
+
+
+def test_fields_over_their_budget_abort(tmp_path):
+    data = body(part("description", b"x" * (MAX_FIELD_BYTES + 1)))
+
+    with pytest.raises(UploadTooLarge):
+        receive(data, tmp_path, size=4096)
+
+
+def test_second_file_part_is_rejected(tmp_path):
+    data = body(part("file", IMAGE, filename="a.png"), part("file", IMAGE, filename="b.png"))
+
+    with pytest.raises(MalformedUpload):
+        receive(data, tmp_path)
+
+    assert leftovers(tmp_path) == []
+
+
+def test_oversized_part_headers_are_rejected(tmp_path):
+    # Each line is short enough for the parser's own per-line limit; together they are not
+    padding = b"".join(b"X-Padding-%d: %s\r\n" % (i, b"a" * 3000) for i in range(MAX_PART_HEADER_BYTES // 3000 + 1))
+    data = body(part("title", b"t", extra_headers=padding))
+
+    with pytest.raises(MalformedUpload):
+        receive(data, tmp_path, size=1024)
+
+
+def test_too_many_parts_are_rejected(tmp_path):
+    data = body(*(part(f"field{i}", b"") for i in range(MAX_PARTS + 1)))
+
+    with pytest.raises(MalformedUpload):
+        receive(data, tmp_path, size=1024)
+
+
+def test_truncated_body_is_rejected_and_cleaned_up(tmp_path):
+    data = body(part("file", IMAGE, filename="a.png"), close=False)
+
+    with pytest.raises(MalformedUpload):
+        receive(data, tmp_path, size=1024)
+
+    assert leftovers(tmp_path) == []
+
+
+def test_disconnect_mid_file_removes_the_temp_file(tmp_path):
+    data = body(part("file", IMAGE, filename="a.png"))
+
+    with pytest.raises(ConnectionResetError):
+        receive(data, tmp_path, size=1024, fail_after=4096)
+
+    assert leftovers(tmp_path) == []
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "multipart/form-data"])
+def test_other_content_types_are_rejected(tmp_path, content_type):
+    with pytest.raises(MalformedUpload):
+        run(receive_multipart(content_type, chunks(b"", 1), tmp_path, 100))
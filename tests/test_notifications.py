@@ -0,0 +1,102 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from http_client import HttpClient
+from notifications import HttpPushSender, NotificationDispatcher, PushSender
+from tests.helpers import run
+
+PAYLOAD = {"title": "Yeni Oy!", "body": "1 yeni oy", "url": "/"}
+
+
+class StubSender(PushSender):
+    """Records deliveries; endpoints listed in ``gone`` answer like an expired subscription."""
+
+    def __init__(self, gone=()):
+        self.gone = set(gone)
+        self.deliveries = []
+
+    async def send(self, subscription, payload):
+        self.deliveries.append((subscription["endpoint"], payload))
+        return subscription["endpoint"] not in self.gone
+
+
+async def subscribe(db, *endpoints):
+    await db.push_subscriptions.insert_many([{"endpoint": e, "keys": {"auth": e}} for e in endpoints])
+
+
+def test_stub_sender_gets_every_subscription_and_gone_ones_are_removed(db):
+    sender = StubSender(gone={"https://push/2"})
+
+    async def scenario():
+        await subscribe(db, "https://push/1", "https://push/2", "https://push/3")
+        dispatcher = NotificationDispatcher(db, sender, batch_size=2)
+        await dispatcher.start()
+        dispatcher.enqueue(PAYLOAD)
+        await dispatcher.stop()
+        remaining = sorted([s["endpoint"] async for s in db.push_subscriptions.find()])
+        return dispatcher, remaining
+
+    dispatcher, remaining = run(scenario())
+
+    assert sorted(endpoint for endpoint, _ in sender.deliveries) == ["https://push/1", "https://push/2", "https://push/3"]
+    assert remaining == ["https://push/1", "https://push/3"]
+    assert dispatcher.stats()["sent"] == 2
+
+
+def test_events_in_one_window_become_one_notification(db):
+    sender = StubSender()
+
+    async def scenario():
+        await subscribe(db, "https://push/1")
+        dispatcher = NotificationDispatcher(db, sender, coalesce_window=0.05)
+        await dispatcher.start()
+        for count in range(3):
+            dispatcher.enqueue({**PAYLOAD, "body": f"oy {count}"}, coalesce_key="vote:d1",
+                               summary=lambda n: f"{n} yeni oy")
+        dispatcher.enqueue({**PAYLOAD, "title": "Başka"}, coalesce_key="vote:d2")
+        await asyncio.sleep(0.1)
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = run(scenario())
+
+    assert sorted(payload["body"] for _, payload in sender.deliveries) == ["1 yeni oy", "3 yeni oy"]
+    assert dispatcher.stats()["coalesced"] == 2
+
+
+def test_http_sender_retries_gateway_errors_and_drops_expired_subscriptions(db):
+    attempts = {}
+
+    async def gateway(request):
+        endpoint = (await request.json())["subscription"]["endpoint"]
+        attempts[endpoint] = attempts.get(endpoint, 0) + 1
+        if endpoint.endswith("/gone"):
+            return web.Response(status=410)
+        if endpoint.endswith("/flaky") and attempts[endpoint] == 1:
+            return web.Response(status=503)
+        return web.Response(status=201)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/push", gateway)
+        async with TestServer(app) as server:
+            client = HttpClient()
+            await client.start()
+            try:
+                await subscribe(db, "https://push/ok", "https://push/flaky", "https://push/gone")
+                dispatcher = NotificationDispatcher(db, HttpPushSender(client, str(server.make_url("/push"))))
+                await dispatcher.start()
+                dispatcher.enqueue(PAYLOAD)
+                await dispatcher.stop()
+            finally:
+                await client.close()
+        remaining = sorted([s["endpoint"] async for s in db.push_subscriptions.find()])
+        return dispatcher, remaining
+
+    dispatcher, remaining = run(scenario())
+
+    assert attempts == {"https://push/ok": 1, "https://push/flaky": 2, "https://push/gone": 1}
+    assert remaining == ["https://push/flaky", "https://push/ok"]
+    assert (dispatcher.stats()["sent"], dispatcher.stats()["failed"]) == (2, 0)
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from tests.helpers import make_debate, run
+
+BASE = datetime(2026, 1, 1)
+
+
+def collect(client, url, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append([item["id"] for item in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_debate_pages_cover_every_debate_once_newest_first(client, db):
+    # d2 and d3 share a timestamp; the id breaks the tie
+    created = {"d1": BASE, "d2": BASE + timedelta(minutes=1), "d3": BASE + timedelta(minutes=1),
+               "d4": BASE + timedelta(minutes=2), "d5": BASE + timedelta(minutes=3)}
+    run(db.debates.insert_many([make_debate(debate_id, created_at=at) for debate_id, at in created.items()]))
+
+    pages = collect(client, "/api/debates", limit=2)
+
+    assert pages == [["d5", "d4"], ["d3", "d2"], ["d1"]]
+
+
+def test_last_full_page_has_no_cursor(client, db):
+    run(db.debates.insert_many([make_debate(f"d{i}", created_at=BASE + timedelta(minutes=i)) for i in range(4)]))
+
+    assert collect(client, "/api/debates", limit=2) == [["d3", "d2"], ["d1", "d0"]]
+
+
+def test_comment_pages_stay_within_the_debate(client, db):
+    run(db.comments.insert_many([
+        {"id": f"c{i}", "debate_id": "d1" if i % 2 else "d2", "content": "yorum", "author_name": "ali",
+         "created_at": BASE + timedelta(minutes=i)}
+        for i in range(7)
+    ]))
+
+    assert collect(client, "/api/comments/d1", limit=2) == [["c5", "c3"], ["c1"]]
+
+
+def test_malformed_cursor_is_rejected(client):
+    response = client.get("/api/debates", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
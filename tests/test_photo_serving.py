@@ -0,0 +1,30 @@
+import pytest
+from fastapi import HTTPException
+
+from photo_serving import parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("BYTES = 0-0", (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["items=0-1", "bytes=0-1,5-6", "bytes=abc", "bytes=x-5", "bytes=5-1"])
+def test_ignored_ranges(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=0-1", 0), ("bytes=-1", 0)])
+def test_unsatisfiable_ranges(header, size):
+    with pytest.raises(HTTPException) as raised:
+        parse_range(header, size)
+
+    assert raised.value.status_code == 416
+    assert raised.value.headers["Content-Range"] == f"bytes */{size}"
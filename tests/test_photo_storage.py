@@ -0,0 +1,70 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from indexes import ensure_indexes
+from photo_storage import PhotoBlobStore, StoredUpload
+from storage_backends import LocalStorage
+from tests.helpers import run
+
+SHA = hashlib.sha256(b"photo").hexdigest()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    (tmp_path / "photos").mkdir()
+    (tmp_path / "renditions").mkdir()
+    return LocalStorage(tmp_path)
+
+
+@pytest.fixture
+def store(db, storage, tmp_path):
+    run(ensure_indexes(db))
+    return PhotoBlobStore(db, storage, tmp_path, tombstone_timeout=0.1)
+
+
+def received(tmp_path, name="upload.tmp", data=b"photo"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return StoredUpload(path, len(data), hashlib.sha256(data).hexdigest(), "a.PNG", "image/png")
+
+
+def test_identical_uploads_share_one_blob(store, db, tmp_path):
+    first = run(store.store_upload(received(tmp_path, "one.tmp"), ".PNG"))
+    second = run(store.store_upload(received(tmp_path, "two.tmp"), ".jpg"))
+
+    assert first.filename == second.filename == f"{SHA}.png"
+    assert (tmp_path / "photos" / first.filename).read_bytes() == b"photo"
+    assert not (tmp_path / "two.tmp").exists()
+    blob = run(db.photo_blobs.find_one({"content_hash": SHA}))
+    assert blob["refcount"] == 2
+
+
+def test_last_release_deletes_file_and_renditions(store, db, tmp_path):
+    blob = run(store.store_upload(received(tmp_path), ".png"))
+    run(store.store_upload(received(tmp_path), ".png"))
+    rendition = tmp_path / "renditions" / f"{SHA}-320.webp"
+    rendition.write_bytes(b"small")
+    photo = {"content_hash": SHA, "filename": blob.filename, "renditions": [{"filename": rendition.name}]}
+
+    assert run(store.release(photo)) is False
+    assert (tmp_path / "photos" / blob.filename).exists() and rendition.exists()
+
+    assert run(store.release(photo)) is True
+    assert not (tmp_path / "photos" / blob.filename).exists()
+    assert not rendition.exists()
+    assert run(db.photo_blobs.count_documents({})) == 0
+
+
+def test_acquire_replaces_a_stale_tombstone(store, db):
+    run(db.photo_blobs.insert_one({
+        "content_hash": SHA, "filename": f"{SHA}.png", "size": 5, "refcount": 0,
+        "deleting": datetime.utcnow() - timedelta(minutes=5),
+    }))
+
+    blob = run(store.acquire(SHA, f"{SHA}.jpg", 5))
+
+    assert blob["refcount"] == 1
+    assert blob["filename"] == f"{SHA}.jpg"
+    assert "deleting" not in blob
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+
+from invalidation import ANY, Change
+from realtime import DebateBroadcaster, StreamRefresher
+from tests.helpers import make_debate, run
+
+COUNTERS = ("votes_for", "votes_against", "participant_count")
+
+
+def drain(subscriber):
+    events = []
+    while not subscriber.queue.empty():
+        lines = subscriber.queue.get_nowait().decode().splitlines()
+        fields = dict(line.split(": ", 1) for line in lines if ": " in line)
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_refresher_sends_only_counters_that_moved(db):
+    async def scenario():
+        await db.debates.insert_many([make_debate("d1"), make_debate("d2")])
+        broadcaster = DebateBroadcaster()
+        subscriber = broadcaster.subscribe("d1")
+        refresher = StreamRefresher(db, broadcaster, COUNTERS)
+
+        await refresher.refresh()
+        first = drain(subscriber)
+        await refresher.refresh()
+        unchanged = drain(subscriber)
+        await db.debates.update_one({"id": "d1"}, {"$inc": {"votes_for": 2}})
+        await db.debates.update_one({"id": "d2"}, {"$inc": {"votes_for": 1}})
+        await refresher.refresh()
+        return first, unchanged, drain(subscriber)
+
+    first, unchanged, moved = run(scenario())
+    assert first == [
+        ("tally", {"votes_for": 0, "votes_against": 0, "participant_count": 0}),
+        ("status", {"status": "upcoming"}),
+    ]
+    assert unchanged == []
+    assert moved == [("tally", {"votes_for": 2})]
+
+
+def test_refresher_reads_comments_only_after_another_worker_wrote_some(db):
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1"))
+        broadcaster = DebateBroadcaster()
+        subscriber = broadcaster.subscribe("d1")
+        refresher = StreamRefresher(db, broadcaster, COUNTERS, comment_limit=2)
+        await refresher.refresh()
+        drain(subscriber)
+
+        now = datetime.utcnow()
+        await db.comments.insert_one({"id": "c1", "debate_id": "d1", "content": "x", "author_name": "a", "created_at": now})
+        await db.comments.insert_one({"id": "c2", "debate_id": "d2", "content": "x", "author_name": "a", "created_at": now})
+        await refresher.refresh()
+        unmarked = drain(subscriber)
+        refresher.mark("comments")
+        await refresher.refresh()
+        marked = drain(subscriber)
+
+        await db.comments.insert_many([
+            {"id": f"c{i}", "debate_id": "d1", "content": "x", "author_name": "a", "created_at": now + timedelta(seconds=i)}
+            for i in range(3, 6)
+        ])
+        refresher.mark("comments")
+        await refresher.refresh()
+        return unmarked, marked, drain(subscriber)
+
+    unmarked, marked, flood = run(scenario())
+    assert unmarked == []
+    assert [(event, data["id"]) for event, data in marked] == [("comment", "c1")]
+    assert flood == [("resync", {"debate_id": "d1"})]
+
+
+def test_polled_writes_from_other_workers_do_not_resync_every_stream(server, client):
+    subscriber = server.debate_broadcaster.subscribe("d1")
+    try:
+        server.relay_to_streams(Change("debates", ANY))
+        server.relay_to_streams(Change("comments", ANY))
+        assert drain(subscriber) == []
+        assert server.stream_refresher._comments_pending
+    finally:
+        server.debate_broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,91 @@
+from starlette.requests import Request
+
+from response_cache import ResponseCache
+from tests.helpers import make_debate, run
+
+
+def request(headers=None):
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+def test_matching_if_none_match_is_304(client, db):
+    run(db.debates.insert_one(make_debate("d1")))
+    first = client.get("/api/debates")
+    etag = first.headers["etag"]
+
+    again = client.get("/api/debates", headers={"If-None-Match": etag})
+    weak = client.get("/api/debates", headers={"If-None-Match": f'"other", W/{etag}'})
+    other = client.get("/api/debates", headers={"If-None-Match": '"other"'})
+
+    assert (again.status_code, again.content) == (304, b"")
+    assert again.headers["etag"] == etag
+    assert weak.status_code == 304
+    assert other.status_code == 200 and other.content == first.content
+
+
+def test_votes_and_joins_change_the_listing_etag(client, db):
+    run(db.debates.insert_one(make_debate("d1")))
+    etags = [client.get("/api/debates").headers["etag"]]
+
+    client.post("/api/debates/vote", json={"debate_id": "d1", "voter_name": "ayşe", "vote_type": "for"})
+    voted = client.get("/api/debates", headers={"If-None-Match": etags[-1]})
+    etags.append(voted.headers["etag"])
+    client.post("/api/debates/join", json={"debate_id": "d1", "participant_name": "ayşe"})
+    joined = client.get("/api/debates", headers={"If-None-Match": etags[-1]})
+    etags.append(joined.headers["etag"])
+
+    assert voted.status_code == 200 and voted.json()[0]["votes_for"] == 1
+    assert joined.status_code == 200 and joined.json()[0]["participant_count"] == 1
+    assert len(set(etags)) == 3
+
+
+def test_comments_are_listed_as_soon_as_they_are_posted(client, db):
+    # Comment pages are not in the response cache; a cached /debates body does not change with them
+    run(db.debates.insert_one(make_debate("d1")))
+    assert client.get("/api/comments/d1").json() == []
+    etag = client.get("/api/debates").headers["etag"]
+
+    client.post("/api/comments", json={"debate_id": "d1", "content": "katılıyorum", "author_name": "ali"})
+
+    assert [comment["content"] for comment in client.get("/api/comments/d1").json()] == ["katılıyorum"]
+    assert client.get("/api/debates", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put("debates", cache.version("debates"), key, key.encode(), {})
+    assert cache.get("debates", "a") is not None
+    cache.put("debates", cache.version("debates"), "c", b"c", {})
+
+    assert cache.get("debates", "b") is None
+    assert cache.get("debates", "a").body == b"a"
+    assert cache.get("debates", "c").body == b"c"
+    assert cache.stats()["size"] == 2
+
+
+def test_body_from_a_query_raced_by_a_write_is_not_kept():
+    cache = ResponseCache()
+    version = cache.version("debates")
+    cache.invalidate("debates")
+
+    entry = cache.put("debates", version, "", b"[]", {})
+
+    assert entry.body == b"[]"
+    assert cache.get("debates", "") is None
+
+
+def test_gzipped_copy_has_its_own_etag():
+    cache = ResponseCache(compress_min_bytes=10)
+    entry = cache.put("photos", 0, "", b"[" + b"1," * 100 + b"1]", {})
+
+    plain = entry.respond(request())
+    gzipped = entry.respond(request({"Accept-Encoding": "gzip"}))
+    revalidated = entry.respond(request({"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]}))
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+    assert revalidated.status_code == 304
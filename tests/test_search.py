@@ -0,0 +1,65 @@
+import pytest
+
+from search import build_index, fold, tokenize
+
+DEBATES = [
+    {"id": "title", "title": "İstanbul ulaşımı", "topic": "şehir", "description": "metro ve vapur"},
+    {"id": "description", "title": "Şehir planlaması", "topic": "kentleşme", "description": "istanbul örneği"},
+    {"id": "other", "title": "Eğitimde yapay zekâ", "topic": "okul", "description": "öğrenciler"},
+]
+COMMENTS = [
+    {"id": "c1", "debate_id": "title", "content": "Istanbul trafiği <b>çok</b> yoğun", "author_name": "ali"},
+]
+
+
+@pytest.fixture
+def index():
+    return build_index(DEBATES, COMMENTS)
+
+
+@pytest.mark.parametrize("text, folded", [
+    ("İSTANBUL", "istanbul"),
+    ("Istanbul", "istanbul"),
+    ("IĞDIR", "igdir"),
+    ("Çağrı Şölen Üstün", "cagri solen ustun"),
+])
+def test_fold_is_turkish_and_ascii_insensitive(text, folded):
+    assert fold(text) == folded
+
+
+def test_tokenize_splits_on_punctuation():
+    assert tokenize("Yapay-zekâ, eğitim!") == ["yapay", "zeka", "egitim"]
+
+
+@pytest.mark.parametrize("query", ["İSTANBUL", "istanbul", "Istanbul", "ıstanbul"])
+def test_every_spelling_finds_the_same_documents(index, query):
+    found = index.search(query)
+
+    assert {(r["type"], r["id"]) for r in found["results"]} == {
+        ("debate", "title"), ("debate", "description"), ("comment", "c1"),
+    }
+
+
+def test_title_match_outranks_description_match(index):
+    ids = [r["id"] for r in index.search("istanbul", kind="debate")["results"]]
+
+    assert ids == ["title", "description"]
+
+
+def test_every_term_must_match_and_last_is_a_prefix(index):
+    assert [r["id"] for r in index.search("istanbul ula")["results"]] == ["title"]
+    assert index.search("istanbul okul")["total"] == 0
+    assert index.search("ula istanbul")["total"] == 0
+
+
+def test_highlights_are_escaped_and_marked(index):
+    comment = index.search("trafi", kind="comment")["results"][0]
+
+    assert comment["highlights"]["content"] == "Istanbul <mark>trafiği</mark> &lt;b&gt;çok&lt;/b&gt; yoğun"
+
+
+def test_removing_a_debate_drops_its_comments(index):
+    index.remove_debate("title")
+
+    assert {r["id"] for r in index.search("istanbul")["results"]} == {"description"}
+    assert index.search("ulasim")["total"] == 0
@@ -0,0 +1,93 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import session_cache as session_cache_module
+from session_cache import SessionCache
+from tests.helpers import run
+
+NOW = datetime(2026, 1, 1, 12)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake wall clock (session expiry) and monotonic clock (cache TTL)."""
+    state = {"now": NOW, "monotonic": 1000.0}
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return state["now"]
+
+    monkeypatch.setattr(session_cache_module, "datetime", FakeDatetime)
+    monkeypatch.setattr(time, "monotonic", lambda: state["monotonic"])
+    return state
+
+
+def test_session_expiry_is_honoured_to_the_microsecond(clock):
+    cache = SessionCache(ttl_seconds=60)
+    expires_at = NOW + timedelta(seconds=10)
+    cache.put("t", "user", expires_at, "u1")
+
+    clock["now"] = expires_at - timedelta(microseconds=1)
+    assert cache.get("t") == "user"
+
+    clock["now"] = expires_at
+    assert cache.get("t") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_are_dropped_after_the_cache_ttl(clock):
+    cache = SessionCache(ttl_seconds=60)
+    cache.put("t", "user", NOW + timedelta(days=7), "u1")
+
+    clock["monotonic"] += 59.9
+    assert cache.get("t") == "user"
+
+    clock["monotonic"] += 0.1
+    assert cache.get("t") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = SessionCache(max_entries=2)
+    later = NOW + timedelta(days=1)
+    cache.put("a", "A", later, "u1")
+    cache.put("b", "B", later, "u2")
+    cache.get("a")
+
+    cache.put("c", "C", later, "u3")
+
+    assert [cache.get(token) for token in ("a", "b", "c")] == ["A", None, "C"]
+
+
+def test_invalidate_by_session_id_and_user(clock):
+    cache = SessionCache()
+    later = NOW + timedelta(days=1)
+    cache.put("a", "A", later, "u1", session_id="s1")
+    cache.put("b", "B", later, "u1", session_id="s2")
+    cache.put("c", "C", later, "u2", session_id="s3")
+
+    cache.invalidate_session_id("s1")
+    assert cache.get("a") is None and cache.get("b") == "B"
+
+    cache.invalidate_user("u1")
+    assert cache.get("b") is None and cache.get("c") == "C"
+
+
+def test_logout_on_another_worker_reaches_this_workers_cache(client, server, db):
+    run(db.users.insert_one({"id": "u1", "email": "a@x.com", "name": "A", "session_token": "t",
+                             "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()}))
+    run(db.sessions.insert_one({"session_token": "t", "user_id": "u1",
+                                "expires_at": datetime.utcnow() + timedelta(days=1)}))
+    headers = {"Authorization": "Bearer t"}
+    assert client.get("/api/auth/profile", headers=headers).status_code == 200
+    assert server.session_cache.get("t") is not None
+
+    # What the other worker's logout leaves behind: the session gone and the sessions version bumped
+    run(db.sessions.delete_many({"session_token": "t"}))
+    run(db.cache_versions.update_one({"_id": "sessions"}, {"$inc": {"version": 1}}, upsert=True))
+    client.portal.call(server.invalidation_hub._poll)
+
+    assert server.session_cache.get("t") is None
+    assert client.get("/api/auth/profile", headers=headers).status_code == 401
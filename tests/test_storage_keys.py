@@ -0,0 +1,30 @@
+import hashlib
+
+import pytest
+
+from storage_backends import LocalStorage
+
+SHA = hashlib.sha256(b"photo").hexdigest()
+
+
+def test_local_storage_refuses_keys_outside_its_root(tmp_path):
+    storage = LocalStorage(tmp_path)
+    assert storage.path("photos/a.png") == (tmp_path / "photos" / "a.png").resolve()
+    for key in ("../outside.png", "photos/../../outside.png", "/etc/passwd"):
+        with pytest.raises(ValueError):
+            storage.path(key)
+
+
+def test_check_sha256_accepts_only_hex_digests(server):
+    assert server.check_sha256(SHA.upper()) == SHA
+    for value in ("", SHA[:-1], SHA + "0", "../" + SHA[3:], "g" * 64):
+        with pytest.raises(ValueError):
+            server.check_sha256(value)
+
+
+def test_presign_rejects_a_path_as_sha256(client, admin_headers):
+    response = client.post("/api/photos/presign", headers=admin_headers, json={
+        "filename": "a.png", "content_type": "image/png", "size": 5, "sha256": "../../etc/passwd",
+    })
+
+    assert response.status_code == 422
@@ -0,0 +1,143 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from indexes import ensure_indexes
+from tests.helpers import make_debate, run
+from vote_buffer import VoteBuffer
+
+
+def vote(debate_id, voter_name, vote_type="for"):
+    return {"id": f"{debate_id}-{voter_name}", "debate_id": debate_id, "voter_name": voter_name,
+            "vote_type": vote_type, "created_at": datetime.utcnow()}
+
+
+def test_buffer_flush_counts_each_vote_once(db):
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1"))
+        buffer = VoteBuffer(db)
+        assert buffer.add(vote("d1", "ali"))
+        assert not buffer.add(vote("d1", "ali", "against"))
+        assert buffer.add(vote("d1", "veli", "against"))
+        assert buffer.merge_pending({"id": "d1", "votes_for": 0, "votes_against": 0}) == \
+            {"id": "d1", "votes_for": 1, "votes_against": 1}
+        await buffer.flush()
+        # Nothing left to apply; a second flush must not count again
+        await buffer.flush()
+        return buffer, await db.debates.find_one({"id": "d1"})
+
+    buffer, debate = run(scenario())
+
+    assert (debate["votes_for"], debate["votes_against"]) == (1, 1)
+    assert len(debate["applied_batches"]) == 1
+    assert buffer.pending_delta("d1") == {"votes_for": 0, "votes_against": 0}
+
+
+def test_counter_retry_does_not_double_count(db):
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1"))
+        buffer = VoteBuffer(db)
+        batch = {"b1": {"d1": {"votes_for": 2, "votes_against": 0}}}
+        await buffer._apply_counters({"b1": {"d1": dict(batch["b1"]["d1"])}})
+        # The same batch again, as after a write whose acknowledgement was lost
+        await buffer._apply_counters(batch)
+        return await db.debates.find_one({"id": "d1"})
+
+    assert run(scenario())["votes_for"] == 2
+
+
+def test_replay_recovers_counters_lost_in_a_crash(db, tmp_path):
+    journal = tmp_path / "votes.jsonl"
+
+    async def crash():
+        # A flush inserted the votes, then the process died before the $inc
+        await ensure_indexes(db)
+        await db.debates.insert_one(make_debate("d1"))
+        buffer = VoteBuffer(db, flush_interval=3600, journal_path=journal)
+        await buffer.start()
+        buffer.add(vote("d1", "ali"))
+        buffer.add(vote("d1", "veli"))
+        buffer._rotate_journal()
+        await buffer._insert_votes(list(buffer._pending), "lost-batch")
+        buffer._task.cancel()
+        buffer._journal.close()
+
+    async def restart():
+        buffer = VoteBuffer(db, journal_path=journal)
+        await buffer.start()
+        await buffer.stop()
+        return await db.debates.find_one({"id": "d1"})
+
+    run(crash())
+    assert run(db.debates.find_one({"id": "d1"}))["votes_for"] == 0
+    debate = run(restart())
+
+    assert debate["votes_for"] == 2
+    assert debate["applied_batches"] == ["lost-batch"]
+    assert run(db.votes.count_documents({})) == 2
+    assert not journal.exists() or not journal.read_text().strip()
+    # A later restart with an empty journal changes nothing
+    assert run(restart())["votes_for"] == 2
+
+
+def test_replay_after_applied_flush_is_a_no_op(db, tmp_path):
+    journal = tmp_path / "votes.jsonl"
+    journal.write_text(json.dumps(vote("d1", "ali"), default=str) + "\n")
+
+    async def scenario():
+        await ensure_indexes(db)
+        await db.debates.insert_one(make_debate("d1"))
+        first = VoteBuffer(db)
+        first.add(vote("d1", "ali"))
+        await first.flush()
+        # Same vote still in the journal, e.g. the journal delete never happened
+        buffer = VoteBuffer(db, journal_path=journal)
+        await buffer.start()
+        await buffer.stop()
+        return await db.debates.find_one({"id": "d1"})
+
+    assert run(scenario())["votes_for"] == 1
+
+
+@pytest.fixture
+def buffered_client(server, monkeypatch):
+    monkeypatch.setattr(server, "VOTE_WRITE_BEHIND", True)
+    # Restored to None afterwards, so later tests vote straight to Mongo again
+    monkeypatch.setattr(server, "vote_buffer", None)
+    monkeypatch.setenv("VOTE_FLUSH_INTERVAL_MS", "3600000")
+    with TestClient(server.app) as client:
+        yield client
+
+
+def test_buffered_duplicate_is_rejected_before_and_after_flush(buffered_client, server, db):
+    run(db.debates.insert_one(make_debate("d1")))
+    body = {"debate_id": "d1", "voter_name": "ali", "vote_type": "for"}
+
+    assert buffered_client.post("/api/debates/vote", json=body).status_code == 200
+    assert buffered_client.post("/api/debates/vote", json=body).status_code == 400
+    buffered_client.portal.call(server.vote_buffer.flush)
+    assert buffered_client.post("/api/debates/vote", json=body).status_code == 400
+
+
+def test_vote_flushed_during_the_duplicate_check_is_rejected(buffered_client, server, db, monkeypatch):
+    run(db.debates.insert_one(make_debate("d1")))
+    body = {"debate_id": "d1", "voter_name": "ali", "vote_type": "for"}
+    assert buffered_client.post("/api/debates/vote", json=body).status_code == 200
+
+    collection = type(db.votes)
+    find_one = collection.find_one
+
+    async def find_one_then_flush(self, *args, **kwargs):
+        found = await find_one(self, *args, **kwargs)
+        if self.name == "votes" and server.vote_buffer.has_pending_vote("d1", "ali"):
+            # The pending vote reaches Mongo right after this read missed it
+            await server.vote_buffer.flush()
+        return found
+
+    monkeypatch.setattr(collection, "find_one", find_one_then_flush)
+
+    assert buffered_client.post("/api/debates/vote", json=body).status_code == 400
+    buffered_client.portal.call(server.vote_buffer.flush)
+    assert run(db.debates.find_one({"id": "d1"}))["votes_for"] == 1
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from indexes import dedupe_votes, ensure_indexes
+from tests.helpers import make_debate, run
+
+
+def test_second_vote_by_same_voter_is_rejected(client, db):
+    run(db.debates.insert_one(make_debate("d1")))
+    body = {"debate_id": "d1", "voter_name": "ayşe", "vote_type": "for"}
+
+    first = client.post("/api/debates/vote", json=body)
+    second = client.post("/api/debates/vote", json={**body, "vote_type": "against"})
+
+    assert first.status_code == 200
+    assert first.json()["votes_for"] == 1
+    assert second.status_code == 400
+    assert run(db.votes.count_documents({"debate_id": "d1"})) == 1
+    debate = run(db.debates.find_one({"id": "d1"}))
+    assert (debate["votes_for"], debate["votes_against"]) == (1, 0)
+
+
+def test_vote_on_missing_debate_leaves_no_vote(client, db):
+    response = client.post("/api/debates/vote", json={"debate_id": "nope", "voter_name": "ali", "vote_type": "for"})
+
+    assert response.status_code == 404
+    assert run(db.votes.count_documents({})) == 0
+
+
+def test_dedupe_votes_keeps_earliest_and_recounts(db):
+    now = datetime.utcnow()
+
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1", votes_for=3, votes_against=1))
+        await db.votes.insert_many([
+            {"debate_id": "d1", "voter_name": "ali", "vote_type": "for", "created_at": now},
+            {"debate_id": "d1", "voter_name": "ali", "vote_type": "against", "created_at": now + timedelta(seconds=1)},
+            {"debate_id": "d1", "voter_name": "ali", "vote_type": "against", "created_at": now + timedelta(seconds=2)},
+            {"debate_id": "d1", "voter_name": "veli", "vote_type": "for", "created_at": now},
+        ])
+        removed = await dedupe_votes(db)
+        votes = [v async for v in db.votes.find({"voter_name": "ali"})]
+        return removed, votes, await db.debates.find_one({"id": "d1"})
+
+    removed, votes, debate = run(scenario())
+
+    assert removed == 2
+    assert [v["vote_type"] for v in votes] == ["for"]
+    assert (debate["votes_for"], debate["votes_against"]) == (2, 0)
+
+
+def test_ensure_indexes_dedupes_votes_before_building_the_unique_index(db):
+    async def scenario():
+        await db.debates.insert_one(make_debate("d1"))
+        await db.votes.insert_many([
+            {"debate_id": "d1", "voter_name": "ali", "vote_type": "for", "created_at": datetime.utcnow()},
+            {"debate_id": "d1", "voter_name": "ali", "vote_type": "for", "created_at": datetime.utcnow()},
+        ])
+        await ensure_indexes(db)
+        return await db.votes.count_documents({}), await db.votes.index_information()
+
+    count, indexes = run(scenario())
+
+    assert count == 1
+    assert indexes["debate_voter_unique"]["unique"]